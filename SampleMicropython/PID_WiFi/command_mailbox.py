@@ -0,0 +1,78 @@
+# command_mailbox.py
+import time
+
+DRIVE = 'drive'
+PID = 'pid'
+MODE = 'mode'
+STOP = 'stop'
+
+URGENT_COMMANDS = ('stop', 'emergency')
+
+class CommandMailbox:
+  """Hand commands from the web server to the control loop
+
+  Drive and PID commands are latest-wins: a newer one replaces whatever is
+  still waiting, so a flood of UI requests never builds a backlog of stale
+  input. Mode changes are delivered in order. Stop and emergency commands
+  go through a priority lane that is always read first. A stop discards
+  the drive, PID and mode commands still waiting: they were sent before
+  it, and applied after it a mode change would arm the motors again.
+  """
+  def __init__(self, max_modes=4):
+      self.urgent = None
+      self.drive = None
+      self.pid = None
+      self.modes = []
+      self.max_modes = max_modes
+      self.coalesced = 0
+      self.dropped = 0
+
+  def post(self, kind, value):
+      """Queue a command; called from the web server"""
+      message = (kind, value, time.ticks_ms())
+      if kind == DRIVE and value in URGENT_COMMANDS:
+          self.urgent = (STOP, value, message[2])
+          if self.drive:
+              self.coalesced += 1
+              self.drive = None
+          if self.pid:
+              self.dropped += 1
+              self.pid = None
+          if self.modes:
+              self.dropped += len(self.modes)
+              self.modes = []
+      elif kind == DRIVE:
+          if self.drive:
+              self.coalesced += 1
+          self.drive = message
+      elif kind == PID:
+          if self.pid:
+              self.coalesced += 1
+          self.pid = message
+      elif kind == MODE:
+          if len(self.modes) >= self.max_modes:
+              self.modes.pop(0)
+              self.dropped += 1
+          self.modes.append(message)
+      else:
+          raise ValueError(kind)
+
+  def poll(self):
+      """Return the next (kind, value, posted ms) for the control loop, or None"""
+      message = self.urgent
+      if message:
+          self.urgent = None
+          return message
+      if self.modes:
+          return self.modes.pop(0)
+      message = self.pid
+      if message:
+          self.pid = None
+          return message
+      message = self.drive
+      if message:
+          self.drive = None
+      return message
+
+  def pending(self):
+      return bool(self.urgent or self.modes or self.pid or self.drive)
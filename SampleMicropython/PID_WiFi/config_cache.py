@@ -0,0 +1,52 @@
+# config_cache.py
+import json
+import binascii
+from config import PID, MODES, MOTOR
+
+class ConfigCache:
+  """PID, mode and motor settings serialised once for /config.json
+
+  The JSON body and its ETag are built on first use and reused until
+  invalidate() is called after the settings change.
+  """
+  def __init__(self):
+      self.body = None
+      self.etag = None
+
+  def get(self):
+      """Return (body bytes, etag)"""
+      if self.body is None:
+          self.body = json.dumps({'pid': PID, 'modes': MODES, 'motor': MOTOR}).encode()
+          self.etag = '"%08x"' % (binascii.crc32(self.body) & 0xffffffff)
+      return self.body, self.etag
+
+  def invalidate(self):
+      self.body = None
+      self.etag = None
+
+
+def js_config():
+  """config.js as written by config.write_js_config()"""
+  return ('\n// Auto-generated from config.py\nconst CONFIG = {\n'
+          '  pid: ' + json.dumps(PID) + ',\n'
+          '  modes: ' + json.dumps(MODES) + ',\n'
+          '  motor: ' + json.dumps(MOTOR) + '\n'
+          '};\n')
+
+
+def write_js_config_if_changed(path='config.js'):
+  """Regenerate config.js only when its content would change
+
+  Reading the file back is much cheaper than a flash write on every boot.
+  Returns True if the file was written.
+  """
+  content = js_config()
+  try:
+      with open(path, 'r') as f:
+          if f.read() == content:
+              return False
+  except OSError:
+      pass
+  with open(path, 'w') as f:
+      f.write(content)
+  return True
@@ -1,19 +1,22 @@
 import network
-import neopixel
-import socket
 import gc
+import time
+import log
+from memory_manager import MemoryManager
 from web_server import WebServer
-from machine import Pin
+from command_mailbox import CommandMailbox, DRIVE, PID as PID_KIND, MODE, STOP
+from status_led import StatusLED
+from config_cache import write_js_config_if_changed
 from config import *
 
 
-pin = Pin(16, Pin.OUT)
-np = neopixel.NeoPixel(pin, 1)
+indicator = StatusLED()
 
-# Function to set NeoPixel color
+_log = log.get_logger('robot')
+
+# Function to set NeoPixel color; the main loop writes it with indicator.tick()
 def set_neopixel_color(r, g, b):
-    np[0] = (r, g, b)
-    np.write()
+    indicator.color(r, g, b)
 
 
 
@@ -23,17 +26,31 @@ class NetworkManager:
       self.ssid = NETWORK['ssid']
       self.password = NETWORK['password']
       self.ap = network.WLAN(network.AP_IF)
+      self.up = False
+      self.failed = False
+      self.started = 0
+      self.timeout = NETWORK.get('start_timeout_ms', 5000)
 
   def start_ap(self):
-      """Start Access Point"""
+      """Start Access Point; poll() reports when it is up"""
       self.ap.active(True)
       self.ap.config(essid=self.ssid, 
                     password=self.password,
                     authmode=NETWORK['authmode'])
-      
-      while not self.ap.active():
-          pass
-      
+      self.started = time.ticks_ms()
+      return self.ap
+
+  def poll(self):
+      """Check on the access point without waiting; True once it is up"""
+      if self.up or self.failed:
+          return self.up
+      if not self.ap.active():
+          if time.ticks_diff(time.ticks_ms(), self.started) > self.timeout:
+              _log.error('Access point did not start within %d ms', self.timeout)
+              self.failed = True
+              set_neopixel_color(100, 0, 0)
+          return False
+      self.up = True
       print('\n=== WiFi Access Point Created ===')
       print('To connect to the robot:')
       print(f'1. Connect to WiFi network: "{self.ssid}"')
@@ -41,7 +58,7 @@ class NetworkManager:
       print(f'3. Open browser and go to: http://{self.ap.ifconfig()[0]}')
       print('================================\n')
       set_neopixel_color(0, 0, 50)
-      return self.ap
+      return True
 
 class RobotController:
   def __init__(self):
@@ -65,22 +82,42 @@ class RobotController:
               MOTOR['min_speed']
           )
 
+  def stop(self):
+      """Priority stop: drop to standstill immediately"""
+      self.current_speed = 0
+
+  def apply_commands(self, commands):
+      """Apply whatever is waiting in the mailbox, urgent commands first"""
+      while True:
+          message = commands.poll()
+          if message is None:
+              return
+          kind, value, _ = message
+          if kind == STOP:
+              self.stop()
+          elif kind == DRIVE:
+              self.handle_command(value)
+          elif kind == PID_KIND:
+              self.update_pid(value)
+          elif kind == MODE:
+              self.set_mode(value)
+
   def update_pid(self, new_values):
-      """Update PID values"""
-      print(f"Updating PID values: {new_values}")
+      """Update PID values; this sample has no control loop, it only keeps them"""
+      _log.info('PID update %s', new_values)
       for key in new_values:
           if key in self.pid_values:
               self.pid_values[key] = float(new_values[key])
 
   def set_mode(self, mode):
       """Set operation mode"""
-      print(f"Changing mode to: {mode}")
+      _log.info('Mode change to %s', mode)
       self.current_mode = mode
 
 
 
 def check_system_status():
-  """Print system status for debugging"""
+  """Print system status for debugging; from the REPL, it is not run at boot"""
   import os
   
   print("\n=== System Status ===")
@@ -88,7 +125,9 @@ def check_system_status():
   # Check files
   print("\nFiles on system:")
   files = os.listdir()
-  required_files = ['main.py', 'config.py', 'web_server.py', 'index.html', 'config.js']
+  required_files = ['main.py', 'config.py', 'web_server.py', 'http_server.py', 'log.py', 'index.html', 'config.js',
+                    'command_mailbox.py', 'status_led.py', 'memory_manager.py',
+                    'profile_store.py', 'config_cache.py']
   for file in required_files:
       status = "OK" if file in files else "NOT FOUND"
       print(f"{status} {file}")
@@ -114,63 +153,54 @@ def check_system_status():
 def main():
 
 
-    write_js_config()
-       # Add this to main.py after write_js_config()
-    import os
-    print("\nChecking files:")
-    print(os.listdir())  # This will show all files on ESP32
-
-    # check whether the 'config.js' file is created
-    if 'config.js' in os.listdir():
-        print("config.js file created successfully!")
-    else:
-        print("Error creating config.js file!")
+    # Regenerate config.js only if config.py changed
+    try:
+        if write_js_config_if_changed():
+            print("config.js regenerated")
+    except OSError as e:
+        print("Error writing config.js:", e)
         set_neopixel_color(100, 0, 0)
 
     # Initialize components
     network_manager = NetworkManager()
-    web_server = WebServer()
+    web_server = WebServer(SERVER)
     robot = RobotController()
+    commands = CommandMailbox()
 
-    # Register handlers
-    web_server.register_handler('command', robot.handle_command)
-    web_server.register_handler('pid', robot.update_pid)
-    web_server.register_handler('mode', robot.set_mode)
+    # Register handlers: the server only posts, the loop below applies
+    web_server.register_handler('command', lambda cmd: commands.post(DRIVE, cmd))
+    web_server.register_handler('pid', lambda values: commands.post(PID_KIND, values))
+    web_server.register_handler('mode', lambda mode: commands.post(MODE, mode))
 
-    # Start access point
+    # Start access point; the server runs while it comes up
     network_manager.start_ap()
 
     # Start web server
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(('', SERVER['port']))
-    s.listen(SERVER['max_connections'])
+    web_server.start()
     print('Web server started. Listening for incoming connections...')
+    set_neopixel_color(0, 100, 0)
 
-    # Main server loop
+    memory = MemoryManager()
+
+    # Main server loop: answer whatever clients are ready, then apply commands
     while True:
         try:
-            gc.collect()  # Clean up memory
-            conn, addr = s.accept()
-            print('Client connected from:', addr)
-            request = conn.recv(1024).decode()
-            
-            response = web_server.parse_request(request)
-            conn.send(response.encode('utf-8'))
-            set_neopixel_color(0, 100, 0)
-            conn.close()
-            
+            network_manager.poll()
+            web_server.serve(1 if network_manager.up else 0.1)
+            robot.apply_commands(commands)
+            log.drain()
+            indicator.tick()
+            # Collect only when enough has been allocated, between passes
+            memory.idle()
+
         except Exception as e:
-            print('Error:', e)
+            _log.error('Error: %s', e)
             set_neopixel_color(100, 0, 0)
-            try:
-                conn.close()
-            except:
-                pass
 
 if __name__ == '__main__':
     try:
-        check_system_status()
         main()
     except KeyboardInterrupt:
         print('Server stopped')
-        set_neopixel_color(255, 0, 0)
+        indicator.show('stopped')
+        indicator.flush()
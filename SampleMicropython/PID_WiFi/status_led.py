@@ -0,0 +1,112 @@
+# status_led.py -- one NeoPixel status LED, written only when it changes
+#
+# NeoPixel.write() bit-bangs the pixel data with interrupts disabled, which
+# delays the stepper timers. Callers here only say what the LED should show.
+# tick(), run from the main loop between control ticks or from a slow timer,
+# writes the pixel when the colour differs from what is already lit, no more
+# often than min_interval_ms, and never inside a window the motor code has
+# reserved with defer().
+import time
+from machine import Pin
+
+# State name -> colour
+COLOURS = {
+    'off': (0, 0, 0),
+    'booting': (20, 20, 0),
+    'ap_up': (0, 0, 50),
+    'sta_up': (0, 50, 50),
+    'ready': (0, 100, 0),
+    'error': (100, 0, 0),
+    'failed': (50, 0, 0),
+    'stopped': (255, 0, 0),
+}
+
+
+class StatusLED:
+  """Cached NeoPixel driver with change detection and rate-limited writes"""
+  def __init__(self, pin=16, min_interval_ms=40, colours=COLOURS):
+      self.pin = pin
+      self.colours = colours
+      self.min_interval = min_interval_ms
+      self.np = None
+      self.wanted = (0, 0, 0)
+      self.shown = None
+      self.written_at = time.ticks_add(time.ticks_ms(), -min_interval_ms)
+      self.quiet_until = self.written_at
+      # Blink animation: (colour, half period in ms) or None
+      self.blinking = None
+      self.timer = None
+      self.writes = 0
+      self.skipped = 0
+
+  def driver(self):
+      if self.np is None:
+          import neopixel
+          self.np = neopixel.NeoPixel(Pin(self.pin, Pin.OUT), 1)
+      return self.np
+
+  def show(self, state):
+      """Show a named state steadily"""
+      self.blinking = None
+      self.wanted = self.colours[state]
+
+  def color(self, r, g, b):
+      """Show a colour steadily"""
+      self.blinking = None
+      self.wanted = (r, g, b)
+
+  def blink(self, state, period_ms=1000):
+      """Alternate a named state with off, toggling every half period"""
+      self.blinking = (self.colours[state], period_ms // 2)
+
+  def defer(self, ms, now=None):
+      """Keep the LED from being written for the next ms milliseconds"""
+      until = time.ticks_add(time.ticks_ms() if now is None else now, ms)
+      if time.ticks_diff(until, self.quiet_until) > 0:
+          self.quiet_until = until
+
+  def tick(self, now=None):
+      """Write the LED if it needs changing and may be; True if written"""
+      if now is None:
+          now = time.ticks_ms()
+      wanted = self.wanted
+      if self.blinking:
+          colour, half = self.blinking
+          wanted = colour if (now // half) & 1 == 0 else (0, 0, 0)
+      if wanted == self.shown:
+          return False
+      if (time.ticks_diff(now, self.written_at) < self.min_interval
+              or time.ticks_diff(self.quiet_until, now) > 0):
+          self.skipped += 1
+          return False
+      np = self.driver()
+      np[0] = wanted
+      np.write()
+      self.shown = wanted
+      self.written_at = now
+      self.writes += 1
+      return True
+
+  def flush(self):
+      """Write the wanted colour now, e.g. just before stopping"""
+      self.written_at = time.ticks_add(time.ticks_ms(), -self.min_interval)
+      self.quiet_until = self.written_at
+      return self.tick()
+
+  def start(self, period_ms=50, timer_id=-1):
+      """Tick from a periodic timer, for firmware without a main loop
+
+      The timer callback only schedules tick(), so the write runs as a soft
+      callback rather than in the timer interrupt.
+      """
+      from machine import Timer
+      import micropython
+      tick = self.tick
+      self.timer = Timer(timer_id)
+      self.timer.init(mode=Timer.PERIODIC, period=period_ms,
+                      callback=lambda t: micropython.schedule(lambda _: tick(), None))
+
+  def stop(self):
+      if self.timer:
+          self.timer.deinit()
+          self.timer = None
@@ -3,6 +3,7 @@ import socket
 import ure
 import time
 from config import NETWORK
+from profile_store import ProfileStore
 
 class WiFiManager:
   def __init__(self):
@@ -13,6 +14,7 @@ class WiFiManager:
       self.wlan_ap = network.WLAN(network.AP_IF)
       self.wlan_sta = network.WLAN(network.STA_IF)
       self.server_socket = None
+      self.profiles = None
       
   def init_ap(self):
       """Initialize Access Point"""
@@ -36,25 +38,16 @@ class WiFiManager:
       return self.wlan_ap.ifconfig()[0]  # Return AP IP address
 
   def read_profiles(self):
-      """Read saved WiFi profiles"""
-      try:
-          with open(self.sta_config['profiles_file']) as f:
-              lines = f.readlines()
-          profiles = {}
-          for line in lines:
-              ssid, password = line.strip("\n").split(";")
-              profiles[ssid] = password
-          return profiles
-      except OSError:
-          return {}
+      """Read saved WiFi profiles, from flash on first use only"""
+      if self.profiles is None:
+          self.profiles = ProfileStore(self.sta_config['profiles_file'])
+      return self.profiles
 
   def write_profiles(self, profiles):
-      """Save WiFi profiles"""
-      lines = []
+      """Save WiFi profiles; only changed entries are written"""
+      store = self.read_profiles()
       for ssid, password in profiles.items():
-          lines.append("%s;%s\n" % (ssid, password))
-      with open(self.sta_config['profiles_file'], "w") as f:
-          f.write(''.join(lines))
+          store.set(ssid, password)
 
   def start_web_server(self):
       """Start the configuration web server"""
@@ -74,7 +67,7 @@ def handle_client(self, client_socket):
   """Handle client connections with improved browser compatibility"""
   try:
       # Set timeout for client connection
-      client_socket.settimeout(self.server_config['timeout'])
+      client_socket.settimeout(self.server_config.get('timeout', 5))
 
       # Accumulate the complete request
       request = b""
@@ -1,18 +1,103 @@
 import network
-import socket
-import ure
 import time
+import json
+import log
+from http_server import HTTPServer
+from profile_store import ProfileStore
 
 ap_ssid = "esp32"
 ap_password = "123456789"
 ap_authmode = 3  # WPA2
 
 NETWORK_PROFILES = 'wifi.dat'
+# SSID, BSSID, channel and IP lease of the last network we joined
+LAST_CONNECTION = 'wifi_last.json'
+# Reconnect with the recorded address instead of asking DHCP again
+REUSE_LEASE = False
+
+# How long the radio may keep reconnecting on its own after boot
+AUTO_CONNECT_MS = 3000
+CONNECT_TIMEOUT_MS = 20000
 
 wlan_ap = network.WLAN(network.AP_IF)
 wlan_sta = network.WLAN(network.STA_IF)
 
-server_socket = None
+server = None
+profiles = None
+
+# Cached scan, refreshed by poll_scan() from the serve loop. WLAN.scan()
+# blocks for about 2 s and the ESP32 port has no asynchronous or one-channel
+# scan, so nothing is served while it runs. Requests therefore never scan:
+# poll_scan() does, every SCAN_INTERVAL_MS or when GET /scan asked for one,
+# and only with no connection open and no request for SCAN_QUIET_MS. A
+# browser that connects during a scan still waits for the rest of it.
+SCAN_INTERVAL_MS = 30000
+SCAN_QUIET_MS = 2000
+scanned = []
+page = None
+last_scan = 0
+rescan = False
+last_request = None
+
+# Provisioning page, split around the per-network rows. It is built once
+# per scan, so a page load is one cached write and never waits for a scan.
+PAGE_HEAD = """\
+        <html>
+            <h1 style="color: #5e9ca0; text-align: center;">
+                <span style="color: #ff0000;">
+                    Wi-Fi Client Setup
+                </span>
+            </h1>
+            <form action="configure" method="post">
+                <table style="margin-left: auto; margin-right: auto;">
+                    <tbody>
+"""
+
+PAGE_ROW = """\
+                        <tr>
+                            <td colspan="2">
+                                <input type="radio" name="ssid" value="{0}" />{0}
+                            </td>
+                        </tr>
+"""
+
+PAGE_TAIL = """\
+                        <tr>
+                            <td>Password:</td>
+                            <td><input name="password" type="password" /></td>
+                        </tr>
+                    </tbody>
+                </table>
+                <p style="text-align: center;">
+                    <input type="submit" value="Submit" />
+                    <a href="scan">Rescan</a>
+                </p>
+            </form>
+            <p>&nbsp;</p>
+            <hr />
+            <h5>
+                <span style="color: #ff0000;">
+                    Your ssid and password information will be saved into the
+                    "%(filename)s" file in your ESP module for future usage.
+                    Be careful about security!
+                </span>
+            </h5>
+            <hr />
+            <h2 style="color: #2e6c80;">
+                Some useful infos:
+            </h2>
+            <ul>
+                <li>
+                    Original code from <a href="https://github.com/cpopp/MicroPythonSamples"
+                        target="_blank" rel="noopener">cpopp/MicroPythonSamples</a>.
+                </li>
+                <li>
+                    This code available at <a href="https://github.com/tayfunulu/WiFiManager"
+                        target="_blank" rel="noopener">tayfunulu/WiFiManager</a>.
+                </li>
+            </ul>
+        </html>
+""" % dict(filename=NETWORK_PROFILES)
 
 
 def get_connection():
@@ -24,16 +109,19 @@ def get_connection():
 
     connected = False
     try:
-        # ESP connecting to WiFi takes time, wait a bit and try again:
-        time.sleep(3)
-        if wlan_sta.isconnected():
+        # The radio may still be rejoining on its own; wait only while it is
+        wlan_sta.active(True)
+        if wait_connected(AUTO_CONNECT_MS, network.STAT_CONNECTING):
             return wlan_sta
 
         # Read known network profiles from file
         profiles = read_profiles()
 
+        # Go straight back to the last network that worked, without a scan
+        if reconnect_last(profiles):
+            return wlan_sta
+
         # Search WiFis in range
-        wlan_sta.active(True)
         networks = wlan_sta.scan()
 
         AUTHMODE = {0: "open", 1: "WEP", 2: "WPA-PSK", 3: "WPA2-PSK", 4: "WPA/WPA2-PSK"}
@@ -44,12 +132,13 @@ def get_connection():
             if encrypted:
                 if ssid in profiles:
                     password = profiles[ssid]
-                    connected = do_connect(ssid, password)
+                    connected = do_connect(ssid, password, bssid)
                 else:
                     print("skipping unknown encrypted network")
             else:  # open
-                connected = do_connect(ssid, None)
+                connected = do_connect(ssid, None, bssid)
             if connected:
+                write_last(ssid, bssid, channel, not encrypted)
                 break
 
     except OSError as e:
@@ -63,35 +152,89 @@ def get_connection():
 
 
 def read_profiles():
-    with open(NETWORK_PROFILES) as f:
-        lines = f.readlines()
-    profiles = {}
-    for line in lines:
-        ssid, password = line.strip("\n").split(";")
-        profiles[ssid] = password
+    """Saved networks, read from flash on first use and kept in memory"""
+    global profiles
+    if profiles is None:
+        profiles = ProfileStore(NETWORK_PROFILES)
     return profiles
 
 
-def write_profiles(profiles):
-    lines = []
-    for ssid, password in profiles.items():
-        lines.append("%s;%s\n" % (ssid, password))
-    with open(NETWORK_PROFILES, "w") as f:
-        f.write(''.join(lines))
+def write_profiles(saved):
+    """Save every ssid -> password in saved; only changes reach the file"""
+    store = read_profiles()
+    for ssid, password in saved.items():
+        store.set(ssid, password)
 
 
-def do_connect(ssid, password):
+def read_last():
+    """The last network joined, or None"""
+    try:
+        with open(LAST_CONNECTION) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_last(ssid, bssid=None, channel=None, open_network=False):
+    last = {
+        'ssid': ssid,
+        'open': open_network,
+        'bssid': bssid.hex() if bssid else None,
+        'channel': channel,
+        'lease': wlan_sta.ifconfig(),
+    }
+    try:
+        with open(LAST_CONNECTION, 'w') as f:
+            json.dump(last, f)
+    except OSError as e:
+        print("could not record connection:", e)
+
+
+def forget_last():
+    import os
+    try:
+        os.remove(LAST_CONNECTION)
+    except OSError:
+        pass
+
+
+def reconnect_last(profiles):
+    """Join the recorded network directly; forgets it if that fails"""
+    last = read_last()
+    if not last or not (last['ssid'] in profiles or last.get('open')):
+        return False
+    if REUSE_LEASE and last.get('lease'):
+        wlan_sta.ifconfig(tuple(last['lease']))
+    bssid = bytes.fromhex(last['bssid']) if last.get('bssid') else None
+    if do_connect(last['ssid'], profiles.get(last['ssid']) or None, bssid):
+        return True
+    print("last network unavailable, scanning")
+    forget_last()
+    return False
+
+
+def wait_connected(timeout_ms, *pending):
+    """Wait while the station status is one of pending; True once connected"""
+    deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+    while True:
+        status = wlan_sta.status()
+        if status == network.STAT_GOT_IP:
+            return True
+        if status not in pending or time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+            return False
+        time.sleep_ms(20)
+
+
+def do_connect(ssid, password, bssid=None):
     wlan_sta.active(True)
     if wlan_sta.isconnected():
         return None
     print('Trying to connect to %s...' % ssid)
-    wlan_sta.connect(ssid, password)
-    for retry in range(200):
-        connected = wlan_sta.isconnected()
-        if connected:
-            break
-        time.sleep(0.1)
-        print('.', end='')
+    wlan_sta.connect(ssid, password, bssid=bssid)
+    # Returns as soon as the radio reports success or a definite failure
+    connected = wait_connected(CONNECT_TIMEOUT_MS, network.STAT_CONNECTING, network.STAT_IDLE)
+    if not connected:
+        wlan_sta.disconnect()
     if connected:
         print('\nConnected. Network config: ', wlan_sta.ifconfig())
         
@@ -100,101 +243,93 @@ def do_connect(ssid, password):
     return connected
 
 
-def send_header(client, status_code=200, content_length=None ):
-    client.sendall("HTTP/1.0 {} OK\r\n".format(status_code))
-    client.sendall("Content-Type: text/html\r\n")
-    if content_length is not None:
-      client.sendall("Content-Length: {}\r\n".format(content_length))
-    client.sendall("\r\n")
+# Answer to GET /scan, and to / before the first scan: the browser comes
+# back once the scan has had time to run
+SCANNING = b"""\
+<html>
+    <head><meta http-equiv="refresh" content="5;url=/"></head>
+    <h1 style="color: #5e9ca0; text-align: center;">Scanning for networks...</h1>
+</html>
+"""
+
 
+def escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
 
-def send_response(client, payload, status_code=200):
-    content_length = len(payload)
-    send_header(client, status_code, content_length)
-    if content_length > 0:
-        client.sendall(payload)
-    client.close()
 
+def scan_networks():
+    """Scan now and rebuild the cached SSID list and page
 
-def handle_root(client):
+    The list holds one (ssid, rssi, authmode) per network name, from its
+    strongest access point, strongest first; hidden networks are left out.
+    """
+    global scanned, page, last_scan
     wlan_sta.active(True)
-    ssids = sorted(ssid.decode('utf-8') for ssid, *_ in wlan_sta.scan())
-    send_header(client)
-    client.sendall("""\
-        <html>
-            <h1 style="color: #5e9ca0; text-align: center;">
-                <span style="color: #ff0000;">
-                    Wi-Fi Client Setup
-                </span>
-            </h1>
-            <form action="configure" method="post">
-                <table style="margin-left: auto; margin-right: auto;">
-                    <tbody>
-    """)
-    while len(ssids):
-        ssid = ssids.pop(0)
-        client.sendall("""\
-                        <tr>
-                            <td colspan="2">
-                                <input type="radio" name="ssid" value="{0}" />{0}
-                            </td>
-                        </tr>
-        """.format(ssid))
-    client.sendall("""\
-                        <tr>
-                            <td>Password:</td>
-                            <td><input name="password" type="password" /></td>
-                        </tr>
-                    </tbody>
-                </table>
-                <p style="text-align: center;">
-                    <input type="submit" value="Submit" />
-                </p>
-            </form>
-            <p>&nbsp;</p>
-            <hr />
-            <h5>
-                <span style="color: #ff0000;">
-                    Your ssid and password information will be saved into the
-                    "%(filename)s" file in your ESP module for future usage.
-                    Be careful about security!
-                </span>
-            </h5>
-            <hr />
-            <h2 style="color: #2e6c80;">
-                Some useful infos:
-            </h2>
-            <ul>
-                <li>
-                    Original code from <a href="https://github.com/cpopp/MicroPythonSamples"
-                        target="_blank" rel="noopener">cpopp/MicroPythonSamples</a>.
-                </li>
-                <li>
-                    This code available at <a href="https://github.com/tayfunulu/WiFiManager"
-                        target="_blank" rel="noopener">tayfunulu/WiFiManager</a>.
-                </li>
-            </ul>
-        </html>
-    """ % dict(filename=NETWORK_PROFILES))
-    client.close()
+    strongest = {}
+    for ssid, bssid, channel, rssi, authmode, hidden in wlan_sta.scan():
+        ssid = ssid.decode('utf-8')
+        if ssid and (ssid not in strongest or rssi > strongest[ssid][1]):
+            strongest[ssid] = (ssid, rssi, authmode)
+    scanned = sorted(strongest.values(), key=lambda n: n[1], reverse=True)
+    page = ''.join([PAGE_HEAD] + [PAGE_ROW.format(escape(n[0])) for n in scanned] + [PAGE_TAIL]).encode()
+    last_scan = time.ticks_ms()
+    return scanned
+
+
+def poll_scan():
+    """Scan from the serve loop when one is due and the server has gone quiet"""
+    global last_scan, rescan
+    now = time.ticks_ms()
+    if page is not None and not rescan and time.ticks_diff(now, last_scan) < SCAN_INTERVAL_MS:
+        return
+    if server and server.connections:
+        return
+    if last_request is not None and time.ticks_diff(now, last_request) < SCAN_QUIET_MS:
+        return
+    rescan = False
+    try:
+        scan_networks()
+    except OSError as e:
+        print("scan failed:", e)
+        last_scan = time.ticks_ms()
+
+
+def scanning(client):
+    """Ask for a scan and tell the browser to come back; closes the connection"""
+    global rescan
+    rescan = True
+    # A kept-alive connection would hold poll_scan() off
+    server.keep_alive = False
+    server.send_response(client, 200, SCANNING, "text/html")
+
+
+def handle_root(client, request):
+    global last_request
+    last_request = time.ticks_ms()
+    if page is None:
+        scanning(client)
+    else:
+        server.send_response(client, 200, page, "text/html")
+
+
+def handle_scan(client, request):
+    """Explicit refresh: the scan runs once the server is quiet"""
+    global last_request
+    last_request = time.ticks_ms()
+    scanning(client)
 
 
 def handle_configure(client, request):
-    match = ure.search("ssid=([^&]*)&password=(.*)", request)
+    form = request.form()
+    ssid = form.get("ssid")
+    password = form.get("password", "")
 
-    if match is None:
-        send_response(client, "Parameters not found", status_code=400)
+    if ssid is None:
+        server.send_response(client, 400, "Parameters not found")
         return False
-    # version 1.9 compatibility
-    try:
-        ssid = match.group(1).decode("utf-8").replace("%3F", "?").replace("%21", "!")
-        password = match.group(2).decode("utf-8").replace("%3F", "?").replace("%21", "!")
-    except Exception:
-        ssid = match.group(1).replace("%3F", "?").replace("%21", "!")
-        password = match.group(2).replace("%3F", "?").replace("%21", "!")
 
     if len(ssid) == 0:
-        send_response(client, "SSID must be provided", status_code=400)
+        server.send_response(client, 400, "SSID must be provided")
         return False
 
     if do_connect(ssid, password):
@@ -211,15 +346,11 @@ def handle_configure(client, request):
                 </center>
             </html>
         """ % dict(ssid=ssid)
-        send_response(client, response)
+        server.send_response(client, 200, response, "text/html")
         time.sleep(1)
         wlan_ap.active(False)
-        try:
-            profiles = read_profiles()
-        except OSError:
-            profiles = {}
-        profiles[ssid] = password
-        write_profiles(profiles)
+        read_profiles().set(ssid, password)
+        write_last(ssid)
 
         time.sleep(5)
 
@@ -240,26 +371,20 @@ def handle_configure(client, request):
                 </center>
             </html>
         """ % dict(ssid=ssid)
-        send_response(client, response)
+        server.send_response(client, 200, response, "text/html")
         return False
 
 
-def handle_not_found(client, url):
-    send_response(client, "Path not found: {}".format(url), status_code=404)
-
-
 def stop():
-    global server_socket
+    global server
 
-    if server_socket:
-        server_socket.close()
-        server_socket = None
+    if server:
+        server.stop()
+        server = None
 
 
 def start(port=80):
-    global server_socket
-
-    addr = socket.getaddrinfo('0.0.0.0', port)[0][-1]
+    global server
 
     stop()
 
@@ -268,55 +393,24 @@ def start(port=80):
 
     wlan_ap.config(essid=ap_ssid, password=ap_password, authmode=ap_authmode)
 
-    server_socket = socket.socket()
-    server_socket.bind(addr)
-    server_socket.listen(1)
+    server = HTTPServer({'port': port, 'timeout': 5.0})
+    server.route('GET', '', handle_root)
+    server.route('GET', 'scan', handle_scan)
+    server.route('POST', 'configure', handle_configure)
+    server.start()
 
     print('Connect to WiFi ssid ' + ap_ssid + ', default password: ' + ap_password)
     print('and access the ESP via your favorite web browser at 192.168.4.1.')
-    print('Listening on:', addr)
+
+    # First scan now, so the first page load does not wait for one
+    poll_scan()
 
     while True:
         if wlan_sta.isconnected():
             wlan_ap.active(False)
+            stop()
             return True
 
-        client, addr = server_socket.accept()
-        print('client connected from', addr)
-        try:
-            client.settimeout(5.0)
-
-            request = b""
-            try:
-                while "\r\n\r\n" not in request:
-                    request += client.recv(512)
-            except OSError:
-                pass
-
-            # Handle form data from Safari on macOS and iOS; it sends \r\n\r\nssid=<ssid>&password=<password>
-            try:
-                request += client.recv(1024)
-                print("Received form data after \\r\\n\\r\\n(i.e. from Safari on macOS or iOS)")
-            except OSError:
-                pass
-
-            print("Request is: {}".format(request))
-            if "HTTP" not in request:  # skip invalid requests
-                continue
-
-            # version 1.9 compatibility
-            try:
-                url = ure.search("(?:GET|POST) /(.*?)(?:\\?.*?)? HTTP", request).group(1).decode("utf-8").rstrip("/")
-            except Exception:
-                url = ure.search("(?:GET|POST) /(.*?)(?:\\?.*?)? HTTP", request).group(1).rstrip("/")
-            print("URL is {}".format(url))
-
-            if url == "":
-                handle_root(client)
-            elif url == "configure":
-                handle_configure(client, request)
-            else:
-                handle_not_found(client, url)
-
-        finally:
-            client.close()
\ No newline at end of file
+        server.serve()
+        poll_scan()
+        log.drain()
@@ -0,0 +1,586 @@
+# http_server.py -- HTTP core shared by every web server in this repo
+#
+# src/ and the PID_WiFi, wifimanager and WIFI_Connection samples each keep an
+# identical copy of this file next to their main.py, since each directory is
+# flashed on its own. Edit src/http_server.py and copy it over; the host
+# conformance script checks that the copies match.
+import socket
+import select
+import time
+import log
+
+try:
+  import metrics
+except ImportError:
+  metrics = None
+
+_log = log.get_logger('http')
+
+HEX = "0123456789abcdef"
+
+REASONS = {
+    200: "OK",
+    204: "No Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+RETRY_AFTER = b"Retry-After: 1\r\n"
+BUSY = (b"HTTP/1.1 503 Service Unavailable\r\n" + RETRY_AFTER +
+        b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+THROTTLED = (b"HTTP/1.1 429 Too Many Requests\r\n" + RETRY_AFTER +
+             b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+
+# Encoded status line, Content-Type and Connection headers, up to the value of
+# Content-Length, keyed by (status, content type, keep-alive). Only a handful
+# of combinations exist, so each is built once and reused.
+HEADS = {}
+
+
+def response_head(status, content_type, keep_alive):
+  """Return the cached start of a response, building it on first use"""
+  key = (status, content_type, keep_alive)
+  head = HEADS.get(key)
+  if head is None:
+      head = (f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}\r\n"
+              f"Content-Type: {content_type}\r\n"
+              f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+              "Content-Length: ").encode()
+      HEADS[key] = head
+  return head
+
+
+def unquote(value):
+  """Decode %XX escapes and '+' in a query string component"""
+  if "%" not in value and "+" not in value:
+      return value
+  value = value.replace("+", " ")
+  parts = value.split("%")
+  out = bytearray(parts[0].encode())
+  for part in parts[1:]:
+      hi = HEX.find(part[:1].lower())
+      lo = HEX.find(part[1:2].lower())
+      if hi < 0 or lo < 0:
+          out.extend(b"%" + part.encode())
+      else:
+          out.append(hi * 16 + lo)
+          out.extend(part[2:].encode())
+  return out.decode()
+
+
+def parse_query(query):
+  """Decode a query string into a dict, once per request"""
+  params = {}
+  if query:
+      # UI queries have no escapes: one check instead of one per component
+      plain = "%" not in query and "+" not in query
+      for pair in query.split("&"):
+          key, _, value = pair.partition("=")
+          if plain:
+              params[key] = value
+          else:
+              params[unquote(key)] = unquote(value)
+  return params
+
+
+class Request:
+  """A parsed HTTP request
+
+  Parsing only splits the request line. The query string is decoded, and
+  the header block and body sliced out of the raw bytes, when first used.
+  """
+  _query = None
+  _lower = None
+  _header_end = None
+
+  def __init__(self, method, path, query, version, raw, line_end):
+      self.method = method
+      self.path = path
+      self.query_string = query
+      self.version = version
+      self.raw = raw
+      self.line_end = line_end
+
+  @property
+  def query(self):
+      """The query parameters as a dict"""
+      if self._query is None:
+          self._query = parse_query(self.query_string)
+      return self._query
+
+  def header_end(self):
+      if self._header_end is None:
+          end = self.raw.find(b"\r\n\r\n", self.line_end)
+          self._header_end = len(self.raw) if end < 0 else end
+      return self._header_end
+
+  @property
+  def headers(self):
+      """The header block, starting with the CRLF that ends the request line"""
+      return self.raw[self.line_end:self.header_end()]
+
+  @property
+  def body(self):
+      return self.raw[self.header_end() + 4:]
+
+  def header(self, name, default=None):
+      """Return the value of a header, name given in lower case"""
+      if self._lower is None:
+          self._lower = self.headers.lower()
+      key = b"\r\n" + name.encode() + b":"
+      start = self._lower.find(key)
+      if start < 0:
+          return default
+      start += len(key)
+      end = self._lower.find(b"\r\n", start)
+      if end < 0:
+          end = len(self._lower)
+      return self.raw[self.line_end + start:self.line_end + end].decode().strip()
+
+  def form(self):
+      """Decode an application/x-www-form-urlencoded body"""
+      return parse_query(self.body.decode())
+
+
+def parse_request(raw):
+  """Split the request line of one complete request into method, path and query
+
+  One split of the decoded line does the scanning in C; nothing past the
+  request line is looked at here. Returns None for anything that is not an
+  HTTP request line.
+  """
+  line_end = raw.find(b"\r\n")
+  if line_end < 0:
+      return None
+  try:
+      method, target, version = raw[:line_end].decode().split(" ")
+  except (ValueError, UnicodeError):
+      return None
+  if not target.startswith("/") or not version.startswith("HTTP/"):
+      return None
+  path, sep, query = target[1:].partition("?")
+  if path.endswith("/"):
+      path = path.rstrip("/")
+  return Request(method, path, query if sep else None, version, raw, line_end)
+
+
+def request_size(request):
+  """Return the length of the first request in the buffer once its headers
+  are in, counting the body Content-Length declares, or 0 before that
+
+  The request is complete once the buffer holds that many bytes, which also
+  covers browsers (Safari) that send a form body in a separate segment.
+  Knowing the size from the headers lets an oversized request be turned
+  away before its body arrives. Raises ValueError if Content-Length is not
+  a non-negative integer.
+  """
+  header_end = request.find(b"\r\n\r\n")
+  if header_end < 0:
+      return 0
+  end = header_end + 4
+  headers = request[:header_end].lower()
+  start = headers.find(b"\r\ncontent-length:")
+  if start >= 0:
+      start += 17
+      stop = headers.find(b"\r\n", start)
+      value = (headers[start:] if stop < 0 else headers[start:stop]).strip()
+      if not value.isdigit():
+          raise ValueError("Content-Length")
+      end += int(value)
+  return end
+
+
+class HTTPServer:
+  """Non-blocking HTTP/1.1 server: routing, keep-alive and backpressure
+
+  One select() loop serves every connection, so a slow client never blocks
+  the rest. Handlers are registered with route() and called as
+  handler(client, request); they answer with send_response(). A handler
+  that takes the socket over (an event stream) removes it from
+  self.connections and the server leaves it open.
+  """
+  def __init__(self, config):
+      self.config = config
+      self.server_socket = None
+      self.routes = {}
+      self.paths = set()
+
+      # Open client sockets -> [pending bytes, last activity ms, requests served,
+      #                         ms the pending request started or None, client ip]
+      self.connections = {}
+      self.keep_alive_timeout = config.get('keep_alive_timeout', 5)
+      self.max_keep_alive = config.get('max_keep_alive', 3)
+      self.max_requests = config.get('max_requests_per_connection', 100)
+      self.keep_alive = False
+
+      # Backpressure: connections beyond max_connections, or beyond max_per_ip
+      # from one address, get a fast 503; a request must arrive complete within
+      # read_deadline_ms; each client ip gets a token bucket of rate_limit
+      # new connections/s with rate_burst spare. Requests on a kept-alive
+      # connection are not charged: max_requests_per_connection bounds them,
+      # and a page with its sliders and buttons stays on a few connections
+      self.backlog = config.get('backlog', 4)
+      self.max_connections = config.get('max_connections', 8)
+      self.max_per_ip = config.get('max_per_ip', 4)
+      self.read_deadline = config.get('read_deadline_ms', 2000)
+      self.max_request_size = config.get('max_request_size', 4096)
+      self.rate_limit = config.get('rate_limit', 20)
+      self.rate_burst = config.get('rate_burst', 100)
+      self.buckets = {}
+
+      # Responses are assembled here and sent with one write
+      self.out = bytearray(config.get('response_buffer', 1024))
+      self.out_view = memoryview(self.out)
+
+  def route(self, method, path, handler):
+      """Register handler(client, request) for a method and path
+
+      The path is one segment: /path/more is routed to it too, with the
+      whole path in request.path, when no route matches it exactly.
+      """
+      self.routes[(method, path)] = handler
+      self.paths.add(path)
+
+  def start(self):
+      """Start the web server"""
+      addr = socket.getaddrinfo('0.0.0.0', self.config['port'])[0][-1]
+
+      if self.server_socket:
+          self.server_socket.close()
+
+      self.server_socket = socket.socket()
+      self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+      self.server_socket.bind(addr)
+      self.server_socket.listen(self.backlog)
+
+      _log.info('Web server started on port %d', self.config['port'])
+      return self.server_socket
+
+  def sockets(self):
+      """Sockets serve() waits on"""
+      sockets = [self.server_socket]
+      sockets.extend(self.connections)
+      return sockets
+
+  def serve(self, timeout=1):
+      """Wait up to timeout seconds for new clients or kept-alive requests"""
+      try:
+          readable, _, _ = select.select(self.sockets(), [], [], timeout)
+      except OSError as e:
+          _log.error('Select error: %s', e)
+          readable = ()
+
+      for sock in readable:
+          if sock is self.server_socket:
+              self.accept_client()
+          elif sock in self.connections:
+              self.handle_request(sock)
+          else:
+              self.readable(sock)
+
+      self.expire_connections()
+
+  def readable(self, sock):
+      """Called for a readable socket added by a subclass in sockets()"""
+      pass
+
+  def accept_client(self):
+      """Accept a connection, or turn it away at once when the server is full"""
+      client, addr = self.server_socket.accept()
+      if __debug__ and _log.enabled(log.DEBUG):
+          _log.debug('Client connected from %s', addr)
+      per_ip = {}
+      for state in self.connections.values():
+          per_ip[state[4]] = per_ip.get(state[4], 0) + 1
+      if (per_ip.get(addr[0], 0) >= self.max_per_ip or
+              len(self.connections) >= self.max_connections and not self.evict(addr[0], per_ip)):
+          self.turn_away(client, BUSY)
+          return
+      if not self.allow(addr[0]):
+          self.turn_away(client, THROTTLED)
+          return
+      # Only ever read after select() reports data, so the timeout bounds writes
+      client.settimeout(self.config.get('timeout', 5))
+      now = time.ticks_ms()
+      self.connections[client] = [b"", now, 0, now, addr[0]]
+
+  def turn_away(self, client, response):
+      """Answer a new connection with a canned refusal and close it"""
+      if metrics:
+          metrics.rejected.inc()
+      try:
+          client.settimeout(0.1)
+          client.sendall(response)
+      except OSError:
+          pass
+      client.close()
+
+  def evict(self, ip, per_ip):
+      """Make room for a client from ip when every slot is taken
+
+      The longest idle kept-alive connection goes first; failing that, the
+      oldest connection of whichever other address holds the most slots,
+      so one busy client cannot lock everyone else out.
+      """
+      busiest = None
+      for other, count in per_ip.items():
+          if other != ip and count > 1 and (busiest is None or count > per_ip[busiest]):
+              busiest = other
+      victim = None
+      for sock, state in self.connections.items():
+          if state[3] is None:
+              rank = 0
+          elif state[4] == busiest:
+              rank = 1
+          else:
+              continue
+          if victim is None or rank < victim[0] or (
+                  rank == victim[0] and time.ticks_diff(victim[1], state[1]) > 0):
+              victim = (rank, state[1], sock)
+      if victim is None:
+          return False
+      self.close_connection(victim[2])
+      return True
+
+  def expire_connections(self):
+      """Close slow requests and kept-alive sockets that have been idle too long"""
+      now = time.ticks_ms()
+      limit = self.keep_alive_timeout * 1000
+      for sock, state in list(self.connections.items()):
+          if state[3] is not None:
+              if time.ticks_diff(now, state[3]) > self.read_deadline:
+                  _log.info('Timeout waiting for complete request from %s', state[4])
+                  self.keep_alive = False
+                  self.send_error_response(sock, 408, "Request timeout")
+                  self.close_connection(sock)
+          elif time.ticks_diff(now, state[1]) > limit:
+              self.close_connection(sock)
+
+  def close_connection(self, client_socket):
+      """Forget and close a client socket"""
+      self.connections.pop(client_socket, None)
+      try:
+          client_socket.close()
+      except:
+          pass
+
+  def allow(self, ip):
+      """Take a token from the client's bucket for a new connection; False when empty"""
+      now = time.ticks_ms()
+      bucket = self.buckets.get(ip)
+      if bucket is None:
+          if len(self.buckets) >= 16:
+              self.buckets.clear()
+          bucket = self.buckets[ip] = [self.rate_burst, now]
+      else:
+          elapsed = time.ticks_diff(now, bucket[1])
+          bucket[0] = min(self.rate_burst, bucket[0] + elapsed * self.rate_limit / 1000)
+          bucket[1] = now
+      if bucket[0] < 1:
+          return False
+      bucket[0] -= 1
+      return True
+
+  def handle_request(self, client_socket):
+      """Read what has arrived and answer every complete request in it"""
+      state = self.connections[client_socket]
+      keep_open = True
+      try:
+          try:
+              data = client_socket.recv(1024)
+          except OSError:
+              data = b""
+          if not data:
+              keep_open = False
+              return
+
+          request = state[0] + data
+          now = time.ticks_ms()
+          state[1] = now
+          if state[3] is None:
+              state[3] = now
+
+          # Pipelined requests are answered in the order they arrived
+          while True:
+              try:
+                  end = request_size(request)
+              except ValueError:
+                  self.keep_alive = False
+                  self.send_response(client_socket, 400, b"Invalid Content-Length")
+                  keep_open = False
+                  return
+              # Headers that do not end, or declare a body, over the limit
+              if end > self.max_request_size or not end and len(request) > self.max_request_size:
+                  self.keep_alive = False
+                  self.send_response(client_socket, 413, b"Request too large")
+                  keep_open = False
+                  return
+              if not end or len(request) < end:
+                  break
+              state[2] += 1
+              start = time.ticks_us()
+              keep_open = self.process_request(client_socket, request[:end], state[2])
+              if metrics:
+                  metrics.requests_total.inc()
+                  metrics.request_time.observe(time.ticks_diff(time.ticks_us(), start))
+              request = request[end:]
+              if client_socket not in self.connections:
+                  # The handler took the socket over
+                  keep_open = True
+                  return
+              if not keep_open:
+                  return
+
+          state[0] = request
+          state[3] = time.ticks_ms() if request else None
+
+      except Exception as e:
+          _log.error('Error handling request: %s', e)
+          self.keep_alive = False
+          self.send_error_response(client_socket, 500, f"Internal error: {str(e)}")
+          keep_open = False
+      finally:
+          if not keep_open:
+              self.close_connection(client_socket)
+
+  def wants_keep_alive(self, request, served):
+      """Decide whether the connection stays open after this request"""
+      if served >= self.max_requests:
+          return False
+      if served == 1:
+          # Connections that already answered a request, not counting this one
+          kept = -1
+          for state in self.connections.values():
+              if state[2]:
+                  kept += 1
+          if kept >= self.max_keep_alive:
+              return False
+      connection = (request.header('connection') or '').lower()
+      if connection == 'close':
+          return False
+      if request.version == 'HTTP/1.0':
+          return connection == 'keep-alive'
+      return True
+
+  def process_request(self, client_socket, raw, served):
+      """Route a single request; return True if the connection stays open"""
+      if __debug__ and _log.enabled(log.DEBUG):
+          _log.debug('Request %s', raw[:100])
+
+      request = parse_request(raw)
+      if request is None:
+          _log.info('Malformed request line')
+          self.keep_alive = False
+          self.send_response(client_socket, 400, b"Malformed request line")
+          return False
+
+      self.keep_alive = self.wants_keep_alive(request, served)
+
+      path = request.path
+      handler = self.routes.get((request.method, path))
+      slash = path.find("/")
+      if handler is None and slash >= 0:
+          # A deeper path goes to the route of its first segment
+          path = path[:slash]
+          handler = self.routes.get((request.method, path))
+      if handler:
+          handler(client_socket, request)
+      elif path in self.paths:
+          self.send_response(client_socket, 405,
+                             f"{request.method} not allowed for '/{path}'")
+      else:
+          self.handle_not_found(client_socket, request.path)
+      return self.keep_alive
+
+  def send_response(self, client, status, body, content_type="text/plain", headers=b""):
+      """Send a complete response with length and connection headers
+
+      The cached head, the length digits, any extra headers and the body are
+      copied one after another into a reusable buffer and written together,
+      so a small response costs one send and no intermediate strings. A body
+      that does not fit goes out from its own memory after the buffer.
+      """
+      if isinstance(body, str):
+          body = body.encode()
+      if isinstance(headers, str):
+          headers = headers.encode()
+      head = response_head(status, content_type, self.keep_alive)
+      buf = self.out
+      out = self.out_view
+      size = len(buf)
+      length = len(body)
+
+      pos = len(head)
+      out[:pos] = head
+      # Content-Length digits, written in place
+      end = pos + 1
+      n = length
+      while n >= 10:
+          n //= 10
+          end += 1
+      n = length
+      i = end
+      while i > pos:
+          i -= 1
+          buf[i] = 48 + n % 10
+          n //= 10
+      buf[end] = 13
+      buf[end + 1] = 10
+      pos = end + 2
+      if headers:
+          out[pos:pos + len(headers)] = headers
+          pos += len(headers)
+      buf[pos] = 13
+      buf[pos + 1] = 10
+      pos += 2
+
+      if pos + length <= size:
+          out[pos:pos + length] = body
+          client.sendall(out[:pos + length])
+      else:
+          body = memoryview(body)
+          sent = max(0, size - pos)
+          out[pos:pos + sent] = body[:sent]
+          client.sendall(out[:pos + sent])
+          client.sendall(body[sent:])
+      if metrics:
+          metrics.bytes_sent.inc(pos + length)
+
+  def send_file(self, client, path, content_type="text/html"):
+      """Serve a file from flash, or a 500 if it cannot be read"""
+      try:
+          with open(path, 'rb') as f:
+              content = f.read()
+          self.send_response(client, 200, content, content_type)
+      except Exception as e:
+          _log.error('Error serving %s: %s', path, e)
+          self.send_error_response(client, 500, "Error serving page")
+
+  def handle_not_found(self, client, path):
+      """Handle 404 Not Found"""
+      try:
+          self.send_response(client, 404, f"Path '/{path}' not found")
+      except:
+          pass
+
+  def send_error_response(self, client, code, message):
+      """Send error response"""
+      try:
+          self.send_response(client, code, message)
+      except:
+          pass
+
+  def stop(self):
+      """Stop the web server"""
+      for sock in list(self.connections):
+          self.close_connection(sock)
+      if self.server_socket:
+          self.server_socket.close()
+          self.server_socket = None
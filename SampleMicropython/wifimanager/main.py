@@ -1,8 +1,13 @@
 # main.py
 from wifimngr import WiFiManager
 import gc
+import log
+from memory_manager import MemoryManager
 from config import NETWORK, write_js_config
 import network
+
+_log = log.get_logger('main')
+
 def check_system_status():
   """Print system status for debugging"""
   import os
@@ -12,7 +17,7 @@ def check_system_status():
   # Check files
   print("\nFiles on system:")
   files = os.listdir()
-  required_files = ['main.py', 'config.py', 'web_server.py', 'index.html', 'config.js']
+  required_files = ['main.py', 'config.py', 'web_server.py', 'http_server.py', 'log.py', 'index.html', 'config.js']
   for file in required_files:
       status = "OK" if file in files else "NOT FOUND"
       print(f"{status} {file}")
@@ -56,21 +61,24 @@ def main():
       print("\nSystem Ready!")
       print("=" * 40)
       
-      # Main server loop
+      memory = MemoryManager()
+
+      # Main server loop: new clients and kept-alive connections
       while True:
-          gc.collect()  # Clean up memory
           try:
-              client, addr = server_socket.accept()
-              print(f'\nNew client connected from: {addr}')
-              wifi_manager.web_server.handle_request(client)
+              wifi_manager.web_server.serve()
           except Exception as e:
-              print(f'Connection error: {e}')
+              _log.error('Connection error: %s', e)
+          log.drain()
+          # Collect only when enough has been allocated, between passes
+          memory.idle()
 
   except KeyboardInterrupt:
       print("\nShutdown requested...")
   except Exception as e:
       print(f'\nFatal error: {e}')
   finally:
+      log.flush()
       print("\nCleaning up...")
       try:
           wifi_manager.stop()
@@ -0,0 +1,123 @@
+# memory_manager.py -- garbage collection in idle time instead of every pass
+#
+# A full gc.collect() on a ~100 KB heap stops everything for milliseconds.
+# Calling it on every loop pass put that pause in front of every request and
+# control tick, whether or not anything had been allocated. Here the main
+# loop calls idle() when it has slack. It collects only once enough has been
+# allocated since the last collection, or free heap runs low, and it sets
+# gc.threshold() from the measured allocation rate. The automatic collection
+# then only fires in a burst that outruns the idle ones.
+#
+# Control ticks are scheduled callbacks, and they wait behind a collection
+# that is running. Given the next tick's release time, idle() only starts a
+# collection that its recent pauses say will end before that tick, and puts
+# a due one off to a later pass. It stops waiting once the whole threshold
+# has been allocated, when the automatic collection would fire at any
+# moment anyway, or when free heap is below the reserve.
+import gc
+import time
+
+try:
+  import metrics
+except ImportError:
+  metrics = None
+
+
+class MemoryManager:
+  """Schedules collections into idle windows and tracks what they cost
+
+  threshold is sized to about horizon_ms of allocation at the observed
+  rate, clamped to [min_threshold, max_threshold] and to half of the free
+  heap; idle() collects once half of it has been allocated. Pause times
+  and the lowest free heap seen are kept here and, when the metrics module
+  is present, in its gc_pause_us and gc_mem_free_low_bytes metrics.
+  Passes on which a due collection was put off, because it would not end
+  before the next tick, are counted in deferred.
+  """
+  def __init__(self, reserve=16384, min_threshold=4096, max_threshold=32768, horizon_ms=1000):
+      self.reserve = reserve
+      self.min_threshold = min_threshold
+      self.max_threshold = max_threshold
+      self.horizon_ms = horizon_ms
+
+      self.rate = 0                 # bytes/s, smoothed
+      self.threshold = max_threshold
+      self.collections = 0
+      self.max_pause = 0
+      self.total_pause = 0
+      self.pause = 0                # us, smoothed, what the next collection should take
+      self.deferred = 0
+      self.low_water = gc.mem_free()
+
+      # Bytes allocated since the last rate sample, across collections
+      self.pending = 0
+      self.sampled_alloc = gc.mem_alloc()
+      self.sampled_at = time.ticks_ms()
+      gc.threshold(self.threshold)
+      self.collect()
+
+  def collect(self):
+      """Collect now; returns the pause in microseconds"""
+      self.pending += gc.mem_alloc() - self.sampled_alloc
+      start = time.ticks_us()
+      gc.collect()
+      pause = time.ticks_diff(time.ticks_us(), start)
+      self.base = gc.mem_alloc()
+      free = gc.mem_free()
+      self.collections += 1
+      self.total_pause += pause
+      # Rises at once with a longer pause, falls slowly
+      self.pause = pause if pause > self.pause else (3 * self.pause + pause) // 4
+      if pause > self.max_pause:
+          self.max_pause = pause
+      if free < self.low_water:
+          self.low_water = free
+      if metrics:
+          metrics.gc_pause.observe(pause)
+          if metrics.mem_low.value == 0 or free < metrics.mem_low.value:
+              metrics.mem_low.set(free)
+      self.sampled_alloc = self.base
+      return pause
+
+  def adapt(self, now, alloc):
+      """Update the allocation rate and gc.threshold() from the last sample"""
+      elapsed = time.ticks_diff(now, self.sampled_at)
+      if elapsed < 250:
+          return
+      rate = (alloc - self.sampled_alloc + self.pending) * 1000 // elapsed
+      self.pending = 0
+      self.rate = (3 * self.rate + rate) // 4 if self.rate else rate
+      self.sampled_at = now
+      self.sampled_alloc = alloc
+      threshold = self.rate * self.horizon_ms // 1000
+      threshold = max(self.min_threshold, min(self.max_threshold, threshold, gc.mem_free() // 2))
+      if threshold != self.threshold:
+          self.threshold = threshold
+          gc.threshold(threshold)
+
+  def fits(self, release):
+      """True if a collection started now should end before release (ticks_us)"""
+      return time.ticks_diff(release, time.ticks_us()) > self.pause + (self.pause >> 2)
+
+  def idle(self, release=None):
+      """Call when the loop has slack; returns True if it collected
+
+      release is when the control loop's next tick is due, in ticks_us,
+      or None if there is no control loop to keep clear of.
+      """
+      alloc = gc.mem_alloc()
+      self.adapt(time.ticks_ms(), alloc)
+      free = gc.mem_free()
+      if free < self.low_water:
+          self.low_water = free
+      if free < self.reserve:
+          self.collect()
+          return True
+      allocated = alloc - self.base
+      if allocated >= self.threshold // 2:
+          if release is not None and allocated < self.threshold and not self.fits(release):
+              self.deferred += 1
+              return False
+          self.collect()
+          return True
+      return False
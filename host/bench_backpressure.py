@@ -0,0 +1,141 @@
+# bench_backpressure.py -- UI latency while the robot's web server is attacked
+#
+#   python host/bench_backpressure.py [--ref COMMIT] [--seconds N]
+#
+# A legitimate UI client (127.0.0.10) sends a request every 100 ms while
+# other loopback addresses run a request flood, slowloris connections that
+# trickle header bytes, and idle connections that never send anything.
+# --ref runs the same test against src/ as it was at an earlier commit.
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+
+import harness
+
+UI_IP = '127.0.0.10'
+FLOOD_IP = '127.0.0.2'
+SLOW_IP = '127.0.0.3'
+IDLE_IP = '127.0.0.4'
+
+
+def start_server(config):
+    from web_server import WebServer
+    server = WebServer(config)
+    server.start()
+
+    def loop():
+        while server.server_socket:
+            server.serve(0.05)
+
+    harness.run_server(loop)
+    return server, server.server_socket.getsockname()[1]
+
+
+def ui_client(port, running, latencies, errors):
+    """One request every 100 ms on a fresh connection, like fetch() after an idle gap"""
+    while running.is_set():
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(('127.0.0.1', port), 10, (UI_IP, 0)) as sock:
+                sock.sendall(b'GET /command?cmd=left HTTP/1.1\r\nHost: robot\r\nConnection: close\r\n\r\n')
+                response = b''
+                while True:
+                    data = sock.recv(4096)
+                    if not data:
+                        break
+                    response += data
+            if not response.startswith(b'HTTP/1.1 200'):
+                errors.append(response[:12])
+        except OSError as e:
+            errors.append(str(e))
+        latencies.append(time.perf_counter() - start)
+        time.sleep(max(0.0, 0.1 - (time.perf_counter() - start)))
+
+
+def flood(port, running, counts):
+    while running.is_set():
+        try:
+            with socket.create_connection(('127.0.0.1', port), 2, (FLOOD_IP, 0)) as sock:
+                sock.sendall(b'GET /command?cmd=accelerate HTTP/1.1\r\nHost: robot\r\n\r\n')
+                status = sock.recv(64)[9:12]
+                counts[status] = counts.get(status, 0) + 1
+        except OSError:
+            counts[b'err'] = counts.get(b'err', 0) + 1
+
+
+def slowloris(port, running):
+    while running.is_set():
+        try:
+            with socket.create_connection(('127.0.0.1', port), 2, (SLOW_IP, 0)) as sock:
+                sock.sendall(b'GET / HTTP/1.1\r\n')
+                while running.is_set():
+                    sock.sendall(b'X')
+                    time.sleep(0.5)
+        except OSError:
+            time.sleep(0.05)
+
+
+def idle(port, running):
+    while running.is_set():
+        try:
+            with socket.create_connection(('127.0.0.1', port), 2, (IDLE_IP, 0)) as sock:
+                sock.settimeout(None)
+                while running.is_set() and not sock.recv(1):
+                    pass
+        except OSError:
+            time.sleep(0.05)
+
+
+def run(port, seconds, attack):
+    running = threading.Event()
+    running.set()
+    latencies, errors, flood_counts = [], [], {}
+    threads = [threading.Thread(target=ui_client, args=(port, running, latencies, errors))]
+    if attack:
+        threads += [threading.Thread(target=flood, args=(port, running, flood_counts)) for _ in range(4)]
+        threads += [threading.Thread(target=slowloris, args=(port, running)) for _ in range(4)]
+        threads += [threading.Thread(target=idle, args=(port, running)) for _ in range(2)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    time.sleep(seconds)
+    running.clear()
+    threads[0].join(15)
+    return latencies, errors, flood_counts
+
+
+def summary(latencies, errors):
+    values = sorted(latencies)
+    if not values:
+        return 'no requests completed'
+    pick = lambda f: values[min(len(values) - 1, int(len(values) * f))] * 1000
+    return (f'p50 {pick(0.5):7.1f} ms  p99 {pick(0.99):7.1f} ms  max {values[-1] * 1000:7.1f} ms  '
+            f'errors {len(errors)}/{len(values)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='UI latency under attack')
+    parser.add_argument('--ref', help='test src/ as of this commit instead of the working tree')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    harness.install(harness.checkout(args.ref) if args.ref else 'src')
+    with harness.quiet():
+        server, port = start_server({'port': 0, 'timeout': 5})
+        quiet = run(port, args.seconds, attack=False)
+        attacked = run(port, args.seconds, attack=True)
+    flood_counts = attacked[2]
+    harness.report(f"UI requests, src at {args.ref or 'working tree'}", [
+        ('no attack', summary(*quiet[:2])),
+        ('flood + slowloris + idle', summary(*attacked[:2])),
+        ('flood responses', ', '.join(f'{k.decode()}: {v}' for k, v in sorted(flood_counts.items()))),
+    ])
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# bench_boot.py -- time from boot to an answering web server, a live AP and
+# a running control loop
+#
+#   python host/bench_boot.py [--ref COMMIT] [--ap-delay SECONDS]
+#
+# Each firmware boots the way the device runs it: main.py executed as
+# __main__, in its own process and on a scratch copy of its directory. The
+# console is the 115200 baud UART stand-in. The simulated access point takes
+# --ap-delay seconds to come up after active(True). The clock starts before
+# main.py is loaded. Reported are the time until GET / is answered, the time
+# until the AP reports active and, for firmware that records one, the
+# boot_timeline's balance_ready phase. --ref also measures the same firmware
+# as of an earlier commit. The boot timeline of src/ follows.
+import os
+import sys
+import json
+import time
+import runpy
+import socket
+import argparse
+import subprocess
+
+import harness
+import loadtest
+
+FIRMWARE = ('src', 'pid_wifi')
+
+
+def answered(port):
+    try:
+        with socket.create_connection(('127.0.0.1', port), 0.05) as sock:
+            sock.settimeout(2)
+            sock.sendall(b'GET / HTTP/1.1\r\nHost: 192.168.4.1\r\nConnection: close\r\n\r\n')
+            return sock.recv(12).startswith(b'HTTP/1.1 200')
+    except OSError:
+        return False
+
+
+def child(name, ref, ap_delay, timeout=10.0):
+    """Boot one firmware and print the times as JSON"""
+    app_dir = loadtest.SERVERS[name][0]
+    port = loadtest.free_port()
+    os.environ['ROBOT_PORT'] = str(port)
+    harness.install(harness.scratch(app_dir, ref))
+    import network
+    network.WLAN.ap_start_delay = ap_delay
+    ap = network.WLAN(network.AP_IF)
+    server = up = None
+    real_stdout = sys.stdout
+    sys.stdout = harness.UART()
+    start = time.perf_counter()
+    harness.run_server(runpy.run_path, 'main.py', None, '__main__')
+    while time.perf_counter() - start < timeout:
+        now = time.perf_counter() - start
+        if up is None and ap.active():
+            up = now
+        if server is None and answered(port):
+            server = time.perf_counter() - start
+        timeline = sys.modules.get('boot_timeline')
+        if server is not None and up is not None and (
+                timeline is None or timeline.elapsed('deferred') is not None):
+            break
+        time.sleep(0.005)
+    sys.stdout = real_stdout
+    timeline = sys.modules.get('boot_timeline')
+    phases = timeline.timeline() if timeline else None
+    print(json.dumps({'server': server, 'ap': up, 'phases': phases}), flush=True)
+    os._exit(0)
+
+
+def run(name, ref, ap_delay):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name,
+               '--ap-delay', str(ap_delay)]
+    if ref:
+        command += ['--ref', ref]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def ms(seconds):
+    return '   never' if seconds is None else f'{seconds * 1000:7.1f} ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Boot to answering server, live AP and control loop')
+    parser.add_argument('--ref', help='also measure the firmware at this commit')
+    parser.add_argument('--ap-delay', type=float, default=0.5,
+                        help='seconds the simulated AP takes to come up')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.ref, args.ap_delay)
+        return
+
+    rows = []
+    phases = None
+    for name in FIRMWARE:
+        refs = [args.ref, None] if args.ref else [None]
+        for ref in refs:
+            result = run(name, ref, args.ap_delay)
+            ready = 'n/a'
+            if result['phases']:
+                ready = ms(dict((p, at) for p, at, _ in result['phases']).get('balance_ready', 0) / 1e6)
+                if name == 'src' and ref is None:
+                    phases = result['phases']
+            label = f"{name} at {ref or 'working tree'}"
+            rows.append((label, f"server answers {ms(result['server'])}  AP up {ms(result['ap'])}"
+                                f"  balance ready {ready}"))
+    harness.report(f'Boot, AP takes {args.ap_delay * 1000:.0f} ms to start', rows)
+    if phases:
+        harness.report('src boot timeline', [
+            (phase, f'{at / 1000:8.1f} ms  (+{step / 1000:.1f})') for phase, at, step in phases])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# bench_commands.py -- command staleness under a flood of /command requests
+#
+#   python host/bench_commands.py [seconds] [clients]
+#
+# A simulated 200 Hz control loop applies commands from the web server while
+# clients flood /command?cmd=accelerate with an occasional stop. Compares the
+# latest-wins CommandMailbox with a plain FIFO where every command is applied.
+import sys
+import time
+import threading
+import http.client
+
+import harness
+
+harness.install('src')
+
+from web_server import WebServer  # noqa: E402
+from command_mailbox import CommandMailbox, STOP  # noqa: E402
+
+TICK_S = 0.005
+APPLY_COST_S = 0.001   # print + apply per command on the device
+TICK_BUDGET_S = 0.003
+
+
+class FifoQueue:
+    """Every command applied in arrival order, as before"""
+    def __init__(self):
+        self.queue = []
+
+    def post(self, kind, value):
+        self.queue.append((STOP if value == 'stop' else kind, value, time.ticks_ms()))
+
+    def poll(self):
+        return self.queue.pop(0) if self.queue else None
+
+
+def control_loop(commands, running, staleness, stop_staleness):
+    while running.is_set():
+        tick = time.perf_counter()
+        while time.perf_counter() - tick < TICK_BUDGET_S:
+            message = commands.poll()
+            if message is None:
+                break
+            age = time.ticks_diff(time.ticks_ms(), message[2])
+            (stop_staleness if message[0] == STOP else staleness).append(age)
+            end = time.perf_counter() + APPLY_COST_S
+            while time.perf_counter() < end:
+                pass
+        delay = TICK_S - (time.perf_counter() - tick)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def flood(port, running, sent):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    n = 0
+    while running.is_set():
+        n += 1
+        cmd = 'stop' if n % 50 == 0 else 'accelerate'
+        conn.request('GET', f'/command?cmd={cmd}')
+        conn.getresponse().read()
+        sent[0] += 1
+    conn.close()
+
+
+def run(commands, seconds, clients):
+    server = WebServer({'port': 0, 'timeout': 2, 'max_keep_alive': clients}, commands=commands)
+    server.start()
+    port = server.server_socket.getsockname()[1]
+    running = threading.Event()
+    running.set()
+    staleness, stop_staleness, sent = [], [], [0]
+
+    def serve():
+        while running.is_set():
+            server.serve(0.05)
+
+    flooding = threading.Event()
+    flooding.set()
+    threads = [threading.Thread(target=serve),
+               threading.Thread(target=control_loop, args=(commands, running, staleness, stop_staleness))]
+    floods = [threading.Thread(target=flood, args=(port, flooding, sent)) for _ in range(clients)]
+    for thread in threads + floods:
+        thread.start()
+    time.sleep(seconds)
+    flooding.clear()
+    for thread in floods:
+        thread.join()
+    running.clear()
+    for thread in threads:
+        thread.join()
+    server.stop()
+    return sent[0], staleness, stop_staleness
+
+
+def summary(values):
+    if not values:
+        return 'none applied'
+    values = sorted(values)
+    return (f'p50 {values[len(values) // 2]:6d} ms  p99 {values[int(len(values) * 0.99)]:6d} ms  '
+            f'max {values[-1]:6d} ms  ({len(values)} applied)')
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    rows = []
+    for name, commands in (('FIFO', FifoQueue()), ('mailbox', CommandMailbox())):
+        with harness.quiet():
+            sent, staleness, stop_staleness = run(commands, seconds, clients)
+        rows.append((f'{name} drive', summary(staleness)))
+        rows.append((f'{name} stop', summary(stop_staleness)))
+        rows.append((f'{name} requests', sent))
+    harness.report(f'Command staleness, {clients} clients flooding for {seconds:.0f} s', rows)
+
+
+if __name__ == '__main__':
+    main()
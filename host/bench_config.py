@@ -0,0 +1,90 @@
+# bench_config.py -- boot-time config.js step and /config.json serving cost
+#
+#   python host/bench_config.py [boots]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import harness
+
+harness.install('src')
+
+import config_cache  # noqa: E402
+from web_server import WebServer  # noqa: E402
+from http_server import parse_request  # noqa: E402
+
+
+class Capture:
+    """Client socket stand-in that keeps what the server writes"""
+    def __init__(self):
+        self.data = b''
+
+    def sendall(self, data):
+        self.data += bytes(data)
+
+
+def write_every_boot(path):
+    """What main.py did before: regenerate config.js on every boot"""
+    with open(path, 'w') as f:
+        f.write(config_cache.js_config())
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def boot_step(step, boots, path):
+    writes = 0
+    start = time.perf_counter()
+    for _ in range(boots):
+        writes += bool(step(path))
+    return (time.perf_counter() - start) / boots * 1e6, writes
+
+
+def serve_config(server, raw, count):
+    request = parse_request(raw)
+    start = time.perf_counter()
+    for _ in range(count):
+        client = Capture()
+        server.handle_config(client, request)
+    return (time.perf_counter() - start) / count * 1e6, client.data
+
+
+def main():
+    boots = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'config.js')
+        shutil.copy(os.path.join(harness.ROOT_DIR, 'src', 'config.js'), path)
+        before_us, before_writes = boot_step(write_every_boot, boots, path)
+        after_us, after_writes = boot_step(config_cache.write_js_config_if_changed, boots, path)
+    finally:
+        shutil.rmtree(workdir)
+
+    with harness.quiet():
+        server = WebServer({'port': 0, 'timeout': 2})
+    first_us = 0.0
+    for _ in range(100):
+        server.config_cache.invalidate()
+        us, data = serve_config(server, b'GET /config.json HTTP/1.1\r\n\r\n', 1)
+        first_us += us / 100
+    etag = data.split(b'ETag: ')[1].split(b'\r\n')[0].decode()
+    cached_us, _ = serve_config(server, b'GET /config.json HTTP/1.1\r\n\r\n', 2000)
+    revalidate_us, data = serve_config(
+        server, f'GET /config.json HTTP/1.1\r\nIf-None-Match: {etag}\r\n\r\n'.encode(), 2000)
+    assert data.startswith(b'HTTP/1.1 304'), data
+
+    harness.report(f'Boot config step ({boots} boots, config unchanged)', [
+        ('write config.js every boot', f'{before_us:8.1f} us/boot  {before_writes} flash writes'),
+        ('write only when changed', f'{after_us:8.1f} us/boot  {after_writes} flash writes'),
+    ])
+    harness.report('/config.json', [
+        ('build + serve', f'{first_us:6.1f} us'),
+        ('cached body', f'{cached_us:6.1f} us'),
+        ('If-None-Match -> 304', f'{revalidate_us:6.1f} us'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# bench_control.py -- the balance loop on simulated hardware: tick timing,
+# deadline misses, overrun policies and the watchdog
+#
+#   python host/bench_control.py [--seconds S] [--period-us US] [--spike-us US]
+#                                [--spike-every N] [--stall-ms MS]
+#
+# balance_control.BalanceController runs with the real MPU6050 driver on a
+# simulated sensor (sim/mpu6050.py, replaying bench_imu's recording) and the
+# real MotorController on simulated PWM, on a simulated clock. Its timer
+# fires every period and, as on the ESP32, its callback is scheduled. The
+# main loop runs bench_sampling's mix of Python, long C calls and IRQ-off
+# stretches, which hold up scheduled ticks the way they do on the device,
+# and calls the stall check, loop.watchdog(), once per pass as
+# src/main.py does. Stage costs are ESP32 estimates: the read is its
+# I2C traffic at 400 kHz plus READ_US, then ESTIMATE_US, CONTROL_US and
+# DRIVE_US. Injected on top:
+#   --spike-us/--spike-every   every Nth IMU read takes this much longer
+#   --stall-ms                 one C call this long, 2 s in (flash write,
+#                              a big gc.collect()), with the motors running
+# Each overrun policy is run with the injected spikes. The stall is run
+# separately to show the watchdog. The run without injection also sends
+# every tick's record to a UDP receiver on localhost, as main.py does when
+# NETWORK['TELEMETRY'] is set. Nothing soft runs during a C call, so
+# the motors stop only when it returns: the stall's length plus the rest of
+# the pass. Only machine.WDT, which src/main.py arms at 2 s, acts during it.
+import argparse
+
+import harness
+from bench_sampling import Clock, workload
+from bench_imu import recording
+
+ADDRESS = 0x68
+READ_US = 100
+ESTIMATE_US = 300
+CONTROL_US = 150
+DRIVE_US = 80
+
+
+class Stage:
+    """Wrap one pipeline stage so that calling it costs simulated time"""
+    def __init__(self, clock, target, cost, spike_us=0, spike_every=0):
+        self.clock = clock
+        self.target = target
+        self.cost = cost
+        self.spike_us = spike_us
+        self.spike_every = spike_every
+        self.calls = 0
+
+    def spend(self, extra=0):
+        self.calls += 1
+        self.clock.now += self.cost + extra
+        if self.spike_every and self.calls % self.spike_every == 0:
+            self.clock.now += self.spike_us
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+class Sensor(Stage):
+    def __init__(self, clock, sensor, device, **spikes):
+        super().__init__(clock, sensor, READ_US, **spikes)
+        self.device = device
+        self.sample_us = 1000
+
+    def read_into(self, dest, index=0):
+        due = self.clock.now // self.sample_us
+        if due > self.device.produced:
+            self.device.advance(due - self.device.produced)
+        before = self.device.bus_us()
+        self.target.read_into(dest, index)
+        self.spend(int(self.device.bus_us() - before))
+
+
+class Estimator(Stage):
+    def update(self, ax, az, gy):
+        angle = self.target.update(ax, az, gy)
+        self.spend()
+        return angle
+
+
+class Controller(Stage):
+    def update(self, angle, rate):
+        self.spend()
+        return self.target.update(angle, rate)
+
+
+class Motors(Stage):
+    def __init__(self, clock, motors):
+        super().__init__(clock, motors, DRIVE_US)
+        self.disabled_at = None
+
+    def drive(self, left, right):
+        self.target.drive(left, right)
+        self.spend()
+
+    def disable(self):
+        self.target.disable()
+        if self.disabled_at is None:
+            self.disabled_at = self.clock.now
+
+    def enable(self):
+        self.target.enable()
+
+
+def receive_udp(sock):
+    """Datagrams, records and sequence gaps of what arrived on sock"""
+    import struct
+    from udp_telemetry import HEADER
+    datagrams = records = lost = 0
+    last = None
+    while True:
+        try:
+            data = sock.recv(2048)
+        except BlockingIOError:
+            return datagrams, records, lost
+        _, _, count, seq = struct.unpack_from(HEADER, data)
+        if last is not None:
+            lost += seq - last - 1
+        last = seq
+        datagrams += 1
+        records += count
+
+
+def simulate(seconds, period_us, overrun, spike_us, spike_every, stall_ms, udp=False):
+    import time
+    import socket
+    import micropython
+    from machine import I2C
+    from mpu6050 import MPU6050Device
+    import imu
+    import balance_control as bc
+    from motor_control import MotorController
+
+    clock = Clock()
+    time.ticks_us = clock.ticks_us
+    time.ticks_ms = lambda: (clock.now // 1000) & ((1 << 30) - 1)
+    device = MPU6050Device(recording(2000))
+    i2c = I2C(0)
+    i2c.add_device(ADDRESS, device)
+    sensor = Sensor(clock, imu.MPU6050(i2c, rate_hz=1000), device,
+                    spike_us=spike_us, spike_every=spike_every)
+    motors = Motors(clock, MotorController())
+    ticks = int(seconds * 1e6 / period_us) + 10
+    receiver = sender = None
+    if udp:
+        from udp_telemetry import UDPTelemetry
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.setblocking(False)
+        sender = UDPTelemetry('127.0.0.1', receiver.getsockname()[1])
+    loop = bc.BalanceController(
+        sensor, motors, Estimator(clock, bc.FixedKalman(period_us / 1e6), ESTIMATE_US),
+        Controller(clock, bc.PIDController(period_us / 1e6), CONTROL_US), period_us=period_us, overrun=overrun,
+        history=ticks, udp=sender)
+    loop.start()
+    loop.resume()
+
+    next_tick = period_us
+    pending = 0                             # timer interrupts waiting for IRQs on
+
+    def spend(duration, kind):
+        nonlocal next_tick, pending
+        end = clock.now + duration
+        while next_tick < end:
+            clock.now = max(clock.now, next_tick)
+            next_tick += period_us
+            if kind == 'irq off':
+                pending += 1
+                continue
+            loop.timer.fire()
+            if kind == 'python':
+                start = clock.now
+                micropython.run_scheduled()
+                end += clock.now - start
+        clock.now = max(clock.now, end)
+        for _ in range(pending):
+            loop.timer.fire()
+        pending = 0
+        micropython.run_scheduled()
+
+    stall_at = None
+    for work in workload(seconds):
+        for duration, kind in work:
+            spend(duration, kind)
+        if stall_ms and stall_at is None and clock.now >= 2e6:
+            stall_at = clock.now
+            spend(stall_ms * 1000, 'c')
+        loop.watchdog()
+        if clock.now >= seconds * 1e6:
+            break
+    loop.stop()
+
+    n = min(loop.n, loop.history)
+    late = sorted(abs(v) for v in loop.late[:n])
+    # Period jitter: how much one start moved against the grid from the last
+    jitter = sorted(abs(loop.late[k] - loop.late[k - 1]) for k in range(1, n))
+    stages = [sorted(loop.stage_us[k * 4 + s] for k in range(n)) for s in range(4)]
+
+    def pct(values, fraction):
+        return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+    result = {
+        'ticks': loop.n, 'misses': loop.misses, 'skipped': loop.skipped, 'trips': loop.trips,
+        'late': (pct(late, 0.5), pct(late, 0.99), late[-1] if late else 0),
+        'jitter': (pct(jitter, 0.99), jitter[-1] if jitter else 0),
+        'stages': [(pct(s, 0.5), s[-1] if s else 0) for s in stages],
+        'disable_ms': None,
+    }
+    if stall_at is not None and motors.disabled_at is not None and motors.disabled_at >= stall_at:
+        result['disable_ms'] = (motors.disabled_at - stall_at) / 1000
+    if sender:
+        sender.close()
+        result['udp'] = receive_udp(receiver)
+        receiver.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Balance loop timing on simulated hardware')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--period-us', type=int, default=5000)
+    parser.add_argument('--spike-us', type=int, default=6000, help='extra time for a slow IMU read')
+    parser.add_argument('--spike-every', type=int, default=100, help='every Nth read is slow')
+    parser.add_argument('--stall-ms', type=int, default=200, help='one stalled C call, 2 s in')
+    args = parser.parse_args()
+
+    harness.install('src')
+    import balance_control as bc
+    runs = [
+        ('no injection', bc.SKIP, 0, 0),
+        ('spikes, SKIP', bc.SKIP, args.spike_us, args.spike_every),
+        ('spikes, CATCH_UP', bc.CATCH_UP, args.spike_us, args.spike_every),
+        (f'{args.stall_ms} ms stall', bc.SKIP, 0, 0),
+    ]
+    rows = []
+    for label, overrun, spike_us, spike_every in runs:
+        stall = args.stall_ms if 'stall' in label else 0
+        r = simulate(args.seconds, args.period_us, overrun, spike_us, spike_every, stall,
+                     udp=label == 'no injection')
+        p50, p99, worst = r['late']
+        rows.append((label, f"{r['ticks']:5d} ticks  {r['misses']:4d} missed deadlines  {r['skipped']:4d} skipped"
+                            f"  watchdog trips {r['trips']}"))
+        rows.append(('', f"start late p50 {p50} p99 {p99} max {worst} us"
+                         f"  period jitter p99 {r['jitter'][0]} max {r['jitter'][1]} us"))
+        stages = '  '.join(f'{name} {a}/{b}' for name, (a, b) in zip(bc.STAGES, r['stages']))
+        rows.append(('', f'stage us p50/max: {stages}'))
+        if 'udp' in r:
+            datagrams, records, lost = r['udp']
+            rows.append(('', f'UDP telemetry {records} records in {datagrams} datagrams, {lost} lost'))
+        if stall:
+            disabled = 'never' if r['disable_ms'] is None else f"{r['disable_ms']:.1f} ms"
+            rows.append(('', f'motors disabled {disabled} after the stall began'))
+    harness.report(f'{args.seconds:.0f} s at a {args.period_us} us period, simulated clock', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# bench_events.py -- /events load test: producer cost vs number of viewers
+#
+#   python host/bench_events.py [seconds per run]
+import sys
+import time
+import socket
+import threading
+
+import harness
+
+harness.install('src')
+
+from web_server import WebServer  # noqa: E402
+
+RATE_HZ = 500
+ESP32_SNDBUF = 5744
+
+
+def start_server(viewers):
+    server = WebServer({'port': 0, 'timeout': 2, 'events_interval_ms': 50,
+                        'max_event_clients': viewers + 1, 'max_connections': viewers + 2})
+    server.start()
+
+    def loop():
+        while server.server_socket:
+            server.serve(0.05)
+
+    harness.run_server(loop)
+    return server, server.server_socket.getsockname()[1]
+
+
+class Viewer:
+    """An /events client; a slow one stops reading after the headers"""
+    def __init__(self, port, slow=False):
+        self.sock = socket.socket()
+        if slow:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2048)
+        self.sock.connect(('127.0.0.1', port))
+        self.sock.sendall(b'GET /events HTTP/1.1\r\nHost: robot\r\nAccept: text/event-stream\r\n\r\n')
+        self.events = 0
+        self.rows = 0
+        self.running = True
+        if not slow:
+            threading.Thread(target=self.read, daemon=True).start()
+
+    def read(self):
+        buf = b''
+        self.sock.settimeout(0.5)
+        while self.running:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                continue
+            if not data:
+                break
+            buf += data
+            while b'\n\n' in buf:
+                event, buf = buf.split(b'\n\n', 1)
+                if event.startswith(b'id: '):
+                    self.events += 1
+                    self.rows += event.count(b'],[') + 1
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+
+
+def run(viewers, seconds):
+    server, port = start_server(viewers)
+    clients = [Viewer(port) for _ in range(viewers)]
+    time.sleep(0.2)
+    fast = set(server.subscribers)
+    slow = Viewer(port, slow=True) if viewers else None
+    time.sleep(0.2)
+    # The ESP32's lwIP send buffer is far smaller than a host kernel's
+    for sock in server.subscribers:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, ESP32_SNDBUF)
+    slow_state = [state for sock, state in server.subscribers.items() if sock not in fast]
+
+    period = 1.0 / RATE_HZ
+    costs = []
+    telemetry = server.telemetry
+    next_tick = time.perf_counter()
+    end = next_tick + seconds
+    while next_tick < end:
+        start = time.perf_counter_ns()
+        telemetry.push(0.5, 120.0, -118.0, 1850)
+        costs.append(time.perf_counter_ns() - start)
+        next_tick += period
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    time.sleep(0.3)
+
+    dropped = slow_state[0][2] if slow_state else 0
+    for client in clients + ([slow] if slow else []):
+        client.close()
+    server.stop()
+
+    costs.sort()
+    rows = min((c.rows for c in clients), default=0)
+    return costs[len(costs) // 2], costs[int(len(costs) * 0.99)], len(costs), rows, dropped
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    rows = []
+    with harness.quiet():
+        results = [(viewers, run(viewers, seconds)) for viewers in (0, 1, 4, 8)]
+    for viewers, (p50, p99, pushed, received, dropped) in results:
+        rows.append((f'{viewers} viewers + {1 if viewers else 0} slow',
+                     f'push p50 {p50 / 1000:5.2f} us  p99 {p99 / 1000:6.2f} us  '
+                     f'rows/viewer {received}/{pushed}  slow dropped {dropped}'))
+    harness.report(f'Telemetry producer at {RATE_HZ} Hz', rows)
+
+
+if __name__ == '__main__':
+    main()
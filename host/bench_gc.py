@@ -0,0 +1,168 @@
+# bench_gc.py -- request latency and control-loop jitter: gc.collect() on
+# every pass vs MemoryManager.idle(), with and without the next tick's time
+#
+#   python host/bench_gc.py [--seconds S] [--rate HZ]
+#
+# A 200 Hz loop stands in for the firmware's: each pass is a control tick
+# that allocates a little, web_server.serve(0), log.drain(), then the GC
+# policy, then a wait for the next tick. MemoryManager runs twice: once
+# collecting whenever a collection is due, and once given the next tick's
+# release time, as src/main.py passes balance.release, so that it only
+# collects when the pause fits before that tick. A client thread sends the UI
+# request mix every 20 ms from rotating source addresses. The heap is
+# measured with tracemalloc for both policies, so gc.mem_alloc() works as it
+# does on the device, with FREE_HEAP bytes free after start-up.
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import tracemalloc
+from array import array
+
+import harness
+import loadtest
+
+REQUESTS = [
+    b'GET /command?cmd=left HTTP/1.1\r\nHost: robot\r\nConnection: close\r\n\r\n',
+    b'POST /pid HTTP/1.1\r\nHost: robot\r\nConnection: close\r\nContent-Length: 33\r\n\r\n'
+    b'{"kp": 100.0, "ki": 50, "kd": 25}',
+    b'GET /mode?set=balance HTTP/1.1\r\nHost: robot\r\nConnection: close\r\n\r\n',
+    b'GET /config.json HTTP/1.1\r\nHost: robot\r\nConnection: close\r\n\r\n',
+]
+
+# Free heap once the firmware is loaded, as on an ESP32 without PSRAM
+FREE_HEAP = 60000
+
+
+def client(port, running, latencies):
+    n = 0
+    while running[0]:
+        start = time.perf_counter()
+        try:
+            with socket.create_connection(('127.0.0.1', port), 2, (f'127.0.0.{100 + n % 100}', 0)) as sock:
+                sock.settimeout(2)
+                sock.sendall(REQUESTS[n % len(REQUESTS)])
+                while sock.recv(4096):
+                    pass
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            pass
+        n += 1
+        time.sleep(0.02)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+def run(policy, seconds, rate):
+    import gc
+    import log
+    import metrics
+    from web_server import WebServer
+    from memory_manager import MemoryManager
+
+    port = loadtest.free_port()
+    server = WebServer({'port': port, 'timeout': 2, 'max_per_ip': 8})
+    server.start()
+    # The firmware's own objects are loaded; leave it what a device would have
+    pauses = array('d', bytes(8 * int(seconds * rate + rate)))
+    collected = 0
+    # Collections still running when the next tick was due
+    overran = 0
+    gc.collect()
+    harness.HEAP_SIZE = gc.mem_alloc() + FREE_HEAP
+    period = 1.0 / rate
+    memory = MemoryManager() if policy != 'every' else None
+    low = gc.mem_free()
+
+    running = [True]
+    latencies = []
+    thread = threading.Thread(target=client, args=(port, running, latencies), daemon=True)
+    thread.start()
+
+    # Preallocated, so the bench's own bookkeeping does not count as heap use
+    ticks = array('d', bytes(8 * int(seconds * rate + rate)))
+    count = 0
+    samples = []
+    end = time.perf_counter() + seconds
+    next_tick = time.perf_counter()
+    while time.perf_counter() < end and count < len(ticks):
+        now = time.perf_counter()
+        ticks[count] = now
+        count += 1
+        # Control tick: a few boxed floats and a record, as the real loop makes
+        samples.append([now * 1.0, now * 2.0, now * 3.0])
+        if len(samples) > 50:
+            samples = []
+        server.serve(0)
+        log.drain()
+        collections = memory.collections if memory else 0
+        if policy == 'window':
+            memory.idle(int((next_tick + period) * 1e6) & ((1 << 30) - 1))
+        elif memory:
+            memory.idle()
+        else:
+            start = time.perf_counter()
+            gc.collect()
+            pauses[collected] = time.perf_counter() - start
+            collected += 1
+            low = min(low, gc.mem_free())
+        if (not memory or memory.collections != collections) and time.perf_counter() > next_tick + period:
+            overran += 1
+        next_tick += period
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_tick = time.perf_counter()
+
+    running[0] = False
+    thread.join()
+    server.stop()
+    ticks = ticks[:count]
+    jitter = [abs((b - a) - period) for a, b in zip(ticks, ticks[1:])]
+    if memory:
+        collections, max_pause = memory.collections, memory.max_pause / 1e6
+        total_pause, low = memory.total_pause / 1e6, memory.low_water
+    else:
+        collections, max_pause, total_pause = collected, max(pauses), sum(pauses)
+    return {
+        'collections': collections, 'overran': overran, 'deferred': memory.deferred if memory else 0,
+        'max_pause': max_pause, 'total_pause': total_pause,
+        'low': low, 'jitter_p99': percentile(jitter, 0.99), 'jitter_max': max(jitter),
+        'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99), 'requests': len(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GC policy: every pass vs idle-time MemoryManager')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--rate', type=float, default=200.0)
+    args = parser.parse_args()
+
+    harness.install('src')
+    tracemalloc.start()
+    rows = []
+    with harness.quiet():
+        import log
+        log.configure(log.WARNING)
+        for label, policy in (('gc.collect() every pass', 'every'), ('MemoryManager.idle()', 'idle'),
+                              ('idle(next release)', 'window')):
+            r = run(policy, args.seconds, args.rate)
+            rows.append((label, f"{r['collections']:5d} collections, {r['overran']:3d} past the next tick,"
+                                f" {r['deferred']:4d} passes deferred"))
+            rows.append(('', f"pause max {r['max_pause'] * 1000:5.2f} ms"
+                             f" total {r['total_pause'] * 1000:7.1f} ms  low free {r['low']:6d} B"))
+            rows.append(('', f"tick jitter p99 {r['jitter_p99'] * 1000:5.2f} ms max {r['jitter_max'] * 1000:5.2f} ms"
+                             f"  requests {r['requests']} p50 {r['p50'] * 1000:5.2f} ms p99 {r['p99'] * 1000:5.2f} ms"))
+    harness.report(f'{args.seconds:.0f} s at {args.rate:.0f} Hz with the UI request mix', rows)
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# bench_imu.py -- MPU6050 read cost: register by register vs burst vs FIFO
+#
+#   python host/bench_imu.py [--samples N] [--batch B]
+#
+# A simulated MPU6050 (sim/mpu6050.py) replays a recording of the robot
+# rocking +-10 degrees at 1.5 Hz, with sensor noise. Each way of reading is
+# checked against the recording, sample for sample:
+#   per register  seven 2-byte readfrom_mem() calls and a list per sample,
+#                 the usual MicroPython MPU6050 snippet
+#   read()        imu.MPU6050.read(): one 14-byte burst, one unpack_from
+#   read_into()   the same burst decoded word by word into an array('h')
+#   FIFO          read_fifo() draining B queued samples at a time
+# Host time is per sample. CPython does the decode loop in bytecode and
+# unpack_from in C, so read_into() costs more here; on the ESP32 it is the
+# one that allocates no tuple per sample. Bus time is the I2C traffic per sample at
+# 400 kHz, which is what bounds the sample rate on the device.
+# It also checks that a FIFO overflow is detected and recovered from.
+import math
+import time
+import random
+import struct
+import argparse
+from array import array
+
+import harness
+
+ADDRESS = 0x68
+
+
+def recording(n, rate_hz=1000):
+    random.seed(1)
+    samples = []
+    for i in range(n):
+        t = i / rate_hz
+        angle = math.radians(10) * math.sin(2 * math.pi * 1.5 * t)
+        rate = math.degrees(math.radians(10) * 2 * math.pi * 1.5 * math.cos(2 * math.pi * 1.5 * t))
+
+        def noisy(value, sigma):
+            return max(-32768, min(32767, int(value + random.gauss(0, sigma))))
+        samples.append((noisy(16384 * math.sin(angle), 80), noisy(0, 80), noisy(16384 * math.cos(angle), 80),
+                        noisy((30 - 36.53) * 340, 5),
+                        noisy(0, 20), noisy(131 * rate, 20), noisy(0, 20)))
+    return samples
+
+
+def per_register(i2c):
+    values = []
+    for reg in range(0x3B, 0x49, 2):
+        values.append(struct.unpack('>h', i2c.readfrom_mem(ADDRESS, reg, 2))[0])
+    return values
+
+
+def run(label, samples, batch):
+    from machine import I2C
+    from mpu6050 import MPU6050Device
+    import imu
+
+    i2c = I2C(0)
+    device = MPU6050Device(samples)
+    i2c.add_device(ADDRESS, device)
+    sensor = imu.MPU6050(i2c, rate_hz=1000, fifo=label == 'FIFO', fifo_batch=batch)
+    device.transfers = device.bytes = 0
+    n = len(samples)
+    errors = 0
+    dest = array('h', bytes(2 * 7 * batch))
+    elapsed = 0.0
+    if label == 'FIFO':
+        done = 0
+        while done < n:
+            step = min(batch, n - done)
+            device.advance(step)
+            start = time.perf_counter()
+            got = sensor.read_fifo(dest)
+            elapsed += time.perf_counter() - start
+            for k in range(got):
+                want = samples[done + k]
+                if tuple(dest[k * 6:k * 6 + 6]) != want[:3] + want[4:]:
+                    errors += 1
+            done += got
+    else:
+        for i in range(n):
+            device.advance()
+            start = time.perf_counter()
+            if label == 'per register':
+                got = per_register(i2c)
+            elif label == 'read()':
+                got = sensor.read()
+            else:
+                sensor.read_into(dest)
+                got = dest[:7]
+            elapsed += time.perf_counter() - start
+            if tuple(got) != samples[i]:
+                errors += 1
+    bus = device.bus_us() / n
+    return (f'host {elapsed / n * 1e6:5.2f} us  bus {bus:6.1f} us'
+            f' ({device.transfers / n:4.2f} transfers)  max rate {1e6 / bus:6.0f} Hz  errors {errors}')
+
+
+def overflow(samples):
+    """Leave the FIFO unread past 1024 bytes; it must be noticed and reset"""
+    from machine import I2C
+    from mpu6050 import MPU6050Device
+    import imu
+
+    i2c = I2C(0)
+    device = MPU6050Device(samples)
+    i2c.add_device(ADDRESS, device)
+    sensor = imu.MPU6050(i2c, fifo=True)
+    dest = array('h', bytes(2 * 6 * 100))
+    device.advance(100)                     # 1200 bytes, 85 fit
+    lost = sensor.read_fifo(dest)
+    device.advance(10)
+    got = sensor.read_fifo(dest)
+    want = [s[:3] + s[4:] for s in samples[100:110]]
+    ok = lost == 0 and sensor.overflows == 1 and got == 10 and \
+        [tuple(dest[k * 6:k * 6 + 6]) for k in range(10)] == want
+    return 'ok' if ok else f'FAILED: first read {lost}, overflows {sensor.overflows}, then {got}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MPU6050 reads: per register vs burst vs FIFO')
+    parser.add_argument('--samples', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=16, help='samples per FIFO drain')
+    args = parser.parse_args()
+
+    harness.install('src')
+    samples = recording(args.samples)
+    rows = [(label, run(label, samples, args.batch))
+            for label in ('per register', 'read()', 'read_into()', 'FIFO')]
+    rows.append(('FIFO overflow', overflow(samples)))
+    harness.report(f'{args.samples} samples from a replayed recording, FIFO drained {args.batch} at a time', rows)
+
+
+if __name__ == '__main__':
+    main()
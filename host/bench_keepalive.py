@@ -0,0 +1,97 @@
+# bench_keepalive.py -- UI request burst with and without HTTP keep-alive
+#
+#   python host/bench_keepalive.py [requests]
+#
+# Runs with the server's default limits. Those charge each new connection
+# against its client address, so the Connection: close burst comes from
+# several loopback addresses, like a few phones, to measure the cost of a
+# connection per request and not the rate limit.
+import sys
+import time
+import http.client
+
+import harness
+
+harness.install('src')
+
+from web_server import WebServer  # noqa: E402
+
+UI_BURST = [
+    ('GET', '/command?cmd=accelerate', None),
+    ('GET', '/command?cmd=left', None),
+    ('POST', '/pid', '{"kp": 100.0, "ki": 50, "kd": 25}'),
+    ('GET', '/mode?set=balance', None),
+    ('GET', '/command?cmd=stop', None),
+]
+
+
+def start_server():
+    server = WebServer({'port': 0, 'timeout': 2, 'keep_alive_timeout': 5})
+    server.start()
+
+    def loop():
+        while server.server_socket:
+            server.serve(0.1)
+
+    harness.run_server(loop)
+    return server, server.server_socket.getsockname()[1]
+
+
+def burst(port, count, keep_alive, sources=8):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    headers = {} if keep_alive else {'Connection': 'close'}
+    start = time.perf_counter()
+    for i in range(count):
+        method, path, body = UI_BURST[i % len(UI_BURST)]
+        if not keep_alive:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5,
+                                              source_address=(f'127.0.0.{20 + i % sources}', 0))
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f'{path}: {response.status}')
+        if not keep_alive:
+            conn.close()
+    conn.close()
+    return count / (time.perf_counter() - start)
+
+
+def pipelined(port, count):
+    """Send the whole burst before reading any response"""
+    import socket
+    payload = b''
+    for i in range(count):
+        method, path, body = UI_BURST[i % len(UI_BURST)]
+        body = (body or '').encode()
+        payload += f'{method} {path} HTTP/1.1\r\nHost: robot\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body
+    start = time.perf_counter()
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(payload)
+    received = b''
+    while received.count(b'HTTP/1.1 200 OK') < count:
+        data = sock.recv(4096)
+        if not data:
+            raise RuntimeError('connection closed early')
+        received += data
+    sock.close()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with harness.quiet():
+        server, port = start_server()
+        close_rps = burst(port, count, keep_alive=False)
+        keep_rps = burst(port, count, keep_alive=True)
+        pipe_rps = pipelined(port, min(count, 100))
+        server.stop()
+    harness.report(f'UI burst of {count} requests', [
+        ('Connection: close', f'{close_rps:8.0f} req/s'),
+        ('keep-alive', f'{keep_rps:8.0f} req/s'),
+        ('keep-alive, pipelined', f'{pipe_rps:8.0f} req/s'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
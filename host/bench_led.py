@@ -0,0 +1,91 @@
+# bench_led.py -- NeoPixel writes per second: direct writes vs StatusLED
+#
+#   python host/bench_led.py [--seconds S]
+#
+# A 200 Hz main loop on a simulated clock asks for a status colour on every
+# pass, the way PID_WiFi's error path and the network callbacks did. The
+# colour changes a few times a second, and then a blink animation runs. Two
+# ways of driving the LED are compared:
+#   per call     Pin + NeoPixel built and written on every call (src/main.py's
+#                old neopixel_led)
+#   StatusLED    cached driver; tick() once per pass writes only changes,
+#                at most every 40 ms, and never inside a defer() window
+#                (the motor code asks for 10 ms of quiet every 25 ms here)
+# Every write holds interrupts off for 24 bits at 1.25 us each, plus about
+# 10 us of set-up, on the device. The time that adds up to per second is
+# what the stepper timers lose.
+import time
+import argparse
+
+import harness
+
+WRITE_US = 24 * 1.25 + 10
+RATE = 200
+
+
+def scenario(seconds):
+    """(now_ms, colour or None, blink) per loop pass"""
+    colours = [(0, 0, 50), (100, 0, 0), (0, 100, 0)]
+    passes = int(seconds * RATE)
+    for n in range(passes):
+        now = n * 1000 // RATE
+        if n < passes // 2:
+            # A new colour every 300 ms, requested again on every pass
+            yield now, colours[now // 300 % len(colours)], False
+        else:
+            yield now, None, True
+
+
+def per_call(seconds):
+    from machine import Pin
+    import neopixel
+    start = time.perf_counter()
+    writes = 0
+    for now, colour, blink in scenario(seconds):
+        if blink:
+            colour = (0, 0, 50) if now // 500 & 1 == 0 else (0, 0, 0)
+        np = neopixel.NeoPixel(Pin(16, Pin.OUT), 1)
+        np[0] = colour
+        np.write()
+        writes += 1
+    return writes, time.perf_counter() - start, 0
+
+
+def service(seconds):
+    from status_led import StatusLED
+    led = StatusLED()
+    # The simulated clock starts at 0
+    led.written_at = led.quiet_until = -led.min_interval
+    start = time.perf_counter()
+    blinking = False
+    for now, colour, blink in scenario(seconds):
+        if blink and not blinking:
+            led.blink('ap_up', 1000)
+            blinking = True
+        elif colour:
+            led.color(*colour)
+        # Every fifth pass the motor code asks for a quiet 10 ms
+        if now % 25 == 0:
+            led.defer(10, now)
+        led.tick(now)
+    return led.writes, time.perf_counter() - start, led.skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NeoPixel writes: per call vs StatusLED')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    harness.install('src')
+    rows = []
+    for label, fn in (('per call', per_call), ('StatusLED', service)):
+        writes, host, postponed = fn(args.seconds)
+        passes = int(args.seconds * RATE)
+        rows.append((label, f'{writes:5d} writes  {writes / args.seconds:6.1f}/s  '
+                            f'IRQs off {writes * WRITE_US / args.seconds / 1000:6.2f} ms/s  '
+                            f'host {host / passes * 1e6:5.2f} us/pass  postponed {postponed}'))
+    harness.report(f'{args.seconds:.0f} s of a {RATE} Hz loop', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# bench_logging.py -- request latency with logging at each level
+#
+#   python host/bench_logging.py [--ref COMMIT] [--requests N]
+#
+# The console is replaced by a stand-in that takes as long as a 115200 baud
+# UART to accept each character. Requests from the UI mix are answered one at
+# a time and timed; after each one the main loop's log.drain() is timed
+# separately, since it runs outside the request. Each configuration runs in
+# its own process: every level, DEBUG under python -O (the compiled-out
+# build), and with --ref the print()-based server from an earlier commit.
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import harness
+
+BAUD = harness.UART.baud
+
+MIX = [
+    b'GET /command?cmd=left HTTP/1.1\r\nHost: robot\r\n\r\n',
+    b'POST /pid HTTP/1.1\r\nHost: robot\r\nContent-Length: 33\r\n\r\n{"kp": 100.0, "ki": 50, "kd": 25}',
+    b'GET /mode?set=balance HTTP/1.1\r\nHost: robot\r\n\r\n',
+    b'GET /config.json HTTP/1.1\r\nHost: robot\r\n\r\n',
+]
+
+
+class NullSocket:
+    def sendall(self, data):
+        pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def child(variant, ref, requests):
+    """Measure one configuration and print the result as JSON"""
+    harness.install(harness.checkout(ref) if ref else 'src')
+    real_stdout = sys.stdout
+    sys.stdout = harness.UART()
+    from web_server import WebServer
+    server = WebServer({'port': 0, 'timeout': 2})
+    drain = lambda: 0
+    if variant != 'print':
+        import log
+        log.configure(getattr(log, variant), outputs=[log.StreamSink(sys.stdout)])
+        drain = log.drain
+    sock = NullSocket()
+    latencies = []
+    drains = []
+    for n in range(requests):
+        raw = MIX[n % len(MIX)]
+        start = time.perf_counter()
+        server.process_request(sock, raw, 2)
+        middle = time.perf_counter()
+        drain()
+        latencies.append((middle - start) * 1e6)
+        drains.append((time.perf_counter() - middle) * 1e6)
+    sys.stdout = real_stdout
+    print(json.dumps({'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+                      'drain': sum(drains) / len(drains)}))
+
+
+def run(variant, ref, requests, optimize=False):
+    command = [sys.executable] + (['-O'] if optimize else []) + [
+        os.path.abspath(__file__), '--child', variant, '--requests', str(requests)]
+    if ref:
+        command += ['--ref', ref]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Request latency with logging at each level')
+    parser.add_argument('--ref', help='also measure the print()-based server at this commit')
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.ref, args.requests)
+        return
+
+    configs = [(level, level, False) for level in ('DEBUG', 'INFO', 'WARNING', 'OFF')]
+    configs.append(('DEBUG, python -O', 'DEBUG', True))
+    rows = []
+    if args.ref:
+        result = run('print', args.ref, args.requests)
+        rows.append((f'print() at {args.ref}', result))
+    for label, variant, optimize in configs:
+        rows.append((label, run(variant, None, args.requests, optimize)))
+    harness.report(f'Request latency, {BAUD} baud console', [
+        (label, f"p50 {r['p50']:8.1f} us  p99 {r['p99']:8.1f} us  drain {r['drain']:8.1f} us/request")
+        for label, r in rows])
+
+
+if __name__ == '__main__':
+    main()
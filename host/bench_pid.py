@@ -0,0 +1,193 @@
+# bench_pid.py -- balance_control.PIDController on a simulated robot: what an
+# update costs, and how the loop recovers from a push
+#
+#   python host/bench_pid.py [--rate HZ] [--seconds S] [--push DEG] [--big-push DEG]
+#                            [--kp KP] [--ki KI] [--kd KD]
+#
+# The plant is an inverted pendulum on stepper-driven wheels: the centre of
+# mass sits L above the axle, the motors take the commanded steps/s at up to
+# A_MAX, and
+#   theta'' = (g sin(theta) - a cos(theta)) / L
+# integrated in SUBSTEPS per control tick. Each tick the sensor is sampled
+# as the MPU6050 reports it (+-2 g, +-250 deg/s, with noise; the wheels'
+# own acceleration is left out of the accelerometer), FixedKalman estimates
+# the tilt and PIDController sets the wheel speed. The output is a speed,
+# so the integral term is what pulls the robot upright: the gains here are
+# tuned for this plant and are not the UI defaults.
+#
+# A push starts the robot at --push degrees and at rest. Reported: the
+# overshoot past upright, the time until the tilt stays within 0.5 degree,
+# the tilt left over in the last second, and the peak wheel speed.
+# --big-push saturates the motors, with and without conditional
+# integration. The gain swap changes kp and kd halfway through a run: the
+# new set is taken whole at one tick, and the output step at that tick is
+# compared with the usual tick-to-tick change.
+#
+# Cost is host time per update, with a float PID as usually written
+# (derivative of the error, divided by dt) for comparison. As in
+# check_estimators.py, CPython boxes every int, so the point on the ESP32,
+# that an update allocates nothing, is shown by the range check instead.
+import math
+import time
+import random
+import argparse
+
+import harness
+
+G = 9.81
+L = 0.08                        # m, axle to centre of mass
+M_PER_STEP = math.pi * 0.065 / 1600   # 65 mm wheels, 200 steps at 1/8 microstep
+A_MAX = 20.0                    # m/s^2 the steppers follow without losing steps
+SUBSTEPS = 10
+ACCEL_LSB = 16384
+GYRO_LSB = 131
+GAINS = (190.0, 2500.0, 5.0)
+
+
+class Robot:
+    """Pendulum on wheels driven at a commanded speed"""
+    def __init__(self, tilt_deg, seed=4):
+        self.theta = math.radians(tilt_deg)
+        self.omega = 0.0
+        self.v = 0.0
+        self.rng = random.Random(seed)
+
+    def sense(self):
+        noise = self.rng.gauss
+        ax = ACCEL_LSB * math.sin(self.theta) + noise(0, 150)
+        az = ACCEL_LSB * math.cos(self.theta) + noise(0, 150)
+        gy = GYRO_LSB * math.degrees(self.omega) + noise(0, 15)
+        return tuple(max(-32767, min(32767, round(x))) for x in (ax, az, gy))
+
+    def step(self, sps, dt):
+        h = dt / SUBSTEPS
+        target = sps * M_PER_STEP
+        for _ in range(SUBSTEPS):
+            a = max(-A_MAX, min(A_MAX, (target - self.v) / h))
+            self.v += a * h
+            alpha = (G * math.sin(self.theta) - a * math.cos(self.theta)) / L
+            self.omega += alpha * h
+            self.theta += self.omega * h
+
+
+def simulate(rate, seconds, tilt, gains, anti_windup=True, swap=None):
+    """Tilt (degrees) and wheel command per tick"""
+    import balance_control as bc
+    dt = 1 / rate
+    robot = Robot(tilt)
+    estimator = bc.FixedKalman(dt)
+    pid = bc.PIDController(dt, *gains, anti_windup=anti_windup)
+    tilts, commands = [], []
+    for n in range(int(rate * seconds)):
+        if swap and n == int(rate * seconds) // 2:
+            pid.set_gains(*swap)
+        angle = estimator.update(*robot.sense())
+        command = pid.update(angle, estimator.rate)
+        robot.step(command, dt)
+        tilts.append(math.degrees(robot.theta))
+        commands.append(command)
+        if abs(robot.theta) > 1.2:
+            break
+    return tilts, commands
+
+
+def rms(values):
+    return math.sqrt(sum(v * v for v in values) / len(values))
+
+
+def response(tilts, commands, rate, tilt):
+    if abs(tilts[-1]) > 60:
+        return f'fell over after {len(tilts) / rate:.2f} s'
+    sign = 1 if tilt > 0 else -1
+    overshoot = max(0.0, -min(t * sign for t in tilts))
+    settled = len(tilts)
+    while settled and abs(tilts[settled - 1]) <= 0.5:
+        settled -= 1
+    residual = rms(tilts[-int(rate):])
+    return (f'overshoot {overshoot:5.2f} deg ({overshoot / abs(tilt):4.0%})  settled in {settled / rate:5.2f} s'
+            f'  last second {residual:5.3f} deg rms  peak {max(abs(c) for c in commands)} steps/s')
+
+
+class FloatPID:
+    """PID as usually written: floats, derivative of the error over dt"""
+    def __init__(self, dt, kp, ki, kd, out_max=4000):
+        self.dt, self.kp, self.ki, self.kd, self.out_max = dt, kp, ki, kd, out_max
+        self.integral = 0.0
+        self.last = 0.0
+
+    def update(self, angle, rate):
+        error = angle / 1000
+        self.integral += error * self.dt
+        derivative = (error - self.last) / self.dt
+        self.last = error
+        out = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return int(max(-self.out_max, min(self.out_max, out)))
+
+
+def cost(make, n=20000):
+    pid = make()
+    update = pid.update
+    rng = random.Random(5)
+    inputs = [(rng.randint(-20000, 20000), rng.randint(-200000, 200000)) for _ in range(n)]
+    start = time.perf_counter()
+    for angle, rate in inputs:
+        update(angle, rate)
+    return (time.perf_counter() - start) / n
+
+
+def check_ranges(dt):
+    """Largest products an update forms with every gain at its cap"""
+    import balance_control as bc
+    pid = bc.PIDController(dt, 1e6, 1e6, 1e6)
+    pid.update(0, 0)
+    rate = 250 * 1000
+    products = (bc.ERROR_MAX * pid.kp, bc.ERROR_MAX * pid.ki, rate * pid.kd,
+                2 * rate * pid.d_beta, pid.i_max)
+    worst = max(products)
+    return f'fixed-point products at most {worst} ({worst / (1 << 30):.0%} of the small int range)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PID cost and push recovery on a simulated robot')
+    parser.add_argument('--rate', type=float, default=200.0, help='control ticks per second')
+    parser.add_argument('--seconds', type=float, default=6.0)
+    parser.add_argument('--push', type=float, default=5.0, help='starting tilt in degrees')
+    parser.add_argument('--big-push', type=float, default=22.0, help='a tilt that saturates the motors')
+    parser.add_argument('--kp', type=float, default=GAINS[0])
+    parser.add_argument('--ki', type=float, default=GAINS[1])
+    parser.add_argument('--kd', type=float, default=GAINS[2])
+    args = parser.parse_args()
+
+    harness.install('src')
+    import balance_control as bc
+    gains = (args.kp, args.ki, args.kd)
+    rows = []
+    for label, tilt, anti_windup in ((f'{args.push:g} deg push', args.push, True),
+                                     (f'{args.big_push:g} deg push', args.big_push, True),
+                                     (f'{args.big_push:g} deg, no anti-windup', args.big_push, False)):
+        tilts, commands = simulate(args.rate, args.seconds, tilt, gains, anti_windup)
+        rows.append((label, response(tilts, commands, args.rate, tilt)))
+    harness.report(f'Recovery at {args.rate:.0f} Hz, kp {args.kp:g} ki {args.ki:g} kd {args.kd:g}', rows)
+
+    swap = (args.kp * 1.5, args.ki, args.kd * 2)
+    half = int(args.rate * args.seconds) // 2
+    tilts, commands = simulate(args.rate, args.seconds, args.push, gains, swap=swap)
+    steps = sorted(abs(commands[k] - commands[k - 1]) for k in range(half // 2, half))
+    harness.report('Gain swap to kp {:g} kd {:g} at {:.1f} s'.format(swap[0], swap[2], half / args.rate), [
+        ('output step at the swap', f'{abs(commands[half] - commands[half - 1])} steps/s'),
+        ('tick-to-tick before, p99', f'{steps[int(len(steps) * 0.99)]} steps/s'),
+        ('tilt in the second before/after', f'{rms(tilts[half - int(args.rate):half]):5.3f} / '
+                                             f'{rms(tilts[-int(args.rate):]):5.3f} deg rms'),
+    ])
+
+    dt = 1 / args.rate
+    harness.report('Per update on the host', [
+        ('PIDController', f'{cost(lambda: bc.PIDController(dt, *gains)) * 1e6:6.2f} us'),
+        ('float PID', f'{cost(lambda: FloatPID(dt, *gains)) * 1e6:6.2f} us'),
+    ])
+    print()
+    print(check_ranges(dt))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# bench_profiles.py -- saved WiFi network store: load, lookup and update cost
+#
+#   python host/bench_profiles.py [--profiles N]
+#
+# N profiles are saved both as the old "ssid;password" text wifi.dat, read and
+# written the way wifimgr.read_profiles()/write_profiles() used to, and as a
+# profile_store.ProfileStore. Also checks that an SSID containing ';' survives
+# and that a write torn off mid-record loses only that record.
+import os
+import time
+import argparse
+import tempfile
+
+import harness
+
+
+def text_read(path):
+    with open(path) as f:
+        lines = f.readlines()
+    profiles = {}
+    for line in lines:
+        ssid, password = line.strip("\n").split(";")
+        profiles[ssid] = password
+    return profiles
+
+
+def text_write(path, profiles):
+    lines = []
+    for ssid, password in profiles.items():
+        lines.append("%s;%s\n" % (ssid, password))
+    with open(path, "w") as f:
+        f.write(''.join(lines))
+
+
+def per_call(fn, repeat):
+    start = time.perf_counter()
+    for n in range(repeat):
+        fn(n)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WiFi profile store: text file vs binary store')
+    parser.add_argument('--profiles', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    harness.install('src')
+    from profile_store import ProfileStore
+    os.chdir(tempfile.mkdtemp())
+    saved = {f'network-{n:03d}': f'password-{n:03d}-secret' for n in range(args.profiles)}
+    names = list(saved)
+    count, repeat = len(names), args.repeat
+
+    def text_update(n):
+        profiles = text_read('wifi.txt')
+        profiles[names[n % count]] = f'changed-{n}'
+        text_write('wifi.txt', profiles)
+
+    text_write('wifi.txt', saved)
+    text = [
+        ('load', per_call(lambda n: text_read('wifi.txt'), repeat)),
+        ('lookup', per_call(lambda n: text_read('wifi.txt')[names[n % count]], repeat)),
+        ('update', per_call(text_update, repeat)),
+        ('file size', os.path.getsize('wifi.txt')),
+    ]
+
+    store = ProfileStore('wifi.dat')
+    for ssid, password in saved.items():
+        store.set(ssid, password)
+    size = os.path.getsize('wifi.dat')
+    binary = [
+        ('load', per_call(lambda n: ProfileStore('wifi.dat'), repeat)),
+        ('lookup', per_call(lambda n: store.get(names[n % count]), repeat * 100)),
+        ('update', per_call(lambda n: store.set(names[n % count], f'changed-{n}'), repeat)),
+        ('file size', size),
+    ]
+
+    rows = []
+    for (label, old), (_, new) in zip(text, binary):
+        unit = 'B ' if label == 'file size' else 'us'
+        rows.append((label, f'text {old:10.1f} {unit}   store {new:10.1f} {unit}'))
+
+    store.set('cafe;bar', 'p;w')
+    semicolon = ProfileStore('wifi.dat').get('cafe;bar') == 'p;w'
+    store.set('last-one', 'torn-write')
+    with open('wifi.dat', 'rb+') as f:
+        f.truncate(os.path.getsize('wifi.dat') - 3)
+    reloaded = ProfileStore('wifi.dat')
+    torn = 'last-one' not in reloaded and len(reloaded) == count + 1
+    rows.append(("SSID with ';'", 'ok' if semicolon else 'FAIL'))
+    rows.append(('torn last record', 'ok, only it lost' if torn else 'FAIL'))
+    harness.report(f'{count} saved networks', rows)
+
+
+if __name__ == '__main__':
+    main()
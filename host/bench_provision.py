@@ -0,0 +1,99 @@
+# bench_provision.py -- provisioning page load time while scans are slow
+#
+#   python host/bench_provision.py [--ref COMMIT] [--scan-delay S] [--loads N]
+#
+# wifimgr.start() runs on a fresh copy of WIFI_Connection/ with a simulated
+# scan that blocks for --scan-delay seconds. Once the server answers, GET / is
+# loaded N times in a row; the radio's scan counter shows how many of those
+# loads paid for a scan. GET /scan is then timed, and how long after it
+# the scan it asked for starts. --ref also measures the wifimgr.py of an earlier
+# commit.
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+
+import harness
+import loadtest
+
+APP_DIR = 'SampleMicropython/WIFI_Connection'
+
+
+def load(port, path='/'):
+    """One page load on a fresh connection; returns (status, seconds)"""
+    start = time.perf_counter()
+    with socket.create_connection(('127.0.0.1', port), 10) as sock:
+        sock.settimeout(10)
+        sock.sendall(f'GET {path} HTTP/1.1\r\nHost: 192.168.4.1\r\nConnection: close\r\n\r\n'.encode())
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+    return int(data.split(b' ', 2)[1]), time.perf_counter() - start
+
+
+def child(ref, scan_delay, loads):
+    app = harness.scratch(APP_DIR, ref)
+    harness.install(app)
+    import network
+    network.WLAN.scan_delay = scan_delay
+    port = loadtest.free_port()
+    with harness.quiet():
+        import wifimgr
+        harness.run_server(wifimgr.start, port)
+        loadtest.wait_for_port(port, 30)
+        sta = network.WLAN(network.STA_IF)
+        scans = sta.scans
+        times = [load(port)[1] for _ in range(loads)]
+        page_scans = sta.scans - scans
+        scans = sta.scans
+        status, refresh = load(port, '/scan')
+        start = time.perf_counter()
+        while sta.scans == scans and time.perf_counter() - start < 15:
+            time.sleep(0.05)
+        rescan = time.perf_counter() - start if sta.scans > scans else None
+    times.sort()
+    print(json.dumps({'p50': times[len(times) // 2], 'max': times[-1], 'scans': page_scans,
+                      'refresh': refresh if status == 200 else None, 'rescan': rescan}), flush=True)
+    os._exit(0)
+
+
+def run(ref, scan_delay, loads):
+    command = [sys.executable, os.path.abspath(__file__), '--child',
+               '--scan-delay', str(scan_delay), '--loads', str(loads)]
+    if ref:
+        command += ['--ref', ref]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, timeout=300).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Provisioning page load time with a slow WiFi scan')
+    parser.add_argument('--ref', help='also measure wifimgr.py at this commit')
+    parser.add_argument('--scan-delay', type=float, default=2.0)
+    parser.add_argument('--loads', type=int, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.ref, args.scan_delay, args.loads)
+        return
+
+    rows = []
+    for ref in ([args.ref, None] if args.ref else [None]):
+        r = run(ref, args.scan_delay, args.loads)
+        refresh = 'no /scan' if r['refresh'] is None else f"{r['refresh'] * 1000:.0f} ms"
+        rescan = 'none' if r.get('rescan') is None else f"{r['rescan']:.1f} s"
+        rows.append((ref or 'working tree',
+                     f"GET / p50 {r['p50'] * 1000:7.1f} ms  max {r['max'] * 1000:7.1f} ms  "
+                     f"scans during loads {r['scans']}  GET /scan {refresh}  scan starts after {rescan}"))
+    harness.report(f'{args.loads} page loads, scan takes {args.scan_delay:.1f} s', rows)
+
+
+if __name__ == '__main__':
+    main()
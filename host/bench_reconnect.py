@@ -0,0 +1,89 @@
+# bench_reconnect.py -- time from boot to connected for wifimgr.get_connection()
+#
+#   python host/bench_reconnect.py [--ref COMMIT] [--scan-delay S] [--connect-delay S]
+#
+# The simulated WLAN has a saved profile for 'workshop' and the radio takes
+# the given times to scan and to join. Each case runs in its own process with
+# a fresh copy of WIFI_Connection/ and a fresh radio:
+#   cache hit    the last network joined is recorded and still in range
+#   cache miss   nothing recorded yet
+#   stale cache  the recorded access point is gone, so the scan runs after all
+# --ref also measures the wifimgr.py of an earlier commit.
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import harness
+
+APP_DIR = 'SampleMicropython/WIFI_Connection'
+
+PROFILES = 'workshop;balance123\n'
+LAST = {'ssid': 'workshop', 'open': False, 'bssid': '240ac4000001', 'channel': 6,
+        'lease': ['192.168.1.57', '255.255.255.0', '192.168.1.1', '192.168.1.1']}
+GONE = dict(LAST, bssid='240ac40000ff')
+
+CASES = {
+    'cache hit': LAST,
+    'cache miss': None,
+    'stale cache': GONE,
+}
+
+
+def child(case, ref, scan_delay, connect_delay):
+    """Boot once and print the time to connected as JSON"""
+    app = harness.scratch(APP_DIR, ref)
+    with open(os.path.join(app, 'wifi.dat'), 'w') as f:
+        f.write(PROFILES)
+    if CASES[case]:
+        with open(os.path.join(app, 'wifi_last.json'), 'w') as f:
+            json.dump(CASES[case], f)
+    harness.install(app)
+    import network
+    network.WLAN.scan_delay = scan_delay
+    network.WLAN.connect_delay = connect_delay
+    with harness.quiet():
+        import wifimgr
+        start = time.perf_counter()
+        wlan = wifimgr.get_connection()
+        elapsed = time.perf_counter() - start
+    sta = network.WLAN(network.STA_IF)
+    print(json.dumps({'seconds': elapsed, 'connected': wlan is not None,
+                      'scans': sta.scans, 'connects': sta.connects}), flush=True)
+
+
+def run(case, ref, scan_delay, connect_delay):
+    command = [sys.executable, os.path.abspath(__file__), '--child', case,
+               '--scan-delay', str(scan_delay), '--connect-delay', str(connect_delay)]
+    if ref:
+        command += ['--ref', ref]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, timeout=120).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='wifimgr time to connected, with and without a cached network')
+    parser.add_argument('--ref', help='also measure wifimgr.py at this commit')
+    parser.add_argument('--scan-delay', type=float, default=2.0)
+    parser.add_argument('--connect-delay', type=float, default=0.8)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.ref, args.scan_delay, args.connect_delay)
+        return
+
+    rows = []
+    for ref in ([args.ref, None] if args.ref else [None]):
+        for case in CASES:
+            r = run(case, ref, args.scan_delay, args.connect_delay)
+            state = 'connected' if r['connected'] else 'NOT connected'
+            rows.append((f"{case}, {ref or 'working tree'}",
+                         f"{r['seconds'] * 1000:7.0f} ms  {state}  scans {r['scans']}  connects {r['connects']}"))
+    harness.report(f'Time to connected, scan {args.scan_delay:.1f} s, join {args.connect_delay:.1f} s', rows)
+
+
+if __name__ == '__main__':
+    main()
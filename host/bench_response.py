@@ -0,0 +1,83 @@
+# bench_response.py -- per-response cost of the web server: time, heap, writes
+#
+#   python host/bench_response.py [--ref COMMIT]
+#
+# Each case answers a request into a socket stand-in that only counts writes,
+# so nothing but the server's own work is measured. Heap use per response
+# comes from harness.allocations(). --ref measures src/ as of an earlier
+# commit instead of the working tree.
+import os
+import sys
+import time
+import argparse
+
+import harness
+
+
+class CountingSocket:
+    """Accepts every write at once and counts calls and bytes"""
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def sendall(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+
+
+def request(method, path, headers=''):
+    return f'{method} {path} HTTP/1.1\r\nHost: 192.168.4.1\r\n{headers}\r\n'.encode()
+
+
+def cases(server):
+    """(label, call) pairs; every call answers one request"""
+    server.keep_alive = True
+    server.connections = {}
+    config = request('GET', '/config.json')
+    etag = server.config_cache.get()[1]
+    cached = request('GET', '/config.json', f'If-None-Match: {etag}\r\n')
+    command = request('GET', '/command?cmd=left')
+    page = request('GET', '/')
+    return [
+        ('404 handle_not_found', lambda s: server.handle_not_found(s, 'nope')),
+        ('500 send_error_response', lambda s: server.send_error_response(s, 500, 'boom')),
+        ('GET /command', lambda s: server.process_request(s, command, 2)),
+        ('GET /config.json', lambda s: server.process_request(s, config, 2)),
+        ('GET /config.json -> 304', lambda s: server.process_request(s, cached, 2)),
+        ('GET / (index.html)', lambda s: server.process_request(s, page, 2)),
+    ]
+
+
+def measure(call, repeat=2000):
+    sock = CountingSocket()
+    call(sock)
+    sock = CountingSocket()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        call(sock)
+    per_call = (time.perf_counter() - start) / repeat * 1e6
+    writes = sock.writes / repeat
+    peak, _ = harness.allocations(lambda: call(sock))
+    return per_call, peak, writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-response cost of the web server')
+    parser.add_argument('--ref', help='measure src/ as of this commit instead of the working tree')
+    args = parser.parse_args()
+
+    harness.install(harness.checkout(args.ref) if args.ref else 'src')
+    from web_server import WebServer
+    rows = []
+    with harness.quiet():
+        server = WebServer({'port': 0, 'timeout': 2})
+        for label, call in cases(server):
+            us, peak, writes = measure(call)
+            rows.append((label, f'{us:7.1f} us  peak heap {peak:7.0f} B  writes {writes:.1f}'))
+    harness.report(f"Responses, src at {args.ref or 'working tree'}", rows)
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# check_commands.py -- stop and emergency commands against what was queued
+# before them
+#
+#   python host/check_commands.py
+#
+# command_mailbox.CommandMailbox is fed the sequences a UI can produce
+# between two passes of the main loop, and what poll() hands out is checked.
+# A stop or emergency has to come out first, and anything sent before it
+# that could arm or retune the robot (a mode change, new gains) must not
+# come out after it. The same sequences then go through src/main.py's
+# apply_commands() with a stand-in control loop, which checks that the
+# motors stay off after an emergency. Exits non-zero if a check fails.
+import sys
+
+import harness
+
+SEQUENCES = (
+    # (label, posted commands, expected polls)
+    ('mode, then emergency',
+     (('mode', 'balance'), ('drive', 'emergency')),
+     (('stop', 'emergency'),)),
+    ('mode, gains, drive, then stop',
+     (('mode', 'balance'), ('pid', {'kp': 1}), ('drive', 'accelerate'), ('drive', 'stop')),
+     (('stop', 'stop'),)),
+    ('emergency, then mode',
+     (('drive', 'emergency'), ('mode', 'balance')),
+     (('stop', 'emergency'), ('mode', 'balance'))),
+    ('mode, emergency, gains',
+     (('mode', 'balance'), ('drive', 'emergency'), ('pid', {'kp': 1})),
+     (('stop', 'emergency'), ('pid', {'kp': 1}))),
+)
+
+
+class Motors:
+    def __init__(self):
+        self.enabled = True
+        self.max_sps = 4000
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+
+class Controller:
+    def set_gains(self, kp=None, ki=None, kd=None):
+        pass
+
+
+class Balance:
+    """What apply_commands() calls on the BalanceController"""
+    def __init__(self):
+        self.motors = Motors()
+        self.controller = Controller()
+        self.speed = self.cruise = 0
+
+    def halt(self):
+        self.speed = 0
+
+    def turn(self, steer, ms):
+        pass
+
+    def resume(self):
+        self.motors.enable()
+
+
+def polled(mailbox):
+    out = []
+    while True:
+        message = mailbox.poll()
+        if message is None:
+            return tuple(out)
+        out.append(message[:2])
+
+
+def main():
+    harness.install('src')
+    from command_mailbox import CommandMailbox
+    import main as firmware
+
+    failed = 0
+    rows = []
+    for label, posted, expected in SEQUENCES:
+        mailbox = CommandMailbox()
+        for kind, value in posted:
+            mailbox.post(kind, value)
+        got = polled(mailbox)
+        ok = got == expected
+        failed += not ok
+        rows.append((label, ('ok   ' if ok else 'FAIL ') + ' -> '.join(f'{k} {v}' for k, v in got)))
+    harness.report('Mailbox order', rows)
+
+    rows = []
+    for label, posted, _ in SEQUENCES:
+        if ('drive', 'emergency') not in posted:
+            continue
+        mailbox = CommandMailbox()
+        for kind, value in posted:
+            mailbox.post(kind, value)
+        balance = Balance()
+        firmware.apply_commands(mailbox, balance)
+        # A mode change sent after the emergency may arm the motors again
+        armed_after = posted.index(('drive', 'emergency')) < posted.index(('mode', 'balance'))
+        ok = balance.motors.enabled == armed_after
+        failed += not ok
+        rows.append((label, ('ok   ' if ok else 'FAIL ') +
+                     ('motors on' if balance.motors.enabled else 'motors off')))
+    harness.report('apply_commands()', rows)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
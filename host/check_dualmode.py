@@ -0,0 +1,146 @@
+# check_dualmode.py -- UI availability while the station link comes and goes
+#
+#   python host/check_dualmode.py
+#
+# WiFiManager runs its AP with keep_sta() on the simulated radio while a
+# client loads GET / every 25 ms. The script then breaks and mends the
+# station side: a wrong saved password, a fixed one, a weak signal, and an
+# access point that disappears and comes back. It checks that no page load
+# failed or stalled, that retries backed off exponentially, and that
+# telemetry followed the better link. Exits non-zero if a check fails.
+import os
+import sys
+import time
+import socket
+import threading
+
+import harness
+import loadtest
+
+STEP = 0.025
+MAX_LATENCY = 0.25
+
+
+class Client(threading.Thread):
+    """Loads GET / on a fresh connection every STEP seconds
+
+    Source addresses rotate so the server's per-IP rate limit stays out of
+    the way of a test about availability.
+    """
+    def __init__(self, port):
+        super().__init__(daemon=True)
+        self.port = port
+        self.running = True
+        self.loads = 0
+        self.failures = []
+        self.worst = 0.0
+
+    def run(self):
+        origin = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            source = f'127.0.0.{100 + self.loads % 100}'
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), 2, (source, 0)) as sock:
+                    sock.settimeout(2)
+                    sock.sendall(b'GET / HTTP/1.1\r\nHost: 192.168.4.1\r\nConnection: close\r\n\r\n')
+                    data = b''
+                    while True:
+                        chunk = sock.recv(4096)
+                        if not chunk:
+                            break
+                        data += chunk
+                if not data.startswith(b'HTTP/1.1 200'):
+                    raise OSError(data[:40])
+            except OSError as e:
+                self.failures.append(f'{start - origin:.2f} s: {e}')
+            self.loads += 1
+            self.worst = max(self.worst, time.perf_counter() - start)
+            time.sleep(STEP)
+
+
+def main():
+    port = loadtest.free_port()
+    os.environ['ROBOT_PORT'] = str(port)
+    harness.install(harness.scratch('src'))
+    import network
+    network.WLAN.ap_start_delay = 0.2
+    network.WLAN.connect_delay = 0.3
+    workshop = network.WLAN.networks[0]
+
+    from config import NETWORK
+    NETWORK['STA'].update(retry_min_ms=200, retry_max_ms=1600)
+    from profile_store import ProfileStore
+    ProfileStore('wifi.dat').set('workshop', 'wrong password')
+
+    from wifi_manager import WiFiManager, STA_CONNECTING
+    import log
+    log.configure(log.OFF)
+    manager = WiFiManager(NETWORK)
+    start = time.perf_counter()
+    events = []
+    manager.on_change(lambda old, new: events.append((time.perf_counter() - start, new)))
+    links = []
+
+    with harness.quiet():
+        manager.start()
+        manager.keep_sta()
+        manager.start_server()
+        manager.start_udp_telemetry('127.0.0.1', 5005, sta_host='127.0.0.2')
+        running = True
+
+        def loop():
+            while running:
+                manager.poll()
+                if not links or links[-1][1] != manager.telemetry_link:
+                    links.append((time.perf_counter() - start, manager.telemetry_link))
+                manager.web_server.serve(0.02)
+
+        harness.run_server(loop)
+        client = Client(port)
+        client.start()
+
+        def at(seconds):
+            time.sleep(max(0, start + seconds - time.perf_counter()))
+
+        at(3.0)
+        manager.read_profiles().set('workshop', 'balance123')
+        at(5.5)
+        network.WLAN.networks[0] = workshop[:3] + (-85,) + workshop[4:]
+        at(7.0)
+        network.WLAN.networks[0] = workshop
+        at(8.5)
+        network.WLAN.networks = network.WLAN.networks[1:]
+        network.WLAN(network.STA_IF).disconnect()
+        at(10.5)
+        network.WLAN.networks = [workshop] + network.WLAN.networks
+        at(13.0)
+        client.running = False
+        running = False
+        client.join()
+
+    attempts = [t for t, state in events if state == STA_CONNECTING]
+    gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+    first_gaps = gaps[:4]
+    route = [link for _, link in links]
+    checks = [
+        ('UI loads', f'{client.loads} loads, {len(client.failures)} failed',
+         not client.failures),
+        ('worst page load', f'{client.worst * 1000:.1f} ms', client.worst < MAX_LATENCY),
+        ('backoff', ' '.join(f'{g * 1000:.0f}' for g in gaps) + ' ms between attempts',
+         all(b > a * 1.5 for a, b in zip(first_gaps, first_gaps[1:]))),
+        ('station', ' -> '.join(state for _, state in events),
+         events and events[-1][1] == 'sta_up'),
+        ('telemetry link', ' -> '.join(route),
+         route == ['ap', 'sta', 'ap', 'sta', 'ap', 'sta']),
+    ]
+    harness.report('AP + background station, scripted link failures',
+                   [(label, f"{'ok  ' if good else 'FAIL'} {detail}") for label, detail, good in checks])
+    for failure in client.failures[:5]:
+        print('  ', failure)
+    sys.stdout.flush()
+    os._exit(0 if all(good for _, _, good in checks) else 1)
+
+
+if __name__ == '__main__':
+    main()
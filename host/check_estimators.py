@@ -0,0 +1,217 @@
+# check_estimators.py -- tilt estimators in balance_control.py against a
+# float64 NumPy reference, and what an update costs
+#
+#   python host/check_estimators.py [--rate HZ] [--seconds S] [--trace FILE.npy]
+#
+# Simulated traces give the true angle; each is sampled at --rate from a
+# motion with sensor noise, scaled as the MPU6050 reports it (+-2 g, +-250
+# deg/s):
+#   still       5 degrees of tilt, held
+#   rocking     +-10 degrees at 1.5 Hz
+#   gyro bias   rocking with a 2 deg/s gyro offset
+#   vibration   rocking with the accelerometer shaken by the motors
+# A recorded trace (--trace) is an array of raw ax, az, gy rows, or a
+# structured array with those fields, sampled at --rate; it has no true
+# angle, so only the agreement with the reference is reported for it.
+#
+# The references are float64: np.arctan2 for the accelerometer angle, the
+# complementary filter, and the Kalman filter with its covariance updated
+# on every sample. The reference Kalman filter starts from the covariance
+# it settles to, as the precomputed gains do, so the comparison shows the
+# approximations rather than the start-up. Errors are RMS and max after the
+# first second, in degrees. Cost is host time per update, the naive float
+# Kalman (covariance and math.atan2 every sample, from zero covariance)
+# included for comparison. CPython boxes ints and floats alike, so the
+# fixed-point classes are no faster here; on the ESP32 their point is that
+# small ints are not heap objects while every float result is.
+import math
+import time
+import argparse
+
+import numpy as np
+
+import harness
+
+ACCEL_LSB = 16384
+GYRO_LSB = 131
+
+
+def simulated(name, rate, seconds, seed=3):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rate * seconds)) / rate
+    if name == 'still':
+        angle = np.full_like(t, 5.0)
+    else:
+        angle = 10 * np.sin(2 * np.pi * 1.5 * t)
+    rate_dps = np.gradient(angle, t)
+    accel_noise = 1500 if name == 'vibration' else 150
+    bias = 2.0 if name == 'gyro bias' else 0.0
+    rad = np.radians(angle)
+    ax = ACCEL_LSB * np.sin(rad) + rng.normal(0, accel_noise, t.size)
+    az = ACCEL_LSB * np.cos(rad) + rng.normal(0, accel_noise, t.size)
+    gy = GYRO_LSB * (rate_dps + bias) + rng.normal(0, 15, t.size)
+    raw = np.clip(np.round(np.stack([ax, az, gy], axis=1)), -32767, 32767).astype(np.int64)
+    return raw, angle
+
+
+def recorded(path):
+    data = np.load(path)
+    if data.dtype.names:
+        data = np.stack([data['ax'], data['az'], data['gy']], axis=1)
+    return data.astype(np.int64), None
+
+
+def reference(raw, dt, alpha=0.98, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+    """Float64 complementary and full Kalman filter outputs, in degrees"""
+    measured = np.degrees(np.arctan2(raw[:, 0], raw[:, 1]).astype(np.float64))
+    rate = raw[:, 2] / np.float64(GYRO_LSB)
+    comp = np.empty(len(raw))
+    kalman = np.empty(len(raw))
+    comp[0] = kalman[0] = angle = measured[0]
+    c = measured[0]
+    bias = 0.0
+    p = np.zeros((2, 2))
+    f = np.array([[1.0, -dt], [0.0, 1.0]])
+    q = np.diag([q_angle * dt, q_bias * dt])
+    for _ in range(20000):
+        p = f @ p @ f.T + q
+        k = p[:, 0] / (p[0, 0] + r_measure)
+        p = p - np.outer(k, p[0])
+    for n in range(1, len(raw)):
+        c = alpha * (c + rate[n] * dt) + (1 - alpha) * measured[n]
+        comp[n] = c
+        angle += dt * (rate[n] - bias)
+        p = f @ p @ f.T + q
+        s = p[0, 0] + r_measure
+        k = p[:, 0] / s
+        y = measured[n] - angle
+        angle += k[0] * y
+        bias += k[1] * y
+        p = p - np.outer(k, p[0])
+        kalman[n] = angle
+    return comp, kalman
+
+
+class NaiveKalman:
+    """Float Kalman filter as usually written: covariance and atan2 each sample"""
+    def __init__(self, dt, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+        self.dt, self.q_angle, self.q_bias, self.r = dt, q_angle, q_bias, r_measure
+        self.angle = None
+        self.bias = 0.0
+        self.p = [[0.0, 0.0], [0.0, 0.0]]
+
+    def update(self, ax, az, gy):
+        dt, p = self.dt, self.p
+        measured = math.degrees(math.atan2(ax, az))
+        if self.angle is None:
+            self.angle = measured
+            return measured
+        rate = gy / GYRO_LSB - self.bias
+        self.angle += dt * rate
+        p[0][0] += dt * (dt * p[1][1] - p[0][1] - p[1][0] + self.q_angle)
+        p[0][1] -= dt * p[1][1]
+        p[1][0] -= dt * p[1][1]
+        p[1][1] += self.q_bias * dt
+        s = p[0][0] + self.r
+        k0, k1 = p[0][0] / s, p[1][0] / s
+        y = measured - self.angle
+        self.angle += k0 * y
+        self.bias += k1 * y
+        p00, p01 = p[0][0], p[0][1]
+        p[0][0] -= k0 * p00
+        p[0][1] -= k0 * p01
+        p[1][0] -= k1 * p00
+        p[1][1] -= k1 * p01
+        return self.angle
+
+
+def estimators(dt):
+    import balance_control as bc
+    return [
+        ('complementary', 'comp', lambda: bc.ComplementaryFilter(dt), 1.0),
+        ('fixed complementary', 'comp', lambda: bc.FixedComplementary(dt), 0.001),
+        ('Kalman', 'kalman', lambda: bc.KalmanFilter(dt), 1.0),
+        ('fixed Kalman', 'kalman', lambda: bc.FixedKalman(dt), 0.001),
+        ('naive float Kalman', 'kalman', lambda: NaiveKalman(dt), 1.0),
+    ]
+
+
+def run(make, raw, scale):
+    estimator = make()
+    rows = raw.tolist()
+    out = np.empty(len(rows))
+    update = estimator.update
+    start = time.perf_counter()
+    for n, (ax, az, gy) in enumerate(rows):
+        out[n] = update(ax, az, gy)
+    cost = (time.perf_counter() - start) / len(rows)
+    return out * scale, cost
+
+
+def error(estimate, truth, settle):
+    diff = estimate[settle:] - truth[settle:]
+    return f'{np.sqrt(np.mean(diff ** 2)):6.3f} rms {np.max(np.abs(diff)):6.3f} max'
+
+
+def check_atan(step=61):
+    import balance_control as bc
+    worst_int = worst_float = 0.0
+    for y in range(-32767, 32768, step * 7):
+        for x in range(-32767, 32768, step * 5):
+            exact = math.atan2(y, x)
+            worst_int = max(worst_int, abs(bc.atan2_mdeg(y, x) / 1000 - math.degrees(exact)))
+            worst_float = max(worst_float, abs(bc.fast_atan2(y, x) - exact))
+    return f'atan2_mdeg max error {worst_int:.4f} deg, fast_atan2 {math.degrees(worst_float):.5f} deg'
+
+
+def check_ranges(dt):
+    """Largest products the fixed-point updates can form, against 2**30"""
+    import balance_control as bc
+    worst = 0
+    for make in (bc.FixedKalman, bc.FixedComplementary):
+        f = make(dt)
+        products = (32767 * f.g, 360000 * abs(f.k0), 360000 * abs(f.k1), 32767 * f.r)
+        worst = max(worst, *products)
+    return f'fixed-point products at most {worst} ({worst / (1 << 30):.0%} of the small int range)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tilt estimators vs a float64 reference')
+    parser.add_argument('--rate', type=float, default=200.0, help='samples per second')
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--trace', help='recorded raw ax, az, gy as .npy')
+    args = parser.parse_args()
+
+    harness.install('src')
+    dt = 1 / args.rate
+    settle = int(args.rate)
+    traces = [(name, *simulated(name, args.rate, args.seconds))
+              for name in ('still', 'rocking', 'gyro bias', 'vibration')]
+    if args.trace:
+        traces.append((args.trace, *recorded(args.trace)))
+
+    costs = {}
+    for name, raw, truth in traces:
+        refs = dict(zip(('comp', 'kalman'), reference(raw, dt)))
+        rows = []
+        if truth is not None:
+            for kind, ref in refs.items():
+                rows.append((f'float64 {kind} reference', 'vs truth ' + error(ref, truth, settle)))
+        for label, kind, make, scale in estimators(dt):
+            estimate, cost = run(make, raw, scale)
+            costs.setdefault(label, []).append(cost)
+            value = 'vs reference ' + error(estimate, refs[kind], settle)
+            if truth is not None:
+                value = 'vs truth ' + error(estimate, truth, settle) + '   ' + value
+            rows.append((label, value))
+        harness.report(f'{name}: degrees', rows)
+
+    harness.report('Per update on the host', [
+        (label, f'{sum(c) / len(c) * 1e6:6.2f} us') for label, c in costs.items()])
+    print()
+    print(check_atan())
+    print(check_ranges(dt))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+# conformance.py -- HTTP behaviour checks run against all four servers
+#
+#   python host/conformance.py [--server NAME ...]
+#
+# Every server is started the way loadtest.py starts it and sent the same raw
+# requests: split headers, a body arriving after its headers (Safari), keep-
+# alive, pipelining, HTTP/1.0, malformed and oversized requests. Since all of
+# them are built on http_server.py, the results should be identical; the
+# script also checks that each sample's copies of the shared modules in
+# SHARED match src/.
+# Exits non-zero if anything fails.
+import os
+import sys
+import time
+import socket
+import argparse
+
+import harness
+import loadtest
+
+# Per server: a POST that needs its body, the status it should get, a marker
+# the response body must contain, and a GET whose query must be decoded
+TARGETS = {
+    'src': (('/pid', '{"kp": 1}', 200, b'PID values updated'),
+            ('/command?cmd=a%20b+c', b'a b c')),
+    'pid_wifi': (('/pid', '{"kp": 1}', 200, b'PID values updated'),
+                 ('/command?cmd=a%20b+c', b'a b c')),
+    'wifimanager': (('/pid', '{"kp": 1}', 200, b'PID values updated'),
+                    ('/command?cmd=a%20b+c', b'a b c')),
+    'wifimgr': (('/configure', 'ssid=&password=a%21b', 400, b'SSID must be provided'),
+                None),
+}
+
+
+def connect(port, source):
+    sock = socket.create_connection(('127.0.0.1', port), 5, (source, 0))
+    sock.settimeout(5)
+    return sock
+
+
+def read_response(sock, buf=b''):
+    """Read one response; returns (status, headers dict, body, leftover bytes)"""
+    while b'\r\n\r\n' not in buf:
+        data = sock.recv(4096)
+        if not data:
+            raise AssertionError(f'connection closed after {len(buf)} bytes')
+        buf += data
+    head, buf = buf.split(b'\r\n\r\n', 1)
+    lines = head.decode().split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' not in headers:
+        raise AssertionError('no Content-Length')
+    length = int(headers['content-length'])
+    while len(buf) < length:
+        data = sock.recv(4096)
+        if not data:
+            raise AssertionError('body shorter than Content-Length')
+        buf += data
+    return status, headers, buf[:length], buf[length:]
+
+
+def raw(method, path, body='', extra='', version='HTTP/1.1'):
+    body = body.encode()
+    return (f'{method} {path} {version}\r\nHost: 192.168.4.1\r\n{extra}'
+            f'Content-Length: {len(body)}\r\n\r\n').encode() + body
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_root(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(raw('GET', '/', extra='Connection: close\r\n'))
+        status, headers, body, _ = read_response(sock)
+    expect(status == 200, f'status {status}')
+    expect(headers.get('content-type', '').startswith('text/html'), 'not text/html')
+    expect(b'<' in body, 'empty page')
+
+
+def check_not_found(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(raw('GET', '/no/such/page', extra='Connection: close\r\n'))
+        status, _, _, _ = read_response(sock)
+    expect(status == 404, f'status {status}')
+
+
+def check_wrong_method(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(raw('DELETE', '/', extra='Connection: close\r\n'))
+        status, _, _, _ = read_response(sock)
+    expect(status == 405, f'status {status}')
+
+
+def check_split_headers(port, source, name):
+    request = raw('GET', '/', extra='Connection: close\r\n')
+    with connect(port, source) as sock:
+        for i in range(0, len(request), 20):
+            sock.sendall(request[i:i + 20])
+            time.sleep(0.02)
+        status, _, _, _ = read_response(sock)
+    expect(status == 200, f'status {status}')
+
+
+def check_late_body(port, source, name):
+    path, body, want, marker = TARGETS[name][0]
+    request = raw('POST', path, body, extra='Connection: close\r\n')
+    split = request.index(b'\r\n\r\n') + 4
+    with connect(port, source) as sock:
+        sock.sendall(request[:split])
+        time.sleep(0.2)
+        sock.sendall(request[split:])
+        status, _, response, _ = read_response(sock)
+    expect(status == want, f'status {status}')
+    expect(marker in response, f'body {response[:60]!r}')
+
+
+def check_query(port, source, name):
+    target = TARGETS[name][1]
+    if target is None:
+        return 'n/a'
+    path, marker = target
+    with connect(port, source) as sock:
+        sock.sendall(raw('GET', path, extra='Connection: close\r\n'))
+        status, _, body, _ = read_response(sock)
+    expect(status == 200 and marker in body, f'{status} {body[:60]!r}')
+
+
+def check_keep_alive(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(raw('GET', '/no/such/page'))
+        status, headers, _, rest = read_response(sock)
+        expect(headers.get('connection') == 'keep-alive', 'not kept alive')
+        sock.sendall(raw('GET', '/', extra='Connection: close\r\n'))
+        status, headers, _, _ = read_response(sock, rest)
+        expect(status == 200, f'second status {status}')
+        expect(headers.get('connection') == 'close', 'Connection: close ignored')
+
+
+def check_pipelined(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(raw('GET', '/no/such/page') + raw('GET', '/', extra='Connection: close\r\n'))
+        first, _, _, rest = read_response(sock)
+        second, _, _, _ = read_response(sock, rest)
+    expect((first, second) == (404, 200), f'statuses {first}, {second}')
+
+
+def check_http10(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(raw('GET', '/', version='HTTP/1.0'))
+        status, headers, _, rest = read_response(sock)
+        expect(status == 200, f'status {status}')
+        expect(headers.get('connection') == 'close', 'HTTP/1.0 kept alive')
+        expect(rest == b'' and sock.recv(1) == b'', 'connection left open')
+
+
+def check_malformed(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(b'HELLO THERE\r\n\r\n')
+        status, _, _, _ = read_response(sock)
+    expect(status == 400, f'status {status}')
+    check_root(port, source, name)
+
+
+def check_oversized(port, source, name):
+    with connect(port, source) as sock:
+        sock.sendall(b'GET / HTTP/1.1\r\nX-Padding: ' + b'a' * 8192)
+        status, _, _, _ = read_response(sock)
+    expect(status == 413, f'status {status}')
+
+
+def check_declared_oversized(port, source, name):
+    start = time.perf_counter()
+    with connect(port, source) as sock:
+        sock.sendall(b'POST / HTTP/1.1\r\nHost: 192.168.4.1\r\nContent-Length: 100000\r\n\r\n')
+        status, _, _, _ = read_response(sock)
+    elapsed = time.perf_counter() - start
+    expect(status == 413, f'status {status}')
+    # Answered from the headers, not after the read deadline
+    expect(elapsed < 1.0, f'413 after {elapsed:.2f} s')
+
+
+def check_bad_length(port, source, name):
+    for value in (b'abc', b'-5'):
+        with connect(port, source) as sock:
+            sock.sendall(b'POST / HTTP/1.1\r\nHost: 192.168.4.1\r\nContent-Length: ' + value + b'\r\n\r\n')
+            status, _, body, _ = read_response(sock)
+        expect(status == 400, f'status {status} for Content-Length {value.decode()}: {body[:60]!r}')
+    check_root(port, source, name)
+
+
+CHECKS = [
+    ('GET /', check_root),
+    ('404', check_not_found),
+    ('405', check_wrong_method),
+    ('split headers', check_split_headers),
+    ('late body', check_late_body),
+    ('query decode', check_query),
+    ('keep-alive', check_keep_alive),
+    ('pipelined', check_pipelined),
+    ('HTTP/1.0', check_http10),
+    ('malformed', check_malformed),
+    ('oversized', check_oversized),
+    ('declared oversized', check_declared_oversized),
+    ('bad length', check_bad_length),
+]
+
+
+# Module in src/ -> the servers whose directories carry a copy of it
+SHARED = {
+    'http_server.py': tuple(loadtest.SERVERS),
+    'log.py': tuple(loadtest.SERVERS),
+    'profile_store.py': ('pid_wifi', 'wifimgr'),
+    'memory_manager.py': ('pid_wifi', 'wifimanager'),
+    'status_led.py': ('pid_wifi',),
+    'config_cache.py': ('pid_wifi',),
+    'command_mailbox.py': ('pid_wifi',),
+}
+
+
+def check_copies():
+    """Each sample directory must carry unmodified copies of the shared modules"""
+    stale = []
+    for module, names in SHARED.items():
+        with open(os.path.join(harness.ROOT_DIR, 'src', module), 'rb') as f:
+            core = f.read()
+        for name in names:
+            app_dir = loadtest.SERVERS[name][0]
+            with open(os.path.join(harness.ROOT_DIR, app_dir, module), 'rb') as f:
+                if f.read() != core:
+                    stale.append(f'{name}/{module}')
+    return stale
+
+
+def run(name):
+    port = loadtest.free_port()
+    child = loadtest.spawn(name, port)
+    results = []
+    try:
+        for n, (label, check) in enumerate(CHECKS):
+            try:
+                results.append((label, check(port, f'127.0.0.{40 + n}', name) or 'ok'))
+            except (AssertionError, OSError, ValueError, IndexError) as e:
+                results.append((label, f'FAIL {e}'))
+    finally:
+        child.kill()
+        child.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP conformance checks for the embedded servers')
+    parser.add_argument('--server', action='append', choices=sorted(loadtest.SERVERS))
+    args = parser.parse_args()
+
+    failed = 0
+    stale = check_copies()
+    if stale:
+        failed += 1
+        print(f'differs from src/: {", ".join(stale)}')
+    for name in args.server or sorted(loadtest.SERVERS):
+        results = run(name)
+        failed += sum(1 for _, result in results if result.startswith('FAIL'))
+        harness.report(name, results)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# harness.py -- run the robot firmware under CPython on the host
+#
+# install() puts the firmware directory and the stand-in modules in sim/ on
+# sys.path and adds the MicroPython-only helpers (time.ticks_ms and friends)
+# so that the device code can be imported unchanged.
+import gc
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import tracemalloc
+import threading
+import contextlib
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(HOST_DIR)
+SIM_DIR = os.path.join(HOST_DIR, 'sim')
+
+_TICKS_PERIOD = 1 << 30
+
+# Roughly what an ESP32 without PSRAM has left for Python objects
+HEAP_SIZE = 110000
+
+
+def _ticks_ms():
+    return int(time.perf_counter() * 1000) & (_TICKS_PERIOD - 1)
+
+
+def _ticks_us():
+    return int(time.perf_counter() * 1000000) & (_TICKS_PERIOD - 1)
+
+
+def _ticks_diff(a, b):
+    diff = (a - b) & (_TICKS_PERIOD - 1)
+    return diff - _TICKS_PERIOD if diff >= _TICKS_PERIOD // 2 else diff
+
+
+def _ticks_add(a, delta):
+    return (a + delta) & (_TICKS_PERIOD - 1)
+
+
+_gc_threshold = [-1]
+
+
+def _threshold(amount=None):
+    if amount is None:
+        return _gc_threshold[0]
+    _gc_threshold[0] = amount
+    return None
+
+
+def _mem_alloc():
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def install(app_dir='src'):
+    """Make the firmware in app_dir importable and chdir into it"""
+    app = os.path.join(ROOT_DIR, app_dir)
+    for path in (SIM_DIR, app):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+
+    # struct is imported long before this, so replace the module itself; host
+    # code that imported it already keeps CPython's
+    sys.modules.pop('struct', None)
+    import struct  # noqa: F401 -- now sim/struct.py
+
+    time.ticks_ms = _ticks_ms
+    time.ticks_us = _ticks_us
+    time.ticks_diff = _ticks_diff
+    time.ticks_add = _ticks_add
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+    # Heap figures come from tracemalloc when it is tracing; CPython has no
+    # byte threshold, so gc.threshold() only remembers the value
+    gc.mem_alloc = _mem_alloc
+    gc.mem_free = lambda: HEAP_SIZE - _mem_alloc()
+    gc.threshold = _threshold
+
+    os.chdir(app)
+    return app
+
+
+class UART:
+    """Console stand-in that takes as long as a 115200 baud UART per character"""
+    baud = 115200
+
+    def write(self, text):
+        end = time.perf_counter() + len(text) * 10 / self.baud
+        while time.perf_counter() < end:
+            pass
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the firmware's console prints"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run_server(loop, *args):
+    """Run a blocking firmware loop in a daemon thread"""
+    thread = threading.Thread(target=loop, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def report(title, rows):
+    """Print a small aligned table of (label, value) rows"""
+    print(f'\n{title}')
+    print('-' * len(title))
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        print(f'{label:<{width}}  {value}')
+
+
+def checkout(ref, path='src'):
+    """Extract a directory as it was at ref into a temporary directory"""
+    workdir = tempfile.mkdtemp()
+    archive = subprocess.run(['git', 'archive', ref, path], cwd=ROOT_DIR,
+                             check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', workdir], input=archive, check=True)
+    return os.path.join(workdir, path)
+
+
+def allocations(fn, repeat=200):
+    """Bytes fn allocates per call, counted by tracemalloc
+
+    Returns (peak, kept): the high-water mark above the starting heap, which
+    is what a call needs free on the device, and what it leaves allocated.
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    peak = kept = 0
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        current, high = tracemalloc.get_traced_memory()
+        peak += high - before
+        kept += current - before
+    if not tracing:
+        tracemalloc.stop()
+    return peak / repeat, kept / repeat
+
+
+def scratch(app_dir, ref=None):
+    """Copy app_dir, as of ref if given, somewhere the firmware may write files"""
+    source = checkout(ref, app_dir) if ref else os.path.join(ROOT_DIR, app_dir)
+    app = os.path.join(tempfile.mkdtemp(), 'app')
+    shutil.copytree(source, app, ignore=shutil.ignore_patterns('__pycache__'))
+    return app
@@ -0,0 +1,280 @@
+# loadtest.py -- load-test the four embedded HTTP servers on localhost
+#
+#   python host/loadtest.py [--server NAME ...] [--clients N] [--requests N]
+#
+# Each server runs in its own CPython process (they share module names) with
+# the stand-ins from sim/, started the way its main.py starts it, on a
+# scratch copy of its directory so that files it writes stay out of the repo.
+# Clients send a UI-like mix of requests, one per connection. Results are
+# appended to host/results/loadtest.jsonl with the current commit so that a
+# run can be compared with earlier ones.
+import os
+import sys
+import json
+import compileall
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+
+import harness
+
+RESULTS = os.path.join(harness.HOST_DIR, 'results', 'loadtest.jsonl')
+
+UI_MIX = [
+    (4, 'GET', '/command?cmd=accelerate', None),
+    (2, 'GET', '/command?cmd=left', None),
+    (2, 'POST', '/pid', '{"kp": 100.0, "ki": 50, "kd": 25}'),
+    (1, 'GET', '/mode?set=balance', None),
+    (1, 'GET', '/', None),
+]
+
+PROVISIONING_MIX = [
+    (1, 'GET', '/', None),
+]
+
+
+def run_src(port):
+    import main
+    main.main()
+
+
+def run_pid_wifi(port):
+    import main
+    main.main()
+
+
+def run_wifimanager(port):
+    import main
+    main.main()
+
+
+def run_wifimgr(port):
+    import wifimgr
+    wifimgr.start(port)
+
+
+SERVERS = {
+    'src': ('src', run_src, UI_MIX),
+    'pid_wifi': ('SampleMicropython/PID_WiFi', run_pid_wifi, UI_MIX),
+    'wifimanager': ('SampleMicropython/wifimanager', run_wifimanager, UI_MIX),
+    'wifimgr': ('SampleMicropython/WIFI_Connection', run_wifimgr, PROVISIONING_MIX),
+}
+
+
+def serve(name, port):
+    """Child process: run one server until stdin closes, then report memory"""
+    import tracemalloc
+    app_dir, run, _ = SERVERS[name]
+    os.environ['ROBOT_PORT'] = str(port)
+    app = harness.scratch(app_dir)
+    # Compiled first, so that the memory figures leave the compiler out
+    compileall.compile_dir(app, quiet=1)
+    harness.install(app)
+    tracemalloc.start()
+    with harness.quiet():
+        harness.run_server(run, port)
+        sys.stdin.readline()
+        current, peak = tracemalloc.get_traced_memory()
+    print(json.dumps({'mem_current': current, 'mem_peak': peak}), flush=True)
+    os._exit(0)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.0):
+    """Wait until the server accepts; the probe is a complete request because
+    some of the servers spin forever on a connection closed before its headers"""
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), 0.2)
+        except OSError:
+            time.sleep(0.05)
+            continue
+        with sock:
+            sock.settimeout(timeout)
+            sock.sendall(b'GET / HTTP/1.1\r\nHost: 192.168.4.1\r\nConnection: close\r\n\r\n')
+            try:
+                while sock.recv(4096):
+                    pass
+            except OSError:
+                pass
+        return True
+    return False
+
+
+def request(port, method, path, body, timeout, source='127.0.0.1'):
+    """One request on a fresh connection; returns (status or None, seconds)"""
+    body = (body or '').encode()
+    payload = (f'{method} {path} HTTP/1.1\r\nHost: 192.168.4.1\r\n'
+               f'User-Agent: loadtest\r\nAccept: */*\r\n'
+               f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode() + body
+    start = time.perf_counter()
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout, (source, 0)) as sock:
+            sock.sendall(payload)
+            response = b''
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                response += data
+    except OSError:
+        return None, time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    try:
+        return int(response.split(b' ', 2)[1]), elapsed
+    except (IndexError, ValueError):
+        return None, elapsed
+
+
+def drive(port, mix, clients, requests, timeout, max_seconds, seed=1):
+    """Run the client threads; returns (latencies, errors, throttled, statuses, seconds)
+
+    Clients stop early after max_seconds so a server that stalls every
+    request does not hold up the whole run. Each client uses its own loopback
+    address, like separate phones on the robot's access point.
+    """
+    weights = [w for w, *_ in mix]
+    latencies = []
+    statuses = {}
+    errors = [0]
+    throttled = [0]
+    lock = threading.Lock()
+    per_client = requests // clients
+    deadline = time.perf_counter() + max_seconds
+
+    def client(n):
+        rng = random.Random(seed + n)
+        for _ in range(per_client):
+            if time.perf_counter() > deadline:
+                break
+            _, method, path, body = rng.choices(mix, weights)[0]
+            status, elapsed = request(port, method, path, body, timeout, f'127.0.0.{20 + n}')
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status in (429, 503):
+                    throttled[0] += 1
+                elif status is None or status >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], throttled[0], statuses, time.perf_counter() - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=harness.ROOT_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_result(name, clients):
+    try:
+        with open(RESULTS) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return None
+    rows = [r for r in rows if r['server'] == name and r['clients'] == clients]
+    return rows[-1] if rows else None
+
+
+def spawn(name, port):
+    """Start one server in a child process and wait until it answers"""
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', name, str(port)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    if not wait_for_port(port):
+        child.kill()
+        child.wait()
+        raise RuntimeError(f'{name} did not start listening on {port}')
+    return child
+
+
+def load_test(name, clients, requests, timeout, max_seconds):
+    app_dir, _, mix = SERVERS[name]
+    port = free_port()
+    child = spawn(name, port)
+    try:
+        latencies, errors, throttled, statuses, seconds = drive(port, mix, clients, requests, timeout, max_seconds)
+        child.stdin.write('report\n')
+        child.stdin.flush()
+        memory = json.loads(child.stdout.readline() or '{}')
+    finally:
+        child.kill()
+        child.wait()
+
+    return {
+        'server': name,
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'clients': clients,
+        'requests': len(latencies),
+        'rps': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'error_rate': round(errors / max(1, len(latencies)), 4),
+        'throttled_rate': round(throttled / max(1, len(latencies)), 4),
+        'statuses': {str(k): v for k, v in statuses.items()},
+        'mem_peak': memory.get('mem_peak'),
+    }
+
+
+def describe(result, previous):
+    line = (f"{result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  errors {result['error_rate']:6.1%}  "
+            f"throttled {result.get('throttled_rate', 0):6.1%}  "
+            f"peak mem {result['mem_peak'] or 0:>8} B")
+    if previous:
+        line += (f"  (was {previous['rps']:.1f} req/s, p99 {previous['p99_ms']:.2f} ms"
+                 f" at {previous['commit']})")
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the embedded HTTP servers')
+    parser.add_argument('--server', action='append', choices=sorted(SERVERS))
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--max-seconds', type=float, default=30.0)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--serve', nargs=2, metavar=('NAME', 'PORT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]))
+        return
+
+    rows = []
+    for name in args.server or sorted(SERVERS):
+        previous = previous_result(name, args.clients)
+        result = load_test(name, args.clients, args.requests, args.timeout, args.max_seconds)
+        rows.append((name, describe(result, previous)))
+        if not args.no_save:
+            os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+            with open(RESULTS, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+    harness.report(f'{args.clients} clients, {args.requests} requests per server', rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# config.py -- host stand-in for the robot's config.py (not kept in the repo)
+#
+# Values mirror src/config.js. The keys cover both the layout used by src/
+# (NETWORK['AP'|'STA'|'SERVER']) and the flat one used by the PID_WiFi sample.
+# ROBOT_PORT lets the harness choose the server port.
+import os
+import json
+
+PID = {
+    'kp': {'default': 100.0, 'min': 0, 'max': 200.0, 'step': 10},
+    'ki': {'default': 50, 'min': 0, 'max': 100.0, 'step': 5},
+    'kd': {'default': 25, 'min': 0, 'max': 50.0, 'step': 5},
+}
+
+MODES = {'default': 'balance', 'available': ['balance', 'avoid', 'roam']}
+
+MOTOR = {
+    'default_speed': 0,
+    'max_speed': 1023,
+    'min_speed': -1023,
+    'acceleration_step': 100,
+    'turn_difference': 200,
+}
+
+SERVER = {
+    'port': int(os.environ.get('ROBOT_PORT', 8080)),
+    'timeout': 5,
+    'max_connections': 5,
+}
+
+NETWORK = {
+    'ssid': 'Robot',
+    'password': 'balance123',
+    'authmode': 3,
+    'AP': {'ssid': 'Robot', 'password': 'balance123', 'authmode': 3, 'max_clients': 4},
+    'STA': {'profiles_file': 'wifi.dat'},
+    'SERVER': SERVER,
+}
+
+
+def js_config():
+    return ('\n// Auto-generated from config.py\nconst CONFIG = {\n'
+            f'  pid: {json.dumps(PID)},\n'
+            f'  modes: {json.dumps(MODES)},\n'
+            f'  motor: {json.dumps(MOTOR)}\n'
+            '};\n')
+
+
+def write_js_config():
+    """The device writes config.js to flash; the host leaves the repo alone"""
+    return js_config()
@@ -0,0 +1,156 @@
+# machine.py -- host stand-in for the parts of MicroPython's machine module we use
+import time
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    PULL_DOWN = 3
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+        self.handler = None
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=IRQ_RISING, hard=False):
+        self.handler = handler
+
+    def trigger(self):
+        """Simulate an edge: call the IRQ handler as the interrupt would"""
+        if self.handler:
+            self.handler(self)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        self.id = id
+        self.callback = None
+        self.period = -1
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        """As on the ESP32: no hard= here, the callback is always scheduled"""
+        self.callback = callback
+        self.period = period
+
+    def deinit(self):
+        self.callback = None
+
+    def fire(self):
+        """Simulate the timer expiring: queue its callback as the port does"""
+        if self.callback:
+            import micropython
+            try:
+                micropython.schedule(self.callback, self)
+            except RuntimeError:
+                pass                    # the port drops it when the queue is full
+
+
+class WDT:
+    """Hardware watchdog: once created it cannot be stopped, only fed"""
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.feeds = 0
+
+    def feed(self):
+        self.feeds += 1
+
+
+class PWM:
+    def __init__(self, pin, freq=5000, duty_u16=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        self._duty = 0
+
+
+def reset():
+    raise SystemExit('machine.reset()')
+
+
+def freq():
+    return 240000000
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
+
+
+def unique_id():
+    return b'\x24\x0a\xc4\x12\x34\x56'
+
+
+def idle():
+    time.sleep(0)
+
+
+class I2C:
+    """Bus stand-in; attach simulated devices with add_device(addr, device)
+
+    A device provides readfrom_mem_into(memaddr, buf) and writeto_mem(memaddr, buf).
+    """
+    def __init__(self, id=0, scl=None, sda=None, freq=400000):
+        self.id = id
+        self.freq = freq
+        self.devices = {}
+
+    def add_device(self, addr, device):
+        self.devices[addr] = device
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        self._device(addr).readfrom_mem_into(memaddr, buf)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        buf = bytearray(nbytes)
+        self._device(addr).readfrom_mem_into(memaddr, buf)
+        return bytes(buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._device(addr).writeto_mem(memaddr, buf)
+
+    def _device(self, addr):
+        if addr not in self.devices:
+            raise OSError(19)  # ENODEV, as on the ESP32
+        return self.devices[addr]
+
+
+SoftI2C = I2C
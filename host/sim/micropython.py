@@ -0,0 +1,35 @@
+# micropython.py -- host stand-in for the MicroPython-specific module
+
+
+def const(value):
+    """On the device this folds the value into the bytecode"""
+    return value
+
+
+def opt_level(level=None):
+    """The host follows python -O instead"""
+    return 0 if __debug__ else 1
+
+
+# Callbacks waiting for run_scheduled(); the device's queue holds 8
+_scheduled = []
+SCHEDULE_DEPTH = 8
+
+
+def schedule(fn, arg):
+    """Queue fn(arg) the way an interrupt handler would on the device"""
+    if len(_scheduled) >= SCHEDULE_DEPTH:
+        raise RuntimeError('schedule queue full')
+    _scheduled.append((fn, arg))
+    return True
+
+
+def run_scheduled():
+    """Run the queued callbacks, as the VM does at its next safe point
+
+    The host has no VM to do this by itself; whatever simulates the
+    interrupts calls it.
+    """
+    while _scheduled:
+        fn, arg = _scheduled.pop(0)
+        fn(arg)
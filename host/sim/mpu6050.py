@@ -0,0 +1,126 @@
+# mpu6050.py -- simulated MPU6050 that replays a recording, for machine.I2C
+#
+#   bus = machine.I2C(0)
+#   sensor = MPU6050Device(recording)
+#   bus.add_device(0x68, sensor)
+#
+# recording is bytes of 14-byte register dumps (ACCEL_XOUT_H to GYRO_ZOUT_L,
+# as the sensor reports them) or a sequence of (ax, ay, az, temp, gx, gy, gz)
+# tuples; it is replayed in a loop. With clock=None the sensor only samples
+# when advance() is called; with a clock (seconds, e.g. time.perf_counter)
+# it samples at the rate set in SMPLRT_DIV and CONFIG. The register file,
+# the 1024-byte FIFO with its overflow flag, FIFO_RESET and the device reset
+# behave as the datasheet describes for what the driver uses. Transfers and
+# bytes on the bus are counted, so bus_us() can cost them at an I2C clock.
+import struct
+
+WHO_AM_I = 0x75
+PWR_MGMT_1 = 0x6B
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+FIFO_EN = 0x23
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B
+USER_CTRL = 0x6A
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
+
+DATA_RDY = 0x01
+FIFO_OFLOW = 0x10
+FIFO_SIZE = 1024
+
+
+def pack(samples):
+    """Recording bytes from (ax, ay, az, temp, gx, gy, gz) tuples"""
+    return b''.join(struct.pack('>7h', *s) for s in samples)
+
+
+class MPU6050Device:
+    def __init__(self, recording, clock=None):
+        if not isinstance(recording, (bytes, bytearray)):
+            recording = pack(recording)
+        self.recording = bytes(recording)
+        self.count = len(self.recording) // 14
+        self.clock = clock
+        self.transfers = 0
+        self.bytes = 0
+        # Called with the sample index after each new sample, like the INT pin
+        self.on_sample = None
+        self.reset()
+
+    def reset(self):
+        self.regs = bytearray(128)
+        self.regs[WHO_AM_I] = 0x68
+        self.regs[PWR_MGMT_1] = 0x40          # asleep after power-on
+        self.fifo = bytearray()
+        self.produced = 0
+        self.started = self.clock() if self.clock else 0
+
+    def rate_hz(self):
+        base = 8000 if self.regs[CONFIG] & 7 in (0, 7) else 1000
+        return base / (self.regs[SMPLRT_DIV] + 1)
+
+    def sample(self, n):
+        """Recorded sample n as a 7-tuple"""
+        return struct.unpack_from('>7h', self.recording, n % self.count * 14)
+
+    def advance(self, n=1):
+        """Take n new samples"""
+        for _ in range(n):
+            offset = self.produced % self.count * 14
+            data = self.recording[offset:offset + 14]
+            self.regs[ACCEL_XOUT_H:ACCEL_XOUT_H + 14] = data
+            self.regs[INT_STATUS] |= DATA_RDY
+            if self.regs[USER_CTRL] & 0x40 and self.regs[FIFO_EN] & 0x78 == 0x78:
+                if len(self.fifo) + 12 > FIFO_SIZE:
+                    # The oldest data is dropped to make room
+                    del self.fifo[:12]
+                    self.regs[INT_STATUS] |= FIFO_OFLOW
+                self.fifo += data[:6] + data[8:]
+            self.produced += 1
+            if self.on_sample:
+                self.on_sample(self.produced - 1)
+
+    def sync(self):
+        if self.clock is None or self.regs[PWR_MGMT_1] & 0x40:
+            return
+        due = int((self.clock() - self.started) * self.rate_hz())
+        if due > self.produced:
+            self.advance(due - self.produced)
+
+    def writeto_mem(self, memaddr, buf):
+        self.sync()
+        self.transfers += 1
+        self.bytes += 2 + len(buf)
+        for i, value in enumerate(buf):
+            reg = memaddr + i
+            if reg == PWR_MGMT_1 and value & 0x80:
+                self.reset()
+                continue
+            if reg == USER_CTRL and value & 0x04:
+                self.fifo = bytearray()
+                value &= ~0x04
+            self.regs[reg] = value
+            if reg == PWR_MGMT_1 and self.clock:
+                self.started = self.clock() - self.produced / self.rate_hz()
+
+    def readfrom_mem_into(self, memaddr, buf):
+        self.sync()
+        self.transfers += 1
+        self.bytes += 3 + len(buf)
+        n = len(buf)
+        if memaddr == FIFO_R_W:
+            data = self.fifo[:n]
+            del self.fifo[:n]
+            buf[:len(data)] = data
+            return
+        if memaddr == FIFO_COUNTH:
+            self.regs[FIFO_COUNTH] = len(self.fifo) >> 8
+            self.regs[FIFO_COUNTH + 1] = len(self.fifo) & 0xff
+        buf[:] = self.regs[memaddr:memaddr + n]
+        if memaddr <= INT_STATUS < memaddr + n:
+            self.regs[INT_STATUS] = 0
+
+    def bus_us(self, freq=400000):
+        """Time the counted traffic takes on the bus: 9 clocks a byte"""
+        return self.bytes * 9 * 1000000 / freq
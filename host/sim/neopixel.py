@@ -0,0 +1,21 @@
+# neopixel.py -- host stand-in for MicroPython's neopixel module
+class NeoPixel:
+    # Total write() calls across all instances, for the benchmarks
+    writes = 0
+
+    def __init__(self, pin, n, bpp=3, timing=1):
+        self.pin = pin
+        self.n = n
+        self.pixels = [(0, 0, 0)] * n
+
+    def __setitem__(self, i, color):
+        self.pixels[i] = tuple(color)
+
+    def __getitem__(self, i):
+        return self.pixels[i]
+
+    def fill(self, color):
+        self.pixels = [tuple(color)] * self.n
+
+    def write(self):
+        NeoPixel.writes += 1
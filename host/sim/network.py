@@ -0,0 +1,124 @@
+# network.py -- host stand-in for MicroPython's network module
+#
+# WLAN keeps one state object per interface, like the firmware does, so every
+# network.WLAN(network.AP_IF) sees the same interface. Tests script behaviour
+# through the class attributes below.
+import time
+
+STA_IF = 0
+AP_IF = 1
+
+# Exactly the station statuses of the ESP32 port (v1.24), with its values,
+# so code using a name the device lacks fails here too
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_BEACON_TIMEOUT = 200
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+STAT_ASSOC_FAIL = 203
+STAT_HANDSHAKE_TIMEOUT = 204
+
+
+class WLAN:
+    # Seconds an interface takes to come up after active(True)
+    ap_start_delay = 0.0
+    # Seconds a successful connect() takes
+    connect_delay = 0.0
+    # Seconds scan() blocks for
+    scan_delay = 0.0
+    # Networks in range: (ssid, bssid, channel, rssi, authmode, hidden)
+    networks = [
+        (b'workshop', b'\x24\x0a\xc4\x00\x00\x01', 6, -48, 3, False),
+        (b'guest', b'\x24\x0a\xc4\x00\x00\x02', 11, -71, 0, False),
+    ]
+    # ssid -> password accepted by the simulated access points
+    passwords = {'workshop': 'balance123', 'guest': None}
+
+    _interfaces = {}
+
+    def __new__(cls, interface=STA_IF):
+        if interface not in cls._interfaces:
+            wlan = super().__new__(cls)
+            wlan._init(interface)
+            cls._interfaces[interface] = wlan
+        return cls._interfaces[interface]
+
+    @classmethod
+    def reset(cls):
+        """Forget all interface state (between harness runs)"""
+        cls._interfaces = {}
+
+    def _init(self, interface):
+        self.interface = interface
+        self._active = False
+        self._active_at = 0.0
+        self._config = {'essid': 'ESP32', 'channel': 1, 'mac': b'\x24\x0a\xc4\x12\x34\x56'}
+        self._status = STAT_IDLE
+        self._connected_at = None
+        self._ssid = None
+        self.scans = 0
+        self.connects = 0
+
+    def active(self, state=None):
+        if state is None:
+            return self._active and time.monotonic() >= self._active_at
+        if state and not self._active:
+            self._active_at = time.monotonic() + (self.ap_start_delay if self.interface == AP_IF else 0)
+        self._active = bool(state)
+        if not state:
+            self.disconnect()
+        return None
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config[args[0]]
+        self._config.update(kwargs)
+        return None
+
+    def ifconfig(self, config=None):
+        if self.interface == AP_IF:
+            return ('192.168.4.1', '255.255.255.0', '192.168.4.1', '8.8.8.8')
+        if self.isconnected():
+            return ('192.168.1.57', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+        return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+
+    def scan(self):
+        if not self._active:
+            raise OSError('STA must be active')
+        self.scans += 1
+        time.sleep(self.scan_delay)
+        return list(self.networks)
+
+    def connect(self, ssid=None, password=None, bssid=None):
+        if not self._active:
+            raise OSError('STA must be active')
+        self.connects += 1
+        self._ssid = ssid
+        known = [n for n in self.networks if n[0].decode() == ssid and (bssid is None or n[1] == bssid)]
+        if not known:
+            self._status = STAT_NO_AP_FOUND
+        elif self.passwords.get(ssid) != password:
+            self._status = STAT_WRONG_PASSWORD
+        else:
+            self._status = STAT_CONNECTING
+            self._connected_at = time.monotonic() + self.connect_delay
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+        self._connected_at = None
+
+    def status(self, param=None):
+        if param == 'rssi':
+            for n in self.networks:
+                if n[0].decode() == self._ssid:
+                    return n[3]
+            return -100
+        if self._status == STAT_CONNECTING and time.monotonic() >= self._connected_at:
+            self._status = STAT_GOT_IP
+        return self._status
+
+    def isconnected(self):
+        if self.interface == AP_IF:
+            return self._active
+        return self.status() == STAT_GOT_IP
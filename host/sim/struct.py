@@ -0,0 +1,6 @@
+# struct.py -- host stand-in for MicroPython's struct module
+#
+# MicroPython has only the module-level functions: no Struct class and no
+# iter_unpack. harness.install() puts this in place of CPython's struct for
+# the firmware, so code that reaches for either fails here as on the device.
+from _struct import calcsize, pack, pack_into, unpack, unpack_from
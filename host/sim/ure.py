@@ -0,0 +1,2 @@
+# ure.py -- host stand-in for MicroPython's ure module
+from re import *
@@ -0,0 +1,83 @@
+# udp_loopback.py -- firmware UDP sender against the host receiver on localhost
+#
+#   python host/udp_loopback.py [records] [drop every Nth packet]
+import sys
+import math
+import time
+
+import numpy as np
+
+import harness
+from udp_receiver import Receiver
+from udp_telemetry import UDPTelemetry
+
+
+class LossySocket:
+    """Wrap the sender's socket and silently drop every Nth datagram"""
+    def __init__(self, sock, every):
+        self.sock = sock
+        self.every = every
+        self.sent = 0
+        self.dropped = 0
+
+    def sendto(self, data, addr):
+        self.sent += 1
+        if self.every and self.sent % self.every == 0:
+            self.dropped += 1
+            return len(data)
+        return self.sock.sendto(data, addr)
+
+    def close(self):
+        self.sock.close()
+
+
+def simulated_loop(count, rate_hz=200):
+    """Records of a 200 Hz balance loop rocking about upright"""
+    for i in range(count):
+        t = i / rate_hz
+        angle = 3.0 * math.sin(2 * math.pi * 0.7 * t)
+        yield (int(t * 1e6) & 0xffffffff, angle, 13.2 * math.cos(2 * math.pi * 0.7 * t),
+               i * 7, -i * 7, angle * 40.0, 1800 + i % 200)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    drop_every = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+
+    receiver = Receiver(0, '127.0.0.1')
+    sender = UDPTelemetry('127.0.0.1', receiver.port)
+    lossy = sender.sock = LossySocket(sender.sock, drop_every)
+
+    expected = list(simulated_loop(count))
+    start = time.perf_counter()
+    for i, row in enumerate(expected):
+        sender.record(*row)
+        if i % 256 == 0:
+            receiver.poll(0)
+    sender.close()
+    pack_us = (time.perf_counter() - start) / count * 1e6
+    receiver.poll(0.2)
+    receiver.close()
+
+    records = receiver.records()
+    # Every record that arrived must decode exactly as it was packed
+    sent = np.array(expected, dtype=records.dtype)
+    arrived = np.isin(sent['t_us'], records['t_us'])
+    assert np.array_equal(sent[arrived], records), 'decoded records differ'
+    # A lost final datagram leaves no later sequence number to reveal it
+    tail = 1 if drop_every and lossy.sent % drop_every == 0 else 0
+    assert receiver.lost == lossy.dropped - tail, (receiver.lost, lossy.dropped)
+
+    harness.report('UDP telemetry loopback', [
+        ('records sent', count),
+        ('datagrams sent', lossy.sent),
+        ('datagrams dropped', lossy.dropped),
+        ('lost (from sequence gaps)', receiver.lost),
+        ('records received', len(records)),
+        ('record bytes', records.dtype.itemsize),
+        ('sender cost per record', f'{pack_us:.2f} us'),
+    ])
+
+
+if __name__ == '__main__':
+    main()
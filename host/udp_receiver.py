@@ -0,0 +1,106 @@
+# udp_receiver.py -- receive binary UDP telemetry into NumPy structured arrays
+#
+#   python host/udp_receiver.py [port] [seconds] [out.npy]
+import sys
+import socket
+import struct
+import time
+
+import numpy as np
+
+import harness
+
+harness.install('src')
+
+from udp_telemetry import HEADER, HEADER_SIZE, MAGIC, RECORD, RECORD_SIZE, VERSION  # noqa: E402
+
+DTYPE = np.dtype([
+    ('t_us', '<u4'),
+    ('angle', '<f4'),
+    ('rate', '<f4'),
+    ('left_steps', '<i4'),
+    ('right_steps', '<i4'),
+    ('command', '<f4'),
+    ('loop_us', '<u2'),
+])
+assert DTYPE.itemsize == RECORD_SIZE == struct.calcsize(RECORD)
+
+
+def decode(datagram):
+    """Return (sequence number, records) for one datagram"""
+    magic, version, count, seq = struct.unpack_from(HEADER, datagram)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not a telemetry datagram: magic {magic:#x} version {version}')
+    if len(datagram) < HEADER_SIZE + count * RECORD_SIZE:
+        raise ValueError(f'truncated datagram: {len(datagram)} bytes for {count} records')
+    return seq, np.frombuffer(datagram, DTYPE, count, HEADER_SIZE)
+
+
+class Receiver:
+    """Collect telemetry datagrams and count lost ones from sequence gaps"""
+    def __init__(self, port=5005, host='0.0.0.0'):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.chunks = []
+        self.packets = 0
+        self.lost = 0
+        self.invalid = 0
+        self.next_seq = None
+
+    def poll(self, timeout):
+        """Receive datagrams until none arrive for timeout seconds"""
+        self.sock.settimeout(timeout)
+        while True:
+            try:
+                datagram = self.sock.recv(2048)
+            except (socket.timeout, BlockingIOError):
+                return
+            self.feed(datagram)
+
+    def feed(self, datagram):
+        try:
+            seq, records = decode(datagram)
+        except (ValueError, struct.error):
+            self.invalid += 1
+            return
+        if self.next_seq is not None and seq != self.next_seq:
+            self.lost += (seq - self.next_seq) & 0xffffffff
+        self.next_seq = (seq + 1) & 0xffffffff
+        self.packets += 1
+        self.chunks.append(records)
+
+    def records(self):
+        """All records received so far as one structured array"""
+        if not self.chunks:
+            return np.zeros(0, DTYPE)
+        return np.concatenate(self.chunks)
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5005
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    out = sys.argv[3] if len(sys.argv) > 3 else None
+    receiver = Receiver(port)
+    print(f'Listening on UDP port {receiver.port} for {seconds:.0f} s')
+    end = time.time() + seconds
+    while time.time() < end:
+        receiver.poll(0.5)
+    records = receiver.records()
+    harness.report('UDP telemetry', [
+        ('packets', receiver.packets),
+        ('records', len(records)),
+        ('lost packets', receiver.lost),
+        ('invalid packets', receiver.invalid),
+    ])
+    if out:
+        np.save(out, records)
+        print(f'Saved {out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,539 @@
+# balance_control.py -- tilt estimation and control for the balancing robot
+#
+# Tilt is the pitch angle from the accelerometer's x and z axes, corrected
+# with the y gyro. The estimators run once per control tick with a fixed
+# period, so every coefficient that depends on it is worked out in the
+# constructor. The Kalman filter uses the gain its covariance converges to
+# for that period and noise model, which leaves a few multiply-adds per
+# update instead of the covariance arithmetic.
+#
+# On the ESP32 every float result is a new heap object. The Fixed* classes
+# work on the raw sensor counts in integers that stay below 2**30, which
+# MicroPython keeps as small ints, so an update allocates nothing. They
+# report the angle in millidegrees and the rate in millidegrees/s.
+#
+# PIDController turns the tilt into a wheel speed, in the same integers.
+#
+# BalanceController runs read -> estimate -> control -> drive at a fixed
+# period on a grid of release times, and keeps what each tick cost.
+import math
+import time
+from array import array
+
+try:
+  import metrics
+except ImportError:
+  metrics = None
+
+# What BalanceController does when a tick starts a period or more late
+SKIP = 0        # drop the missed ticks and stay on the period grid
+CATCH_UP = 1    # run the missed ticks back to back, at most max_burst at once
+
+STAGES = ('read', 'estimate', 'control', 'drive')
+
+# PIDController fixed point: gains in Q14 (Q18 for the integrator, which
+# is kept in output units), and the largest error it acts on
+GAIN_SHIFT = 14
+I_SHIFT = 18
+GAIN_MAX = 11000
+ERROR_MAX = 90000
+
+# Polynomial for atan(z), 0 <= z <= 1, in z*z; max error 1e-5 rad
+ATAN = (0.9998660, -0.3302995, 0.1801410, -0.0851330, 0.0208351)
+# The same in Q15 for the integer version
+ATAN_Q15 = tuple(round(c * 32768) for c in ATAN)
+
+
+def fast_atan2(y, x):
+  """math.atan2() to within 1e-5 rad, without the library call"""
+  ay = abs(y)
+  ax = abs(x)
+  if ax == ay == 0:
+      return 0.0
+  if ay > ax:
+      z = ax / ay
+  else:
+      z = ay / ax
+  z2 = z * z
+  c0, c1, c2, c3, c4 = ATAN
+  a = z * (c0 + z2 * (c1 + z2 * (c2 + z2 * (c3 + z2 * c4))))
+  if ay > ax:
+      a = math.pi / 2 - a
+  if x < 0:
+      a = math.pi - a
+  return -a if y < 0 else a
+
+
+def atan2_mdeg(y, x):
+  """atan2(y, x) in integer millidegrees, to within 0.01 degree
+
+  y and x are raw accelerometer counts (|value| < 2**15); no intermediate
+  reaches 2**30.
+  """
+  ay = y if y >= 0 else -y
+  ax = x if x >= 0 else -x
+  if ay == ax:
+      if not ax:
+          return 0
+      a = 45000
+  else:
+      # z = min / max in Q15, below 1 so z * z stays under 2**30
+      z = (ax << 15) // ay if ay > ax else (ay << 15) // ax
+      z2 = (z * z) >> 15
+      c0, c1, c2, c3, c4 = ATAN_Q15
+      p = c3 + ((z2 * c4) >> 15)
+      p = c2 + ((z2 * p) >> 15)
+      p = c1 + ((z2 * p) >> 15)
+      p = c0 + ((z2 * p) >> 15)
+      # Q30 radians to Q17, then to millidegrees: * 180000 / pi / 2**17
+      a = (((z * p) >> 13) * 7162 + 8192) >> 14
+  if ay > ax:
+      a = 90000 - a
+  if x < 0:
+      a = 180000 - a
+  return -a if y < 0 else a
+
+
+def kalman_gains(dt, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+  """Steady-state Kalman gains (angle, bias) for a tilt/gyro-bias filter
+
+  The state is the angle in degrees and the gyro bias in degrees/s, with
+  the angle predicted as angle + dt * (rate - bias) and measured by the
+  accelerometer. The covariance is iterated to convergence here, once.
+  """
+  p00 = p01 = p10 = p11 = 0.0
+  k0 = k1 = 0.0
+  for _ in range(10000):
+      p00 += dt * (dt * p11 - p01 - p10 + q_angle)
+      p01 -= dt * p11
+      p10 -= dt * p11
+      p11 += q_bias * dt
+      s = p00 + r_measure
+      n0 = p00 / s
+      n1 = p10 / s
+      p00, p01, p10, p11 = (p00 - n0 * p00, p01 - n0 * p01,
+                            p10 - n1 * p00, p11 - n1 * p01)
+      if abs(n0 - k0) < 1e-12 and abs(n1 - k1) < 1e-12:
+          break
+      k0, k1 = n0, n1
+  return n0, n1
+
+
+class ComplementaryFilter:
+  """Float complementary filter: gyro short term, accelerometer long term
+
+  alpha is the weight kept on the gyro-propagated angle each update.
+  update() takes raw counts and returns degrees.
+  """
+  def __init__(self, dt=0.005, alpha=0.98, gyro_lsb=131):
+      self.gyro_step = dt / gyro_lsb
+      self.alpha = alpha
+      self.angle = None
+
+  def update(self, ax, az, gy):
+      measured = math.degrees(fast_atan2(ax, az))
+      if self.angle is None:
+          self.angle = measured
+      else:
+          self.angle = self.alpha * (self.angle + gy * self.gyro_step) + (1 - self.alpha) * measured
+      return self.angle
+
+
+class KalmanFilter:
+  """Float 2-state (angle, gyro bias) Kalman filter with steady-state gains"""
+  def __init__(self, dt=0.005, gyro_lsb=131, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+      self.dt = dt
+      self.gyro_scale = 1 / gyro_lsb
+      self.k0, self.k1 = kalman_gains(dt, q_angle, q_bias, r_measure)
+      self.angle = None
+      self.bias = 0.0
+      self.rate = 0.0
+
+  def update(self, ax, az, gy):
+      measured = math.degrees(fast_atan2(ax, az))
+      self.rate = gy * self.gyro_scale - self.bias
+      if self.angle is None:
+          self.angle = measured
+          return measured
+      angle = self.angle + self.dt * self.rate
+      y = measured - angle
+      self.angle = angle + self.k0 * y
+      self.bias += self.k1 * y
+      return self.angle
+
+
+class FixedKalman:
+  """Integer Kalman filter; update() returns millidegrees
+
+  Internally the angle is kept in 1/256 mdeg and the gyro bias in 2**-20
+  mdeg per tick. The angle gain is quantised to 1/4096 and limited to 0.5
+  to keep products under 2**30.
+  """
+  def __init__(self, dt=0.005, gyro_lsb=131, q_angle=0.001, q_bias=0.003, r_measure=0.03,
+               gains=None):
+      k0, k1 = gains or kalman_gains(dt, q_angle, q_bias, r_measure)
+      self.k0 = round(min(k0, 0.5) * 4096)
+      # Bias (deg/s) += k1 * y (deg), as 2**-20 mdeg per tick per mdeg
+      self.k1 = round(k1 * dt * (1 << 20))
+      # Gyro counts -> 1/256 mdeg per tick, with as many fraction bits as fit
+      step = dt * 1000 / gyro_lsb * 256
+      self.g_shift = 0
+      while step * (2 << self.g_shift) < 32768:
+          self.g_shift += 1
+      self.g = round(step * (1 << self.g_shift))
+      # Gyro counts -> mdeg/s in Q8, and bias ticks -> seconds
+      self.r = round(1000 / gyro_lsb * 256)
+      self.per_s = round(1 / dt)
+      self.a = None
+      self.b = 0
+      self.angle = 0
+      self.rate = 0
+
+  def update(self, ax, az, gy):
+      measured = atan2_mdeg(ax, az)
+      b = self.b
+      self.rate = ((gy * self.r) >> 8) - (((b >> 8) * self.per_s) >> 12)
+      if self.a is None:
+          self.a = measured << 8
+      else:
+          a = self.a + ((gy * self.g) >> self.g_shift) - (b >> 12)
+          y = measured - (a >> 8)
+          self.a = a + ((y * self.k0) >> 4)
+          self.b = b + y * self.k1
+      self.angle = (self.a + 128) >> 8
+      return self.angle
+
+
+class FixedComplementary(FixedKalman):
+  """Integer complementary filter: the fixed Kalman update without the bias"""
+  def __init__(self, dt=0.005, alpha=0.98, gyro_lsb=131):
+      FixedKalman.__init__(self, dt, gyro_lsb, gains=(1 - alpha, 0.0))
+
+
+class PIDController:
+  """Integer PID from tilt (mdeg) and tilt rate (mdeg/s) to wheel steps/s
+
+  P and I act on the error, angle - setpoint. D acts on the measured rate
+  through a first-order low-pass at d_cutoff_hz, so a setpoint change
+  does not kick the output. The integrator is kept in output units, so a
+  new ki does not bump the output. It only integrates while the output is
+  not saturated in the direction the error pushes it (conditional
+  integration). The output is clamped to +-out_max.
+
+  Gains are in steps/s per degree, per degree-second and per degree/s.
+  set_gains() may run in the main loop between any two bytecodes of a
+  tick. It builds the new fixed-point gains first and publishes them as
+  one tuple, which update() picks up at its start. A tick therefore
+  always runs with one consistent set, without a lock. update()
+  allocates nothing.
+  """
+  def __init__(self, dt=0.005, kp=100.0, ki=50.0, kd=25.0, out_max=4000, d_cutoff_hz=20,
+               anti_windup=True):
+      self.dt = dt
+      self.out_max = out_max
+      self.i_max = min(out_max, (1 << (30 - I_SHIFT)) - 1) << I_SHIFT
+      tau = 1 / (2 * math.pi * d_cutoff_hz)
+      self.d_beta = round(dt / (tau + dt) * 1024)
+      self.anti_windup = anti_windup
+      self.setpoint = 0
+      self.gains = (0.0, 0.0, 0.0)
+      self.kp = self.ki = self.kd = 0
+      self.pending = None
+      self.set_gains(kp, ki, kd)
+      self.reset()
+
+  def set_gains(self, kp=None, ki=None, kd=None):
+      """Take new gains at the next tick; None keeps a gain as it is"""
+      current = (self.pending or (self.gains,))[0]
+      kp = current[0] if kp is None else float(kp)
+      ki = current[1] if ki is None else float(ki)
+      kd = current[2] if kd is None else float(kd)
+      # Per millidegree; capped so that the products with the largest error
+      # or rate stay small ints
+      kp_q = max(0, min(GAIN_MAX, round(kp * (1 << GAIN_SHIFT) / 1000)))
+      ki_q = max(0, min(GAIN_MAX, round(ki * self.dt * (1 << I_SHIFT) / 1000)))
+      kd_q = max(0, min(GAIN_MAX >> 2, round(kd * (1 << GAIN_SHIFT) / 1000)))
+      self.pending = ((kp, ki, kd), kp_q, ki_q, kd_q)
+
+  def reset(self):
+      """Clear the integrator and the derivative filter"""
+      self.i = 0
+      self.d = 0
+      self.output = 0
+
+  def update(self, angle, rate):
+      pending = self.pending
+      if pending is not None:
+          self.pending = None
+          self.gains = pending[0]
+          self.kp = pending[1]
+          self.ki = pending[2]
+          self.kd = pending[3]
+      e = angle - self.setpoint
+      if e > ERROR_MAX:
+          e = ERROR_MAX
+      elif e < -ERROR_MAX:
+          e = -ERROR_MAX
+      d = self.d + (((rate - self.d) * self.d_beta) >> 10)
+      self.d = d
+      pd = ((e * self.kp) >> GAIN_SHIFT) + ((d * self.kd) >> GAIN_SHIFT)
+      i = self.i
+      out = pd + (i >> I_SHIFT)
+      step = e * self.ki
+      if not self.anti_windup or not (
+              (out >= self.out_max and step > 0) or (out <= -self.out_max and step < 0)):
+          # Clamp before adding, so the sum never leaves the small int range
+          if step > 0:
+              i = self.i_max if i > self.i_max - step else i + step
+          elif step < 0:
+              i = -self.i_max if i < -self.i_max - step else i + step
+          self.i = i
+          out = pd + (i >> I_SHIFT)
+      if out > self.out_max:
+          out = self.out_max
+      elif out < -self.out_max:
+          out = -self.out_max
+      self.output = out
+      return out
+
+
+class BalanceController:
+  """Fixed-rate balance loop: IMU read, tilt estimate, controller, wheels
+
+  Ticks are released every period_us on a fixed grid, by a hardware timer
+  after start() or by calling run() from the main loop. ESP32 timer
+  callbacks are scheduled, not run in the interrupt, so run() goes in the
+  schedule queue and ticks also happen while the main loop waits in
+  select/poll. A tick that starts a whole period late is an overrun and
+  the policy decides what happens to the ticks it missed: SKIP or CATCH_UP.
+
+  controller.update(angle_mdeg, rate_mdps) returns the wheel speed in
+  steps/s. Driving is added on top, in steps/s: speed is the target
+  forward speed, which both wheels reach at ramp steps/s per tick. Only
+  the wheels' acceleration tips the robot, so a steady speed does not
+  upset the balance. turn() adds steer to one wheel and takes it from the
+  other for a while. Without a controller the loop only estimates and the
+  motors stay off. The motors run only after resume(). watchdog() disables them
+  when no tick has finished for watchdog_ms. run() calls it before each
+  tick, and the main loop should call it every pass.
+  Either way the loop then stays stalled until resume(). On the ESP32
+  timer callbacks are soft, so they wait in the same schedule queue as
+  the tick. A callback from there cannot notice a stall. If the whole
+  interpreter is stuck in one C call, neither runs. For that case start()
+  can also arm machine.WDT, fed by every tick. It resets the board, which
+  stops the step pulses.
+
+  With a sampler (imu.IMUSampler) the read stage takes the newest sample
+  the data-ready interrupt captured since the last tick instead of reading
+  the bus, so the sample's timing follows the sensor and not the tick. A
+  tick with no new sample reuses the last one and counts it in stale.
+
+  Per tick, the start lateness (negative if early) and each stage's time
+  in microseconds go into rings of the last `history` ticks (late and
+  stage_us; the latest is at (n - 1) % history), with running maxima in
+  max_late and stage_max. Nothing is allocated per tick.
+
+  telemetry gets a row every telemetry_every ticks for the web UI. udp, a
+  udp_telemetry.UDPTelemetry, gets a record every tick: t_us, angle and
+  rate in degrees, both wheel speeds, the controller output and the tick's
+  cost in us. Its two floats are then the only allocation per tick.
+  """
+  def __init__(self, sensor, motors, estimator=None, controller=None, period_us=5000,
+               overrun=SKIP, max_burst=2, watchdog_ms=50, history=256,
+               telemetry=None, telemetry_every=10, ramp=10, sampler=None, udp=None):
+      self.sensor = sensor
+      self.sampler = sampler
+      self.motors = motors
+      self.estimator = estimator or FixedKalman(period_us / 1000000, sensor.gyro_lsb)
+      self.controller = controller
+      self.period = period_us
+      self.overrun = overrun
+      self.max_burst = max_burst
+      self.watchdog_ms = watchdog_ms
+      self.telemetry = telemetry
+      self.telemetry_every = telemetry_every
+      self.udp = udp
+
+      self.sample = array('h', bytes(14))
+      self.history = history
+      self.late = array('i', bytes(4 * history))
+      self.stage_us = array('i', bytes(4 * 4 * history))
+      self.stage_max = array('i', bytes(4 * 4))
+      self.max_late = 0
+      self.n = 0
+      self.misses = 0
+      self.skipped = 0
+      self.stale = 0
+      self.trips = 0
+      self.stalled = False
+      self.command = 0
+      self.speed = 0
+      self.cruise = 0
+      self.ramp = ramp
+      self.steer = 0
+      self.steer_ticks = 0
+      self.release = None
+      self.last_start = 0
+      self.last_ms = time.ticks_ms()
+
+      # Bound once, so the timer callback allocates nothing
+      self.run_cb = self.run
+      self.timer = None
+      self.wdt = None
+
+  def start(self, timer_id=0, wdt_ms=0):
+      """Tick from a hardware timer; the main loop stays free for the network
+
+      With wdt_ms, also arm the hardware watchdog. It cannot be stopped
+      again, so the board resets once the ticks end, after stop() too.
+      """
+      from machine import Timer
+      self.timer = Timer(timer_id)
+      self.timer.init(mode=Timer.PERIODIC, period=max(1, self.period // 1000), callback=self.run_cb)
+      if wdt_ms:
+          from machine import WDT
+          self.wdt = WDT(timeout=wdt_ms)
+
+  def stop(self):
+      if self.timer:
+          self.timer.deinit()
+          self.timer = None
+      if self.sampler:
+          self.sampler.stop()
+      self.motors.disable()
+
+  def turn(self, steer, ms):
+      """Steer for ms, then go straight again; negative steer turns left"""
+      self.steer_ticks = max(1, ms * 1000 // self.period)
+      self.steer = steer
+
+  def halt(self):
+      """Bring the speed and steering to zero, the speed along the ramp"""
+      self.speed = 0
+      self.steer = 0
+      self.steer_ticks = 0
+
+  def resume(self):
+      """Arm the motors; after a watchdog trip too"""
+      self.stalled = False
+      self.last_ms = time.ticks_ms()
+      self.cruise = 0
+      if hasattr(self.controller, 'reset'):
+          self.controller.reset()
+      if self.controller:
+          self.motors.enable()
+
+  def watchdog(self):
+      """Disable the motors if no tick finished for watchdog_ms; interrupt-safe"""
+      if not self.stalled and time.ticks_diff(time.ticks_ms(), self.last_ms) > self.watchdog_ms:
+          self.stalled = True
+          self.trips += 1
+          self.motors.disable()
+          if metrics:
+              metrics.control_trips.inc()
+
+  def run(self, _=None):
+      """Run the tick if it is due, applying the overrun policy
+
+      Called with the timer. A timer event dropped because the schedule
+      queue was full shows up here as lateness against the grid.
+      """
+      # Before this tick refreshes last_ms: a stall shows up here first
+      self.watchdog()
+      now = time.ticks_us()
+      if self.release is None:
+          self.release = now
+      late = time.ticks_diff(now, self.release)
+      # A timer a little early still runs this tick; lateness is then negative
+      if late < -(self.period >> 1):
+          return False
+      if late >= self.period and self.overrun == SKIP:
+          missed = late // self.period
+          self.skipped += missed
+          if metrics:
+              metrics.control_skipped.inc(missed)
+          self.release = time.ticks_add(self.release, missed * self.period)
+          late -= missed * self.period
+      burst = self.max_burst if self.overrun == CATCH_UP else 1
+      while True:
+          self.tick(now, late)
+          self.release = time.ticks_add(self.release, self.period)
+          burst -= 1
+          if not burst:
+              return True
+          now = time.ticks_us()
+          late = time.ticks_diff(now, self.release)
+          if late < 0:
+              return True
+
+  def tick(self, t0, late):
+      """One pass of the pipeline, started late us after its release"""
+      s = self.sample
+      sampler = self.sampler
+      if sampler:
+          n = sampler.take()
+          if n:
+              data = sampler.batch_data
+              j = (n - 1) * 7
+              for k in range(7):
+                  s[k] = data[j + k]
+          else:
+              self.stale += 1
+      else:
+          self.sensor.read_into(s)
+      t1 = time.ticks_us()
+      estimator = self.estimator
+      angle = estimator.update(s[0], s[2], s[5])
+      t2 = time.ticks_us()
+      if self.controller and not self.stalled:
+          self.command = self.controller.update(angle, estimator.rate)
+      else:
+          self.command = 0
+      t3 = time.ticks_us()
+      if self.motors.enabled:
+          cruise = self.cruise
+          if cruise < self.speed:
+              cruise = min(cruise + self.ramp, self.speed)
+          elif cruise > self.speed:
+              cruise = max(cruise - self.ramp, self.speed)
+          self.cruise = cruise
+          if self.steer_ticks:
+              self.steer_ticks -= 1
+              if not self.steer_ticks:
+                  self.steer = 0
+          wheels = self.command + cruise
+          self.motors.drive(wheels + self.steer, wheels - self.steer)
+      t4 = time.ticks_us()
+
+      slot = self.n % self.history
+      self.late[slot] = late
+      if late > self.max_late:
+          self.max_late = late
+      i = slot * 4
+      stage_us = self.stage_us
+      stage_max = self.stage_max
+      stage_us[i] = time.ticks_diff(t1, t0)
+      stage_us[i + 1] = time.ticks_diff(t2, t1)
+      stage_us[i + 2] = time.ticks_diff(t3, t2)
+      stage_us[i + 3] = time.ticks_diff(t4, t3)
+      for k in range(4):
+          if stage_us[i + k] > stage_max[k]:
+              stage_max[k] = stage_us[i + k]
+      # The deadline is the next release
+      if late + time.ticks_diff(t4, t0) > self.period:
+          self.misses += 1
+          if metrics:
+              metrics.control_misses.inc()
+      if metrics and self.n:
+          metrics.loop_period.observe(time.ticks_diff(t0, self.last_start))
+      self.last_start = t0
+      self.n += 1
+      self.last_ms = time.ticks_ms()
+      if self.wdt:
+          self.wdt.feed()
+      if self.telemetry and self.n % self.telemetry_every == 0:
+          self.telemetry.push(angle / 1000, self.motors.left_sps, self.motors.right_sps,
+                              time.ticks_diff(t4, t0))
+      if self.udp:
+          self.udp.record(t0, angle / 1000, estimator.rate / 1000, self.motors.left_sps,
+                          self.motors.right_sps, self.command, time.ticks_diff(t4, t0))
@@ -0,0 +1,34 @@
+# boot_timeline.py -- when each boot phase finished, in microseconds
+#
+# main.py imports this first, so the clock starts before anything else is
+# loaded, and calls mark() as each phase completes. On the ESP32
+# time.ticks_us() counts from reset, so `start` itself is how long the
+# interpreter and boot.py took to get here. The timeline is served as JSON
+# on /boot.
+import time
+
+start = time.ticks_us()
+phases = []
+
+
+def mark(name):
+  """Record that phase name has just finished"""
+  phases.append((name, time.ticks_diff(time.ticks_us(), start)))
+
+
+def elapsed(name):
+  """Microseconds from start to the end of phase name, or None"""
+  for phase, at in phases:
+      if phase == name:
+          return at
+  return None
+
+
+def timeline():
+  """[(phase, us since start, us since the previous phase)]"""
+  rows = []
+  previous = 0
+  for phase, at in phases:
+      rows.append((phase, at, at - previous))
+      previous = at
+  return rows
@@ -0,0 +1,283 @@
+# imu.py -- MPU6050 accelerometer and gyro over I2C
+#
+# The balance loop needs a sample every 1-5 ms. One sample is the 14 data
+# registers from ACCEL_XOUT_H on: ax, ay, az, temperature, gx, gy, gz, each
+# a big-endian int16. read() gets all of them in one burst into a buffer
+# made once. read() decodes them with struct.unpack_from; read_into() and
+# read_fifo() decode the words in place into an array('h'), which allocates
+# no tuple per sample. With the FIFO enabled, read_fifo() drains every sample queued since the last call in a few bulk
+# transfers instead. Values stay in raw counts; accel_lsb and gyro_lsb give
+# the counts per g and per degree/s.
+#
+# The driver only calls readfrom_mem_into() and writeto_mem() on the bus it
+# is given, so a simulated device on the host can stand in for the sensor.
+#
+# IMUSampler takes samples off the sensor's data-ready interrupt instead of
+# the main loop: the ISR only timestamps and schedules the read, and the
+# read lands in a ring of typed arrays that the control code empties in
+# batches.
+import time
+import struct
+import micropython
+from array import array
+from micropython import const
+
+ADDRESS = const(0x68)
+
+SMPLRT_DIV = const(0x19)
+CONFIG = const(0x1A)
+GYRO_CONFIG = const(0x1B)
+ACCEL_CONFIG = const(0x1C)
+FIFO_EN = const(0x23)
+INT_PIN_CFG = const(0x37)
+INT_ENABLE = const(0x38)
+INT_STATUS = const(0x3A)
+ACCEL_XOUT_H = const(0x3B)
+USER_CTRL = const(0x6A)
+PWR_MGMT_1 = const(0x6B)
+FIFO_COUNTH = const(0x72)
+FIFO_R_W = const(0x74)
+WHO_AM_I = const(0x75)
+
+# INT_STATUS / INT_ENABLE bits
+DATA_RDY = const(0x01)
+FIFO_OFLOW = const(0x10)
+
+# Digital low-pass filter bandwidth in Hz -> CONFIG.DLPF_CFG
+DLPF = {260: 0, 184: 1, 94: 2, 44: 3, 21: 4, 10: 5, 5: 6}
+# Full scale -> (FS_SEL bits, counts per unit)
+ACCEL_RANGE = {2: (0, 16384), 4: (1, 8192), 8: (2, 4096), 16: (3, 2048)}
+GYRO_RANGE = {250: (0, 131), 500: (1, 65.5), 1000: (2, 32.8), 2000: (3, 16.4)}
+
+SAMPLE = '>7h'          # ax, ay, az, temp, gx, gy, gz
+SAMPLE_SIZE = const(14)
+FIFO_SAMPLE_SIZE = const(12)  # ax, ay, az, gx, gy, gz: accel and gyro, no temperature
+FIFO_SIZE = const(1024)
+
+
+def temperature(raw):
+  """Degrees C from the raw temperature count"""
+  return raw / 340 + 36.53
+
+
+class MPU6050:
+  """MPU6050 driver with burst and FIFO reads into preallocated buffers
+
+  rate_hz is the sensor's sample rate: the gyro output rate (1 kHz with the
+  low-pass filter on, 8 kHz without) divided by 1 + SMPLRT_DIV. dlpf_hz is
+  the filter bandwidth, or 0 to turn it off. fifo_batch is how many samples
+  one FIFO transfer may carry.
+  """
+  def __init__(self, i2c=None, address=ADDRESS, rate_hz=1000, dlpf_hz=184,
+               accel_g=2, gyro_dps=250, fifo=False, fifo_batch=16):
+      if i2c is None:
+          from machine import I2C, Pin
+          i2c = I2C(0, scl=Pin(22), sda=Pin(21), freq=400000)
+      self.i2c = i2c
+      self.address = address
+      self.buf = bytearray(SAMPLE_SIZE)
+      self.reg = bytearray(1)
+      self.count_buf = bytearray(2)
+      self.fifo_buf = bytearray(FIFO_SAMPLE_SIZE * fifo_batch)
+      self.fifo_view = memoryview(self.fifo_buf)
+      self.fifo = False
+      self.overflows = 0
+
+      if self.read_reg(WHO_AM_I) & 0x7E != ADDRESS:
+          raise OSError('no MPU6050 at 0x%02x' % address)
+      self.write_reg(PWR_MGMT_1, 0x80)            # reset
+      time.sleep_ms(100)
+      self.write_reg(PWR_MGMT_1, 0x01)            # wake, clock from the X gyro PLL
+      self.configure(rate_hz, dlpf_hz, accel_g, gyro_dps)
+      if fifo:
+          self.enable_fifo()
+
+  def read_reg(self, reg):
+      self.i2c.readfrom_mem_into(self.address, reg, self.reg)
+      return self.reg[0]
+
+  def write_reg(self, reg, value):
+      self.reg[0] = value
+      self.i2c.writeto_mem(self.address, reg, self.reg)
+
+  def configure(self, rate_hz=1000, dlpf_hz=184, accel_g=2, gyro_dps=250):
+      """Set the filter, sample rate and full-scale ranges"""
+      if dlpf_hz:
+          self.write_reg(CONFIG, DLPF[dlpf_hz])
+          base = 1000
+      else:
+          self.write_reg(CONFIG, 0)
+          base = 8000
+      divider = max(0, min(255, base // rate_hz - 1))
+      self.write_reg(SMPLRT_DIV, divider)
+      self.rate_hz = base // (divider + 1)
+      bits, self.accel_lsb = ACCEL_RANGE[accel_g]
+      self.write_reg(ACCEL_CONFIG, bits << 3)
+      bits, self.gyro_lsb = GYRO_RANGE[gyro_dps]
+      self.write_reg(GYRO_CONFIG, bits << 3)
+
+  def read(self):
+      """Latest sample as (ax, ay, az, temp, gx, gy, gz) in raw counts"""
+      self.i2c.readfrom_mem_into(self.address, ACCEL_XOUT_H, self.buf)
+      return struct.unpack_from(SAMPLE, self.buf)
+
+  def read_into(self, dest, index=0):
+      """Store the latest sample in dest[index:index + 7]; dest is an array('h')"""
+      buf = self.buf
+      self.i2c.readfrom_mem_into(self.address, ACCEL_XOUT_H, buf)
+      for k in range(0, SAMPLE_SIZE, 2):
+          v = buf[k] << 8 | buf[k + 1]
+          dest[index] = v - 0x10000 if v & 0x8000 else v
+          index += 1
+
+  def enable_data_ready(self):
+      """Pulse the INT pin high for 50 us on every new sample"""
+      self.write_reg(INT_PIN_CFG, 0x00)
+      self.write_reg(INT_ENABLE, self.read_reg(INT_ENABLE) | DATA_RDY)
+
+  def data_ready(self):
+      """True once a sample newer than the last INT_STATUS read is ready"""
+      return bool(self.read_reg(INT_STATUS) & DATA_RDY)
+
+  def enable_fifo(self):
+      """Queue accel and gyro samples (12 bytes each) in the sensor FIFO"""
+      self.write_reg(FIFO_EN, 0)
+      self.write_reg(USER_CTRL, 0x04)             # FIFO_RESET
+      self.write_reg(USER_CTRL, 0x40)             # FIFO_EN
+      self.write_reg(FIFO_EN, 0x78)               # XG, YG, ZG, ACCEL
+      self.write_reg(INT_ENABLE, self.read_reg(INT_ENABLE) | FIFO_OFLOW)
+      self.fifo = True
+
+  def disable_fifo(self):
+      self.write_reg(FIFO_EN, 0)
+      self.write_reg(USER_CTRL, 0)
+      self.fifo = False
+
+  def fifo_count(self):
+      """Bytes queued in the FIFO"""
+      self.i2c.readfrom_mem_into(self.address, FIFO_COUNTH, self.count_buf)
+      return self.count_buf[0] << 8 | self.count_buf[1]
+
+  def read_fifo(self, dest, max_samples=None):
+      """Drain queued samples into dest, an array('h') of 6 values per sample
+
+      Returns the number of samples stored. Samples that do not fit are left
+      in the FIFO for the next call. After an overflow the FIFO no longer
+      starts on a sample boundary, so it is reset and overflows counted.
+      """
+      if self.read_reg(INT_STATUS) & FIFO_OFLOW:
+          self.overflows += 1
+          self.write_reg(USER_CTRL, 0x44)         # FIFO_EN | FIFO_RESET
+          return 0
+      room = len(dest) // 6
+      if max_samples is not None and max_samples < room:
+          room = max_samples
+      queued = self.fifo_count() // FIFO_SAMPLE_SIZE
+      if queued > room:
+          queued = room
+      batch = len(self.fifo_buf) // FIFO_SAMPLE_SIZE
+      buf = self.fifo_buf
+      stored = 0
+      while stored < queued:
+          n = queued - stored
+          if n > batch:
+              n = batch
+          # A short slice of the view only for the last, partial batch
+          self.i2c.readfrom_mem_into(self.address, FIFO_R_W,
+                                     buf if n == batch else self.fifo_view[:n * FIFO_SAMPLE_SIZE])
+          i = stored * 6
+          for k in range(0, n * FIFO_SAMPLE_SIZE, 2):
+              v = buf[k] << 8 | buf[k + 1]
+              dest[i] = v - 0x10000 if v & 0x8000 else v
+              i += 1
+          stored += n
+      return stored
+
+
+class IMUSampler:
+  """Samples taken on the data-ready interrupt, kept in a ring buffer
+
+  The hard ISR records time.ticks_us() and schedules the read; it does not
+  allocate or touch the bus. The scheduled read decodes the sample into
+  the ring. A sample whose read was still pending when the next one came
+  is counted in missed; one overwritten in the ring before take() is
+  counted in overruns.
+
+  take() copies what was captured since the last call into batch_times
+  (ticks_us) and batch_data (7 raw values per sample, as MPU6050.read()),
+  returns the count, and sets lost to the samples lost since the last call.
+  """
+  def __init__(self, sensor, int_pin=4, size=32):
+      from machine import Pin
+      self.sensor = sensor
+      self.size = size
+      self.times = array('i', bytes(4 * size))
+      self.data = array('h', bytes(2 * 7 * size))
+      self.batch_times = array('i', bytes(4 * size))
+      self.batch_data = array('h', bytes(2 * 7 * size))
+      # Samples written and taken so far; the ring slot is the count % size
+      self.head = 0
+      self.tail = 0
+      self.stamp = 0
+      self.scheduled = False
+      self.missed = 0
+      self.overruns = 0
+      self.reported = 0
+      self.lost = 0
+      # Bound once: creating a bound method allocates, which an ISR must not
+      self.read_cb = self.read
+      self.isr_cb = self.isr
+      self.pin = Pin(int_pin, Pin.IN)
+      sensor.enable_data_ready()
+      self.pin.irq(handler=self.isr_cb, trigger=Pin.IRQ_RISING, hard=True)
+
+  def stop(self):
+      self.pin.irq(handler=None)
+
+  def isr(self, pin):
+      self.stamp = time.ticks_us()
+      if self.scheduled:
+          # The pending read will get this newer sample instead
+          self.missed += 1
+          return
+      self.scheduled = True
+      try:
+          micropython.schedule(self.read_cb, 0)
+      except RuntimeError:
+          self.scheduled = False
+          self.missed += 1
+
+  def read(self, _):
+      # Taken before the read, so an interrupt during it schedules its own
+      stamp = self.stamp
+      self.scheduled = False
+      slot = self.head % self.size
+      self.sensor.read_into(self.data, slot * 7)
+      self.times[slot] = stamp
+      self.head += 1
+
+  def take(self):
+      """Copy the captured samples into the batch arrays; returns the count"""
+      size = self.size
+      while True:
+          head = self.head
+          start = self.tail
+          if head - start > size:
+              start = head - size
+          n = head - start
+          for k in range(n):
+              i = (start + k) % size
+              self.batch_times[k] = self.times[i]
+              i *= 7
+              j = k * 7
+              for m in range(7):
+                  self.batch_data[j + m] = self.data[i + m]
+          # A read that ran during the copy may have reused the oldest slots
+          if self.head - size <= start:
+              break
+      self.overruns += start - self.tail
+      self.tail = head
+      total = self.overruns + self.missed
+      self.lost = total - self.reported
+      self.reported = total
+      return n
@@ -0,0 +1,202 @@
+# log.py -- deferred, levelled logging for the request and control paths
+#
+# print() over the UART blocks for about a millisecond per 11 characters at
+# 115200 baud and builds its f-string whether anyone reads it or not. Here a
+# call below the current level returns before touching its arguments, and
+# an enabled call only stores the format string and the argument tuple in a
+# preallocated ring. The text is built and written by drain(), which the main
+# loop calls when it has nothing better to do.
+#
+# The call itself still builds its argument tuple and whatever expressions
+# the arguments are, such as a slice. Hot-path debug calls therefore sit
+# under `if __debug__ and _log.enabled(log.DEBUG):`. The enabled() check
+# skips them at run time. MicroPython drops the whole block at compile time
+# with micropython.opt_level(1) or mpy-cross -O1, and CPython does with -O,
+# so a release build pays nothing for them.
+import sys
+import time
+from array import array
+from micropython import const
+
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+OFF = const(50)
+
+NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARN', ERROR: 'ERROR'}
+
+# Records below this level are discarded by the caller's Logger
+level = INFO
+
+
+class LogBuffer:
+  """Ring of pending records; the oldest is overwritten when full"""
+  def __init__(self, size=32):
+      self.size = size
+      self.levels = bytearray(size)
+      self.stamps = array('i', [0] * size)
+      self.names = [None] * size
+      self.formats = [None] * size
+      self.args = [None] * size
+      self.head = 0
+      self.count = 0
+      self.dropped = 0
+
+  def record(self, lvl, name, fmt, args):
+      i = self.head
+      self.levels[i] = lvl
+      self.stamps[i] = time.ticks_ms()
+      self.names[i] = name
+      self.formats[i] = fmt
+      self.args[i] = args
+      self.head = (i + 1) % self.size
+      if self.count < self.size:
+          self.count += 1
+      else:
+          self.dropped += 1
+
+  def pop(self):
+      """Format and remove the oldest record; returns None when empty"""
+      if not self.count:
+          return None
+      i = (self.head - self.count) % self.size
+      self.count -= 1
+      fmt = self.formats[i]
+      args = self.args[i]
+      self.formats[i] = self.args[i] = None
+      if args:
+          try:
+              fmt = fmt % args
+          except (TypeError, ValueError):
+              fmt = f"{fmt} {args!r}"
+      return f"{self.stamps[i]} {NAMES.get(self.levels[i], '?')} {self.names[i]}: {fmt}\n"
+
+
+class StreamSink:
+  """Write lines to a stream, by default whatever sys.stdout is at the time"""
+  def __init__(self, stream=None):
+      self.stream = stream
+
+  def write(self, line):
+      (self.stream or sys.stdout).write(line)
+
+
+class FileSink:
+  """Append lines to a file on flash, keeping one previous file"""
+  def __init__(self, path='log.txt', max_size=16384):
+      self.path = path
+      self.max_size = max_size
+      self.size = 0
+      self.file = open(path, 'a')
+
+  def write(self, line):
+      if self.size + len(line) > self.max_size:
+          import os
+          self.file.close()
+          try:
+              os.rename(self.path, self.path + '.1')
+          except OSError:
+              pass
+          self.file = open(self.path, 'w')
+          self.size = 0
+      self.file.write(line)
+      self.size += len(line)
+
+  def flush(self):
+      self.file.flush()
+
+
+class UDPSink:
+  """Send each line as a datagram to a host on the network"""
+  def __init__(self, host, port=5006):
+      import socket
+      self.addr = socket.getaddrinfo(host, port)[0][-1]
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+  def write(self, line):
+      try:
+          self.sock.sendto(line.encode(), self.addr)
+      except OSError:
+          pass
+
+
+buffer = LogBuffer()
+sinks = [StreamSink()]
+
+
+class Logger:
+  """Named source of records; arguments are only formatted when drained"""
+  def __init__(self, name):
+      self.name = name
+
+  def enabled(self, lvl):
+      """True if a record at lvl would be kept; guards costly arguments"""
+      return lvl >= level
+
+  def debug(self, fmt, *args):
+      if level <= DEBUG:
+          buffer.record(DEBUG, self.name, fmt, args)
+
+  def info(self, fmt, *args):
+      if level <= INFO:
+          buffer.record(INFO, self.name, fmt, args)
+
+  def warning(self, fmt, *args):
+      if level <= WARNING:
+          buffer.record(WARNING, self.name, fmt, args)
+
+  def error(self, fmt, *args):
+      if level <= ERROR:
+          buffer.record(ERROR, self.name, fmt, args)
+
+
+_loggers = {}
+
+
+def get_logger(name):
+  logger = _loggers.get(name)
+  if logger is None:
+      logger = _loggers[name] = Logger(name)
+  return logger
+
+
+def set_level(lvl):
+  global level
+  level = lvl
+
+
+def configure(lvl=INFO, size=32, outputs=None):
+  """Set the level, ring size and sinks, dropping anything still pending"""
+  global buffer, sinks
+  set_level(lvl)
+  buffer = LogBuffer(size)
+  if outputs is not None:
+      sinks = outputs
+
+
+def drain(limit=8):
+  """Write up to limit pending records to every sink; returns how many"""
+  written = 0
+  while written < limit:
+      line = buffer.pop()
+      if line is None:
+          break
+      for sink in sinks:
+          sink.write(line)
+      written += 1
+  if buffer.dropped and not buffer.count:
+      dropped = buffer.dropped
+      buffer.dropped = 0
+      for sink in sinks:
+          sink.write(f"{time.ticks_ms()} WARN log: {dropped} records dropped\n")
+  return written
+
+
+def flush():
+  """Drain everything, e.g. before a reset"""
+  while drain(32):
+      pass
+  for sink in sinks:
+      if hasattr(sink, 'flush'):
+          sink.flush()
@@ -1,29 +1,31 @@
 # main.py
 
+# First, so the boot timeline starts before anything else is loaded
+import boot_timeline
 import gc
 import network
 from config import *
-#from sensors.imu import IMU
-#from motors.motor_control import MotorController
-from web_server import WebServer
-from wifi_manager import WiFiManager
-#from control.balance_control import BalanceController
-from machine import Pin, I2C
-import neopixel
+import metrics
+import log
+from memory_manager import MemoryManager
+from wifi_manager import WiFiManager, STARTING, AP_UP, STA_UP, FAILED
+from command_mailbox import DRIVE, MODE, STOP, PID as PID_KIND
+from machine import Pin
+from status_led import StatusLED
 
+boot_timeline.mark('imports')
 
-def neopixel_led(r, g, b):
-    pin = Pin(16, Pin.OUT)
-    np = neopixel.NeoPixel(pin, 1)
-    np[0] = (r, g, b)
-    np.write()
+# Written from the main loop, between passes; the driver loads on first write
+indicator = StatusLED()
 
 led = Pin(2, Pin.OUT)
 
+_log = log.get_logger('main')
+
 
 
 def check_system_status():
-  """Print system status for debugging"""
+  """Print system status for debugging; from the REPL, it is not run at boot"""
   import os
   
   print("\n=== System Status ===")
@@ -31,8 +33,9 @@ def check_system_status():
   # Check files
   print("\nFiles on system:")
   files = os.listdir()
-  required_files = ['main.py', 'config.py', 'web_server.py', 'index.html', 'config.js', 
-                    'wifi_manager.py', 'motor_control.py', 'imu.py', 'balance_control.py']
+  required_files = ['main.py', 'boot_timeline.py', 'config.py', 'web_server.py', 'http_server.py', 'log.py', 'index.html', 'config.js', 
+                    'wifi_manager.py', 'profile_store.py', 'memory_manager.py', 'status_led.py', 'motor_control.py', 'imu.py', 'balance_control.py', 'config_cache.py',
+                    'metrics.py', 'telemetry.py', 'command_mailbox.py', 'udp_telemetry.py']
   for file in required_files:
       status = "OK" if file in files else "NOT FOUND"
       print(f"{status} {file}")
@@ -53,44 +56,198 @@ def check_system_status():
 
 
 
+def regenerate_js_config():
+  # Regenerate config.js only if config.py changed; the page reads /config.json
+  from config_cache import write_js_config_if_changed
+  if write_js_config_if_changed():
+      print("config.js regenerated")
+
+
+# How long one press of the left or right button turns the robot
+TURN_MS = 500
+
+# Control period; the IMU samples at the same rate
+PERIOD_US = 5000
+
+# MPU6050 INT pin, pulsed on every new sample
+IMU_INT_PIN = 4
+
+# Reset the board if no control tick has run for this long
+WDT_MS = 2000
+
+# Boot work nothing else waits for: run one per loop pass once the loop and
+# the AP are up, instead of before them
+DEFERRED = [regenerate_js_config]
+
+
+def network_changed(old, new):
+  """Report network transitions on the console and the status LED"""
+  if new == AP_UP and old == STARTING:
+      boot_timeline.mark('ap_up')
+      ap = network.WLAN(network.AP_IF)
+      print('\n=== WiFi Access Point Created ===')
+      print(f'1. Connect to WiFi network: "{NETWORK["AP"]["ssid"]}"')
+      print(f'2. Use password: "{NETWORK["AP"]["password"]}"')
+      print(f'3. Open browser and go to: http://{ap.ifconfig()[0]}')
+      print('================================\n')
+      indicator.show('ap_up')
+  elif new == STA_UP:
+      sta = network.WLAN(network.STA_IF)
+      print(f'Also reachable on the local network at http://{sta.ifconfig()[0]}')
+      indicator.show('sta_up')
+  elif new == FAILED:
+      print("WiFi access point failed to start")
+      indicator.show('failed')
+
+
+def start_balance(telemetry, udp=None):
+  """Start the control loop on its timers; None if there is no IMU"""
+  from imu import MPU6050, IMUSampler
+  from motor_control import MotorController
+  from balance_control import BalanceController, PIDController
+  try:
+      sensor = MPU6050(rate_hz=1000000 // PERIOD_US, dlpf_hz=44)
+  except OSError as e:
+      _log.error('No IMU, balancing disabled: %s', e)
+      return None
+  # One sample per tick, read on the sensor's data-ready interrupt
+  sampler = IMUSampler(sensor, int_pin=IMU_INT_PIN)
+  motors = MotorController()
+  pid = PIDController(PERIOD_US / 1000000, PID['kp']['default'], PID['ki']['default'],
+                      PID['kd']['default'], out_max=motors.max_sps)
+  balance = BalanceController(sensor, motors, controller=pid, period_us=PERIOD_US,
+                              telemetry=telemetry, sampler=sampler, udp=udp)
+  # The hardware watchdog resets the board if the ticks stop altogether,
+  # even in a stuck C call; it stays armed after balance.stop()
+  balance.start(wdt_ms=WDT_MS)
+  return balance
+
+
+def apply_commands(commands, balance, web_server=None):
+  """Hand what the web server queued to the control loop
+
+  Applied gains and modes become the defaults /config.json reports, so a
+  reloaded page shows them, and web_server drops its cached copy.
+  """
+  while True:
+      message = commands.poll()
+      if message is None:
+          return
+      kind, value, _ = message
+      if kind == STOP:
+          balance.halt()
+          if value == 'emergency':
+              balance.cruise = 0
+              balance.motors.disable()
+      elif kind == DRIVE:
+          if value == 'accelerate':
+              balance.speed = min(balance.speed + MOTOR['acceleration_step'], MOTOR['max_speed'])
+          elif value == 'decelerate':
+              balance.speed = max(balance.speed - MOTOR['acceleration_step'], MOTOR['min_speed'])
+          elif value == 'left':
+              balance.turn(-MOTOR['turn_difference'], TURN_MS)
+          elif value == 'right':
+              balance.turn(MOTOR['turn_difference'], TURN_MS)
+          else:
+              _log.warning('Unknown drive command %s', value)
+      elif kind == PID_KIND:
+          # Taken by the loop at its next tick
+          try:
+              balance.controller.set_gains(value.get('kp'), value.get('ki'), value.get('kd'))
+          except (AttributeError, TypeError, ValueError) as e:
+              _log.error('Bad PID update %s: %s', value, e)
+              continue
+          for name in PID:
+              if value.get(name) is not None:
+                  PID[name]['default'] = float(value[name])
+          if web_server:
+              web_server.config_changed()
+      elif kind == MODE:
+          # The web server only lets through modes this loop runs
+          if value == 'balance':
+              balance.resume()
+          MODES['default'] = value
+          if web_server:
+              web_server.config_changed()
+
+
 def main():
+  balance = None
   try:
       print("\nInitializing Robot Control System...")
       
-      # Generate configuration JavaScript file
-      print("Generating configuration files...")
-      write_js_config()
-      
       # Initialize WiFi manager with network configuration
       print("Starting WiFi manager...")
       wifi_manager = WiFiManager(NETWORK)
+      boot_timeline.mark('wifi_manager')
       
-      # Start access point
-      ap_ip = wifi_manager.init_ap()
-      print(f"Access Point started at {ap_ip}")
+      # Start access point; the banner is printed once it is up
+      wifi_manager.on_change(network_changed)
+      wifi_manager.start()
+      # Join a saved network too, in the background; the AP stays up
+      wifi_manager.keep_sta()
+      boot_timeline.mark('ap_started')
       
-      # Start web server
+      # Start web server without waiting for the network
       server_socket = wifi_manager.start_server()
+      boot_timeline.mark('server')
       print("Web server started")
       
       print("\nSystem Ready!")
       print("=" * 40)
       
-      # Main server loop
+      deferred = list(DEFERRED)
+      memory = MemoryManager()
+      # Every tick's record goes to the receiver in NETWORK['TELEMETRY'], if set
+      udp = None
+      udp_config = NETWORK.get('TELEMETRY')
+      if udp_config:
+          try:
+              udp = wifi_manager.start_udp_telemetry(udp_config['host'], udp_config.get('port', 5005),
+                                                     udp_config.get('sta_host'))
+          except OSError as e:
+              _log.error('UDP telemetry not started: %s', e)
+      # The control loop ticks from here on, from its own timer
+      balance = start_balance(wifi_manager.web_server.telemetry, udp)
+      commands = wifi_manager.web_server.commands
+      boot_timeline.mark('balance_ready')
+      metrics.boot_ready.set(boot_timeline.elapsed('balance_ready'))
+
+      # Main server loop: new clients and kept-alive connections
       while True:
-          gc.collect()  # Clean up memory
           try:
-              client, addr = server_socket.accept()
-              print(f'\nNew client connected from: {addr}')
-              wifi_manager.web_server.handle_request(client)
+              wifi_manager.poll()
+              wifi_manager.web_server.serve(0.1 if wifi_manager.state == STARTING or deferred else 1)
           except Exception as e:
-              print(f'Connection error: {e}')
+              _log.error('Connection error: %s', e)
+          if balance:
+              apply_commands(commands, balance, wifi_manager.web_server)
+              # Timer callbacks wait in the same queue as the ticks, so the
+              # stall check runs here
+              balance.watchdog()
+          if deferred and wifi_manager.state != STARTING:
+              task = deferred.pop(0)
+              try:
+                  task()
+              except Exception as e:
+                  _log.error('Deferred %s failed: %s', task.__name__, e)
+              if not deferred:
+                  boot_timeline.mark('deferred')
+          # Log output and the LED are written here, outside any request
+          log.drain()
+          indicator.tick()
+          # Collect only when enough has been allocated, and only in a
+          # pause that ends before the next control tick
+          memory.idle(balance.release if balance else None)
 
   except KeyboardInterrupt:
       print("\nShutdown requested...")
   except Exception as e:
       print(f'\nFatal error: {e}')
   finally:
+      if balance:
+          balance.stop()
+      log.flush()
       print("\nCleaning up...")
       try:
           wifi_manager.stop()
@@ -100,5 +257,4 @@ def main():
       print("System shutdown complete")
 
 if __name__ == '__main__':
-  check_system_status()
   main()
\ No newline at end of file
@@ -0,0 +1,157 @@
+# metrics.py
+import gc
+from array import array
+
+class Counter:
+  """Monotonically increasing value"""
+  kind = 'counter'
+
+  def __init__(self, name, help):
+      self.name = name
+      self.help = help
+      self.value = 0
+
+  def inc(self, n=1):
+      self.value += n
+
+  def render(self, out):
+      out.write(self.name.encode() + b' ')
+      out.write(str(self.value).encode())
+      out.write(b'\n')
+
+
+class Gauge(Counter):
+  """Value that is set, or read from a callback at scrape time"""
+  kind = 'gauge'
+
+  def __init__(self, name, help, fn=None):
+      super().__init__(name, help)
+      self.fn = fn
+
+  def set(self, value):
+      self.value = value
+
+  def render(self, out):
+      if self.fn:
+          self.value = self.fn()
+      super().render(out)
+
+
+class Histogram:
+  """Fixed-bucket histogram; observe() only touches preallocated arrays"""
+  kind = 'histogram'
+
+  def __init__(self, name, help, buckets):
+      self.name = name
+      self.help = help
+      self.buckets = array('i', buckets)
+      self.counts = array('I', [0] * (len(buckets) + 1))
+      self.sum = 0
+      self.count = 0
+      # Label prefixes are built once, at registration
+      self.lines = [f'{name}_bucket{{le="{b}"}} '.encode() for b in buckets]
+      self.lines.append(f'{name}_bucket{{le="+Inf"}} '.encode())
+
+  def observe(self, value):
+      i = 0
+      buckets = self.buckets
+      n = len(buckets)
+      while i < n and value > buckets[i]:
+          i += 1
+      self.counts[i] += 1
+      self.sum += value
+      self.count += 1
+
+  def render(self, out):
+      total = 0
+      for line, count in zip(self.lines, self.counts):
+          total += count
+          out.write(line)
+          out.write(str(total).encode())
+          out.write(b'\n')
+      out.write(f'{self.name}_sum {self.sum}\n{self.name}_count {self.count}\n'.encode())
+
+
+class Buffer:
+  """Reusable output buffer that metrics are rendered into"""
+  def __init__(self, size=2048):
+      self.data = bytearray(size)
+      self.view = memoryview(self.data)
+      self.pos = 0
+
+  def write(self, chunk):
+      end = self.pos + len(chunk)
+      if end > len(self.data):
+          # Grow once; later scrapes reuse the larger buffer
+          data = bytearray(max(end, 2 * len(self.data)))
+          data[:self.pos] = self.view[:self.pos]
+          self.data = data
+          self.view = memoryview(data)
+      self.view[self.pos:end] = chunk
+      self.pos = end
+
+  def getvalue(self):
+      return self.view[:self.pos]
+
+
+class Registry:
+  """Holds metrics and renders them in the Prometheus text format"""
+  def __init__(self):
+      self.metrics = []
+      self.headers = []
+      self.out = Buffer()
+
+  def register(self, metric):
+      self.metrics.append(metric)
+      self.headers.append(
+          f'# HELP {metric.name} {metric.help}\n# TYPE {metric.name} {metric.kind}\n'.encode())
+      return metric
+
+  def counter(self, name, help):
+      return self.register(Counter(name, help))
+
+  def gauge(self, name, help, fn=None):
+      return self.register(Gauge(name, help, fn))
+
+  def histogram(self, name, help, buckets):
+      return self.register(Histogram(name, help, buckets))
+
+  def render(self):
+      """Render every metric; the result is only valid until the next call"""
+      out = self.out
+      out.pos = 0
+      for header, metric in zip(self.headers, self.metrics):
+          out.write(header)
+          metric.render(out)
+      return out.getvalue()
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    'http_requests_total', 'HTTP requests handled')
+request_time = registry.histogram(
+    'http_request_duration_us', 'Time to handle one HTTP request',
+    (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 500000))
+rejected = registry.counter(
+    'http_rejected_total', 'Requests refused with 503 or 429')
+bytes_sent = registry.counter(
+    'http_response_bytes_total', 'Bytes written to HTTP clients')
+mem_free = registry.gauge(
+    'gc_mem_free_bytes', 'Free heap reported by gc.mem_free()', gc.mem_free)
+mem_low = registry.gauge(
+    'gc_mem_free_low_bytes', 'Lowest free heap seen after a collection')
+gc_pause = registry.histogram(
+    'gc_pause_us', 'Duration of gc.collect() calls',
+    (500, 1000, 2000, 5000, 10000, 20000, 50000))
+boot_ready = registry.gauge(
+    'boot_balance_ready_us', 'Time from main.py start to the first control loop pass')
+loop_period = registry.histogram(
+    'control_loop_period_us', 'Time between control loop ticks',
+    (4000, 4500, 4900, 5100, 5500, 6000, 8000, 10000, 20000))
+control_misses = registry.counter(
+    'control_deadline_misses_total', 'Control ticks that finished after their deadline')
+control_skipped = registry.counter(
+    'control_skipped_ticks_total', 'Control ticks dropped after an overrun')
+control_trips = registry.counter(
+    'control_watchdog_trips_total', 'Times the control watchdog disabled the motors')
@@ -0,0 +1,57 @@
+# motor_control.py -- the two wheel steppers
+#
+# Step pulses come from the LEDC PWM hardware at the commanded rate, so no
+# interrupt or Python code runs per step and setting a speed is one call.
+# The drivers share an active-low enable pin; disable() releases both
+# motors and is safe to call from an interrupt handler.
+from machine import Pin, PWM
+
+
+class MotorController:
+  """Speed control for the left and right wheel steppers, in steps/s"""
+  def __init__(self, left_step=19, left_dir=18, right_step=25, right_dir=26, enable=27,
+               max_sps=4000, invert_right=True):
+      self.left_dir = Pin(left_dir, Pin.OUT)
+      self.right_dir = Pin(right_dir, Pin.OUT)
+      self.left = PWM(Pin(left_step, Pin.OUT), freq=1000, duty_u16=0)
+      self.right = PWM(Pin(right_step, Pin.OUT), freq=1000, duty_u16=0)
+      self.en = Pin(enable, Pin.OUT, value=1)
+      self.max_sps = max_sps
+      self.invert_right = invert_right
+      self.left_sps = 0
+      self.right_sps = 0
+      self.enabled = False
+
+  def enable(self):
+      self.en.value(0)
+      self.enabled = True
+
+  def disable(self):
+      """Stop stepping and release the motors"""
+      self.en.value(1)
+      self.enabled = False
+      self.left.duty_u16(0)
+      self.right.duty_u16(0)
+      self.left_sps = self.right_sps = 0
+
+  def set_speed(self, pwm, dir_pin, sps, invert):
+      if sps > self.max_sps:
+          sps = self.max_sps
+      elif sps < -self.max_sps:
+          sps = -self.max_sps
+      dir_pin.value((sps < 0) ^ invert)
+      if sps == 0:
+          pwm.duty_u16(0)
+      else:
+          pwm.freq(sps if sps > 0 else -sps)
+          pwm.duty_u16(32768)
+      return sps
+
+  def drive(self, left_sps, right_sps):
+      """Set both wheel speeds; ignored while the motors are disabled"""
+      if not self.enabled:
+          return
+      if left_sps != self.left_sps:
+          self.left_sps = self.set_speed(self.left, self.left_dir, left_sps, False)
+      if right_sps != self.right_sps:
+          self.right_sps = self.set_speed(self.right, self.right_dir, right_sps, self.invert_right)
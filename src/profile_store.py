@@ -0,0 +1,141 @@
+# profile_store.py -- saved WiFi networks in a small append-only binary file
+#
+# The old wifi.dat held "ssid;password" lines that were re-read and split on
+# every lookup and rewritten whole on every change, and an SSID containing
+# ';' broke it. Here the file is read once into a dict. A change appends one
+# record:
+#
+#   kind (1 set, 0 delete) | len(ssid) | len(password) | ssid | password | crc32
+#
+# The lengths are single bytes (WiFi allows 32-byte SSIDs and 64-byte keys).
+# A record whose checksum does not match, e.g. the tail of a write cut short
+# by a reset, ends the load, and the file is rewritten without it. Superseded
+# records are dropped by compact(), which runs once more than compact_after
+# of them have piled up.
+import os
+import struct
+from binascii import crc32
+
+MAGIC = b'WPF1'
+SET = 1
+DELETE = 0
+
+# MicroPython's struct has no Struct class: format strings and their sizes
+_HEADER = '<BBB'
+_HEADER_SIZE = struct.calcsize(_HEADER)
+_CRC = '<I'
+_CRC_SIZE = struct.calcsize(_CRC)
+
+
+class ProfileStore:
+  """ssid -> password, loaded once, with O(1) lookups and appended updates"""
+  def __init__(self, path='wifi.dat', compact_after=16):
+      self.path = path
+      self.compact_after = compact_after
+      self.profiles = {}
+      self.records = 0
+      self.load()
+
+  def load(self):
+      try:
+          with open(self.path, 'rb') as f:
+              data = f.read()
+      except OSError:
+          return
+      if data[:4] != MAGIC:
+          # Text file from before: one "ssid;password" per line
+          for line in data.decode().split('\n'):
+              ssid, sep, password = line.partition(';')
+              if sep:
+                  self.profiles[ssid] = password
+          self.compact()
+          return
+      view = memoryview(data)
+      profiles = self.profiles
+      pos = 4
+      end = len(data)
+      while pos + _HEADER_SIZE <= end:
+          kind = data[pos]
+          start = pos + _HEADER_SIZE
+          middle = start + data[pos + 1]
+          stop = middle + data[pos + 2]
+          if stop + _CRC_SIZE > end or struct.unpack_from(_CRC, data, stop)[0] != crc32(view[pos:stop]):
+              break
+          ssid = str(data[start:middle], 'utf-8')
+          if kind == SET:
+              profiles[ssid] = str(data[middle:stop], 'utf-8')
+          else:
+              profiles.pop(ssid, None)
+          self.records += 1
+          pos = stop + _CRC_SIZE
+      if pos != end:
+          # Torn or corrupt tail: keep what was read and start a clean file
+          self.compact()
+
+  def get(self, ssid, default=None):
+      return self.profiles.get(ssid, default)
+
+  def __contains__(self, ssid):
+      return ssid in self.profiles
+
+  def __getitem__(self, ssid):
+      return self.profiles[ssid]
+
+  def __len__(self):
+      return len(self.profiles)
+
+  def items(self):
+      return self.profiles.items()
+
+  def set(self, ssid, password):
+      password = password or ''
+      if self.profiles.get(ssid) == password:
+          return
+      self.profiles[ssid] = password
+      self.append(SET, ssid, password)
+
+  def delete(self, ssid):
+      if ssid in self.profiles:
+          del self.profiles[ssid]
+          self.append(DELETE, ssid, '')
+
+  def append(self, kind, ssid, password):
+      if self.records == 0 and not self.exists():
+          self.compact()
+          return
+      with open(self.path, 'ab') as f:
+          f.write(self.record(kind, ssid, password))
+      self.records += 1
+      if self.records - len(self.profiles) > self.compact_after:
+          self.compact()
+
+  def exists(self):
+      try:
+          os.stat(self.path)
+          return True
+      except OSError:
+          return False
+
+  @staticmethod
+  def record(kind, ssid, password):
+      ssid = ssid.encode()
+      password = password.encode()
+      if len(ssid) > 255 or len(password) > 255:
+          raise ValueError('SSID or password too long')
+      body = struct.pack(_HEADER, kind, len(ssid), len(password)) + ssid + password
+      return body + struct.pack(_CRC, crc32(body))
+
+  def compact(self):
+      """Rewrite the file with one record per saved network"""
+      tmp = self.path + '.tmp'
+      with open(tmp, 'wb') as f:
+          f.write(MAGIC)
+          for ssid, password in self.profiles.items():
+              f.write(self.record(SET, ssid, password))
+      try:
+          os.rename(tmp, self.path)
+      except OSError:
+          # FAT will not rename over an existing file
+          os.remove(self.path)
+          os.rename(tmp, self.path)
+      self.records = len(self.profiles)
@@ -0,0 +1,48 @@
+# telemetry.py
+import time
+from array import array
+
+FIELDS = ('tilt', 'left_speed', 'right_speed', 'loop_us')
+
+class TelemetryBuffer:
+  """Ring buffer of telemetry snapshots: one producer, any number of readers
+
+  The producer only writes into preallocated arrays and bumps a sequence
+  number, so its cost does not depend on who is reading. Each reader keeps
+  its own cursor; a reader that falls more than a buffer behind skips the
+  overwritten snapshots and is told how many it missed.
+  """
+  def __init__(self, size=32):
+      self.size = size
+      self.seq = 0
+      self.stamps = array('i', [0] * size)
+      self.values = array('f', [0.0] * (size * len(FIELDS)))
+
+  def push(self, tilt, left_speed, right_speed, loop_us):
+      """Record one snapshot (called from the control loop)"""
+      slot = self.seq % self.size
+      base = slot * 4
+      values = self.values
+      values[base] = tilt
+      values[base + 1] = left_speed
+      values[base + 2] = right_speed
+      values[base + 3] = loop_us
+      self.stamps[slot] = time.ticks_ms()
+      self.seq += 1
+
+  def oldest(self):
+      """Sequence number of the oldest snapshot that is safe to read"""
+      # Keep one slot of margin for a push that lands mid-read
+      return max(0, self.seq - self.size + 1)
+
+  def format(self, start, end):
+      """Render snapshots [start, end) as a JSON array of rows"""
+      rows = []
+      values = self.values
+      for seq in range(start, end):
+          slot = seq % self.size
+          base = slot * 4
+          rows.append('[%d,%.3f,%.1f,%.1f,%d]' % (
+              self.stamps[slot], values[base], values[base + 1],
+              values[base + 2], values[base + 3]))
+      return '[' + ','.join(rows) + ']'
@@ -0,0 +1,61 @@
+# udp_telemetry.py
+import socket
+import struct
+
+# Datagram: header followed by up to N fixed-layout records, little endian
+MAGIC = 0x5442
+VERSION = 1
+HEADER = '<HBBI'        # magic, version, record count, sequence number
+RECORD = '<IffiifH'     # t_us, angle, rate, left_steps, right_steps, command, loop_us
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD_SIZE = struct.calcsize(RECORD)
+MAX_RECORDS = (1472 - HEADER_SIZE) // RECORD_SIZE  # one unfragmented datagram
+
+class UDPTelemetry:
+  """Batch balance-loop records into binary UDP datagrams
+
+  Records are packed straight into one reusable datagram buffer; nothing is
+  allocated per record. Every datagram carries a sequence number so the
+  receiver can count lost packets.
+  """
+  def __init__(self, host, port=5005, records_per_packet=32):
+      self.addr = socket.getaddrinfo(host, port)[0][-1]
+      self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+      self.sock.setblocking(False)
+
+      self.capacity = min(records_per_packet, MAX_RECORDS)
+      self.buffer = bytearray(HEADER_SIZE + self.capacity * RECORD_SIZE)
+      self.view = memoryview(self.buffer)
+      self.count = 0
+      self.seq = 0
+      self.errors = 0
+
+  def record(self, t_us, angle, rate, left_steps, right_steps, command, loop_us):
+      """Append one record, sending the datagram once it is full"""
+      struct.pack_into(RECORD, self.buffer, HEADER_SIZE + self.count * RECORD_SIZE,
+                       t_us, angle, rate, left_steps, right_steps, command,
+                       loop_us if loop_us < 0xffff else 0xffff)
+      self.count += 1
+      if self.count == self.capacity:
+          self.flush()
+
+  def flush(self):
+      """Send the records collected so far"""
+      if not self.count:
+          return
+      struct.pack_into(HEADER, self.buffer, 0, MAGIC, VERSION, self.count, self.seq)
+      try:
+          if self.count == self.capacity:
+              self.sock.sendto(self.buffer, self.addr)
+          else:
+              self.sock.sendto(self.view[:HEADER_SIZE + self.count * RECORD_SIZE], self.addr)
+      except OSError:
+          # Dropped datagram; the sequence gap tells the receiver
+          self.errors += 1
+      self.seq = (self.seq + 1) & 0xffffffff
+      self.count = 0
+
+  def close(self):
+      """Send what is left and close the socket"""
+      self.flush()
+      self.sock.close()
@@ -1,187 +1,246 @@
 # web_server.py
-import socket
+import errno
 import json
-import ure
-
-class WebServer:
-  def __init__(self, config):
-      self.config = config
-      self.server_socket = None
-      self.routes = {
-          '': self.handle_root,
-          'command': self.handle_command,
-          'pid': self.handle_pid_update,
-          'mode': self.handle_mode_change
-      }
-
-  def start(self):
-      """Start the web server"""
-      addr = socket.getaddrinfo('0.0.0.0', self.config['port'])[0][-1]
-      
-      if self.server_socket:
-          self.server_socket.close()
-      
-      self.server_socket = socket.socket()
-      self.server_socket.bind(addr)
-      self.server_socket.listen(1)
-      
-      print(f'Web server started on port {self.config["port"]}')
-      return self.server_socket
-
-  def handle_request(self, client_socket):
-      """Handle incoming client requests"""
-      try:
-          client_socket.settimeout(self.config['timeout'])
-
-          request = b""
-          try:
-              while b"\r\n\r\n" not in request:
-                  request += client_socket.recv(512)
-          except OSError:
-              print("Timeout waiting for complete headers")
-              return
-
-          try:
-              request += client_socket.recv(1024)
-              print("Received additional form data")
-          except OSError:
-              pass
-
-          request_str = request.decode('utf-8')
-          print(f"Received request: {request_str[:100]}...")
-
-          if "HTTP" not in request_str:
-              print("Invalid request - no HTTP")
-              return
-
-          # Parse URL
-          url = self.parse_url(request_str)
-          if url is None:
-              self.handle_not_found(client_socket, "Invalid URL")
-              return
-
-          # Route to appropriate handler
-          handler = self.routes.get(url.split('/')[0], self.handle_not_found)
-          handler(client_socket, request_str)
-
-      except Exception as e:
-          print(f"Error handling request: {str(e)}")
-          self.send_error_response(client_socket, 500, f"Internal error: {str(e)}")
-      finally:
-          try:
-              client_socket.close()
-          except:
-              pass
-
-  def parse_url(self, request_str):
-      """Parse URL from request string"""
-      try:
-          url_match = ure.search("(?:GET|POST) /(.*?)(?:\\?.*?)? HTTP", request_str)
-          if url_match:
-              try:
-                  return url_match.group(1).decode("utf-8").rstrip("/")
-              except AttributeError:
-                  return url_match.group(1).rstrip("/")
-      except Exception as e:
-          print(f"Error parsing URL: {e}")
-      return None
+import time
+import log
+import metrics
+import boot_timeline
+from http_server import HTTPServer
+from telemetry import TelemetryBuffer, FIELDS
+from command_mailbox import CommandMailbox, DRIVE, PID, MODE
+from config import PID as PID_RANGES
+
+_log = log.get_logger('web')
+
+# Modes the control loop implements; the UI may offer more
+SUPPORTED_MODES = ('balance',)
+
+
+def pid_error(values):
+  """Why values is not a valid PID update, or None if it is"""
+  if not isinstance(values, dict) or not values:
+      return "Expected an object with kp, ki or kd"
+  for name, value in values.items():
+      limits = PID_RANGES.get(name)
+      if limits is None:
+          return f"Unknown PID parameter {name}"
+      if isinstance(value, bool) or not isinstance(value, (int, float)):
+          return f"{name} must be a number"
+      if not limits['min'] <= value <= limits['max']:
+          return f"{name} must be between {limits['min']} and {limits['max']}"
+  return None
+
+
+class WebServer(HTTPServer):
+  """Robot control server: UI, commands, telemetry stream and metrics"""
+  def __init__(self, config, telemetry=None, commands=None):
+      super().__init__(config)
+      # Commands for the control loop, which polls this each tick
+      self.commands = commands or CommandMailbox()
+      self._config_cache = None
+      self.config_headers = (None, b"")
+      self.route('GET', '', self.handle_root)
+      self.route('GET', 'config.json', self.handle_config)
+      self.route('GET', 'command', self.handle_command)
+      self.route('POST', 'pid', self.handle_pid_update)
+      self.route('GET', 'mode', self.handle_mode_change)
+      self.route('GET', 'events', self.handle_events)
+      self.route('GET', 'metrics', self.handle_metrics)
+      self.route('GET', 'boot', self.handle_boot)
+
+      # Server-Sent Events: socket -> [next sequence number, unsent bytes, frames dropped]
+      self.telemetry = telemetry or TelemetryBuffer(config.get('telemetry_size', 32))
+      self.subscribers = {}
+      self.events_interval = config.get('events_interval_ms', 200)
+      self.max_subscribers = config.get('max_event_clients', 2)
+      self.last_publish = time.ticks_ms()
+
+  def sockets(self):
+      """Client connections plus the event streams"""
+      sockets = super().sockets()
+      sockets.extend(self.subscribers)
+      return sockets
+
+  def serve(self, timeout=1):
+      """Serve HTTP, then push telemetry to any event streams"""
+      if self.subscribers:
+          timeout = min(timeout, self.events_interval / 1000)
+      super().serve(timeout)
+      self.publish_events()
+
+  def readable(self, sock):
+      """Only event streams are watched outside the core"""
+      if sock in self.subscribers:
+          self.check_subscriber(sock)
+
+  def close_connection(self, client_socket):
+      """Forget and close a client socket or event stream"""
+      self.subscribers.pop(client_socket, None)
+      super().close_connection(client_socket)
+
+  @property
+  def config_cache(self):
+      """/config.json cache; config_cache is imported on the first request"""
+      if self._config_cache is None:
+          from config_cache import ConfigCache
+          self._config_cache = ConfigCache()
+      return self._config_cache
+
+  def config_changed(self):
+      """Drop the cached /config.json after a PID or mode change"""
+      if self._config_cache:
+          self._config_cache.invalidate()
 
   def handle_root(self, client, request):
       """Serve the main HTML page"""
-      try:
-          with open('index.html', 'r') as f:
-              content = f.read()
-          response = "HTTP/1.1 200 OK\r\n"
-          response += "Content-Type: text/html\r\n\r\n"
-          response += content
-          client.send(response.encode())
-      except Exception as e:
-          print(f"Error serving root page: {e}")
-          self.send_error_response(client, 500, "Error serving page")
+      self.send_file(client, 'index.html')
+
+  def handle_config(self, client, request):
+      """Serve the cached PID/mode/motor configuration as JSON"""
+      body, etag = self.config_cache.get()
+      if self.config_headers[0] != etag:
+          self.config_headers = (etag, f"ETag: {etag}\r\nCache-Control: no-cache\r\n".encode())
+      headers = self.config_headers[1]
+      if request.header('if-none-match') == etag:
+          self.send_response(client, 304, b"", "application/json", headers)
+      else:
+          self.send_response(client, 200, body, "application/json", headers)
 
   def handle_command(self, client, request):
       """Handle robot commands"""
       try:
-          cmd_match = ure.search("cmd=([^&]*)", request)
-          if cmd_match:
-              cmd = cmd_match.group(1)
-              print(f"Received command: {cmd}")
-              
-              response = "HTTP/1.1 200 OK\r\n"
-              response += "Content-Type: text/plain\r\n\r\n"
-              response += f"Command {cmd} processed"
+          cmd = request.query.get('cmd')
+          if cmd:
+              if __debug__ and _log.enabled(log.DEBUG):
+                  _log.debug('Command %s', cmd)
+              self.commands.post(DRIVE, cmd)
+              self.send_response(client, 200, f"Command {cmd} processed")
           else:
-              response = "HTTP/1.1 400 Bad Request\r\n\r\n"
-              response += "Invalid command format"
-          
-          client.send(response.encode())
+              self.send_response(client, 400, "Invalid command format")
       except Exception as e:
-          print(f"Error handling command: {e}")
+          _log.error('Error handling command: %s', e)
           self.send_error_response(client, 500, "Error processing command")
 
   def handle_pid_update(self, client, request):
       """Handle PID updates"""
       try:
-          body_start = request.find('\r\n\r\n') + 4
-          body = request[body_start:]
-          
           try:
-              pid_values = json.loads(body)
-              print(f"Updating PID values: {pid_values}")
-              
-              response = "HTTP/1.1 200 OK\r\n"
-              response += "Content-Type: text/plain\r\n\r\n"
-              response += "PID values updated"
-          except json.JSONDecodeError:
-              response = "HTTP/1.1 400 Bad Request\r\n\r\n"
-              response += "Invalid JSON data"
-              
-          client.send(response.encode())
+              pid_values = json.loads(request.body)
+              error = pid_error(pid_values)
+              if error:
+                  self.send_response(client, 400, error)
+                  return
+              _log.info('PID update %s', pid_values)
+              self.commands.post(PID, pid_values)
+              self.send_response(client, 200, "PID values updated")
+          except ValueError:
+              self.send_response(client, 400, "Invalid JSON data")
       except Exception as e:
-          print(f"Error updating PID: {e}")
+          _log.error('Error updating PID: %s', e)
           self.send_error_response(client, 500, "Error updating PID values")
 
   def handle_mode_change(self, client, request):
       """Handle mode changes"""
       try:
-          mode_match = ure.search("set=([^&]*)", request)
-          if mode_match:
-              mode = mode_match.group(1)
-              print(f"Mode change requested: {mode}")
-              response = "HTTP/1.1 200 OK\r\n"
-              response += "Content-Type: text/plain\r\n\r\n"
-              response += f"Mode changed to {mode}"
+          mode = request.query.get('set')
+          if mode and mode not in SUPPORTED_MODES:
+              self.send_response(client, 400, f"Mode {mode} is not supported")
+          elif mode:
+              _log.info('Mode change to %s', mode)
+              self.commands.post(MODE, mode)
+              self.send_response(client, 200, f"Mode changed to {mode}")
           else:
-              response = "HTTP/1.1 400 Bad Request\r\n\r\n"
-              response += "Invalid mode format"
-              
-          client.send(response.encode())
+              self.send_response(client, 400, "Invalid mode format")
       except Exception as e:
-          print(f"Error changing mode: {e}")
+          _log.error('Error changing mode: %s', e)
           self.send_error_response(client, 500, "Error changing mode")
 
-  def handle_not_found(self, client, url):
-      """Handle 404 Not Found"""
-      response = "HTTP/1.1 404 Not Found\r\n"
-      response += "Content-Type: text/plain\r\n\r\n"
-      response += f"Path '{url}' not found"
+  def handle_events(self, client, request):
+      """Turn the connection into a Server-Sent Events telemetry stream
+
+      Each event carries the rows since the previous one and an id equal to
+      the sequence number after the last row, so a viewer can tell how many
+      snapshots it missed from the gap between ids.
+      """
+      self.keep_alive = False
+      if len(self.subscribers) >= self.max_subscribers:
+          self.send_response(client, 503, "Too many event streams")
+          return
+      fields = '","'.join(('t_ms',) + FIELDS)
+      client.sendall(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\n\r\n" +
+                     f'retry: 2000\nevent: fields\ndata: ["{fields}"]\n\n'.encode())
+      client.setblocking(False)
+      self.subscribers[client] = [self.telemetry.seq, b"", 0]
+      # Written by publish_events from now on
+      del self.connections[client]
+
+  def publish_events(self):
+      """Send new telemetry to every event stream without ever blocking"""
+      if not self.subscribers:
+          return
+      now = time.ticks_ms()
+      if time.ticks_diff(now, self.last_publish) < self.events_interval:
+          return
+      self.last_publish = now
+
+      telemetry = self.telemetry
+      end = telemetry.seq
+      oldest = telemetry.oldest()
+      batches = {}
+      for sock, state in list(self.subscribers.items()):
+          start = state[0]
+          if start < oldest:
+              state[2] += oldest - start
+              start = oldest
+          if state[1]:
+              # Previous batch is still queued: a slow client loses these frames
+              state[2] += end - start
+          elif start < end:
+              batch = batches.get(start)
+              if batch is None:
+                  batch = f"id: {end}\ndata: {telemetry.format(start, end)}\n\n".encode()
+                  batches[start] = batch
+              state[1] = batch
+          state[0] = end
+          self.flush_events(sock, state)
+
+  def flush_events(self, sock, state):
+      """Write as much of a stream's queued batch as the socket accepts"""
+      if not state[1]:
+          return
       try:
-          client.send(response.encode())
-      except:
-          pass
-
-  def send_error_response(self, client, code, message):
-      """Send error response"""
-      response = f"HTTP/1.1 {code} Error\r\n"
-      response += "Content-Type: text/plain\r\n\r\n"
-      response += message
+          sent = sock.send(state[1])
+          state[1] = state[1][sent:]
+          metrics.bytes_sent.inc(sent)
+      except OSError as e:
+          if e.args[0] != errno.EAGAIN:
+              self.close_connection(sock)
+
+  def check_subscriber(self, sock):
+      """An event stream only becomes readable when the viewer goes away"""
       try:
-          client.send(response.encode())
-      except:
-          pass
+          if sock.recv(64):
+              return
+      except OSError as e:
+          if e.args[0] == errno.EAGAIN:
+              return
+      _log.info('Event stream closed, %d frames dropped', self.subscribers[sock][2])
+      self.close_connection(sock)
+
+  def handle_metrics(self, client, request):
+      """Serve counters and histograms in the Prometheus text format"""
+      self.send_response(client, 200, metrics.registry.render(),
+                         "text/plain; version=0.0.4")
+
+  def handle_boot(self, client, request):
+      """Serve the boot timeline: [[phase, us since start, us for the phase]]"""
+      self.send_response(client, 200, json.dumps(boot_timeline.timeline()), "application/json")
 
   def stop(self):
-      """Stop the web server"""
-      if self.server_socket:
-          self.server_socket.close()
-          self.server_socket = None
\ No newline at end of file
+      """Stop the web server and close any event streams"""
+      for sock in list(self.subscribers):
+          self.close_connection(sock)
+      super().stop()
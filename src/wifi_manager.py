@@ -1,23 +1,95 @@
 # wifimngr.py
+import time
 import network
+import log
 from web_server import WebServer
+from profile_store import ProfileStore
+
+# Network states, in the order a normal bring-up passes through them
+DOWN = 'down'
+STARTING = 'starting'
+AP_UP = 'ap_up'
+STA_CONNECTING = 'sta_connecting'
+STA_UP = 'sta_up'
+FAILED = 'failed'
+
+# Station statuses that end a connect attempt; the ESP32 port's names
+STA_ERRORS = (network.STAT_WRONG_PASSWORD, network.STAT_NO_AP_FOUND, network.STAT_ASSOC_FAIL,
+              network.STAT_BEACON_TIMEOUT, network.STAT_HANDSHAKE_TIMEOUT)
+
+_log = log.get_logger('wifi')
 
 class WiFiManager:
+  """Brings the network up without blocking the caller
+
+  start() and connect_sta() only ask the radio to do something; poll(),
+  called from the main loop, notices when it has happened or taken too
+  long and moves to the next state. Callbacks registered with on_change()
+  are called as callback(old, new) on every transition, so the web server
+  and control loop can run from boot and react once the network is ready.
+
+  With keep_sta() the access point stays up while the station joins a
+  known network in the background, retrying with exponential backoff
+  whenever the attempt fails or the link drops. Either way the UI is
+  served over the AP throughout.
+  """
   def __init__(self, network_config):
       """Initialize WiFi manager with network configuration"""
       self.ap_config = network_config['AP']
       self.sta_config = network_config['STA']
       self.server_config = network_config['SERVER']
-      
+
       # Initialize network interfaces
       self.wlan_ap = network.WLAN(network.AP_IF)
       self.wlan_sta = network.WLAN(network.STA_IF)
-      
+
       # Initialize web server
       self.web_server = WebServer(self.server_config)
+      self.udp_telemetry = None
+      self.profiles = None
+
+      self.state = DOWN
+      self.since = time.ticks_ms()
+      self.callbacks = []
+      self.ap_ip = None
+      self.ap_timeout = self.ap_config.get('start_timeout_ms', 5000)
+      self.sta_timeout = self.sta_config.get('connect_timeout_ms', 15000)
 
-  def init_ap(self):
-      """Initialize Access Point"""
+      # Background station connect (keep_sta)
+      self.sta_wanted = None
+      self.sta_ssid = None
+      self.sta_attempt = 0
+      self.retry_min = self.sta_config.get('retry_min_ms', 2000)
+      self.retry_max = self.sta_config.get('retry_max_ms', 60000)
+      self.retry_delay = self.retry_min
+      self.retry_at = 0
+
+      # Telemetry link choice: host on each link, checked every second
+      self.telemetry_hosts = None
+      self.telemetry_link = None
+      self.min_rssi = self.sta_config.get('min_rssi', -75)
+      self.route_at = 0
+      self.route_errors = 0
+
+  def on_change(self, callback):
+      """Call callback(old_state, new_state) on every transition"""
+      self.callbacks.append(callback)
+
+  def set_state(self, state):
+      old = self.state
+      if state == old:
+          return
+      self.state = state
+      self.since = time.ticks_ms()
+      _log.info('%s -> %s', old, state)
+      for callback in self.callbacks:
+          try:
+              callback(old, state)
+          except Exception as e:
+              _log.error('State callback failed: %s', e)
+
+  def start(self):
+      """Begin bringing the access point up; returns at once"""
       self.wlan_ap.active(True)
       self.wlan_ap.config(
           essid=self.ap_config['ssid'],
@@ -25,20 +97,152 @@ class WiFiManager:
           authmode=self.ap_config['authmode'],
           max_clients=self.ap_config['max_clients']
       )
-      
-      # Wait for AP to be active
-      while not self.wlan_ap.active():
-          pass
-      
-      ap_ip = self.wlan_ap.ifconfig()[0]
-      
-      print('\n=== WiFi Access Point Created ===')
-      print(f'1. Connect to WiFi network: "{self.ap_config["ssid"]}"')
-      print(f'2. Use password: "{self.ap_config["password"]}"')
-      print(f'3. Open browser and go to: http://{ap_ip}')
-      print('================================\n')
-      
-      return ap_ip
+      self.set_state(STARTING)
+
+  def read_profiles(self):
+      """Saved networks, loaded from flash on first use"""
+      if self.profiles is None:
+          self.profiles = ProfileStore(self.sta_config.get('profiles_file', 'wifi.dat'))
+      return self.profiles
+
+  def connect_sta(self, ssid, password=None, bssid=None):
+      """Begin joining a network as a station; returns at once
+
+      Without a password, the one saved for ssid is used.
+      """
+      if password is None:
+          password = self.read_profiles().get(ssid) or None
+      self.wlan_sta.active(True)
+      self.wlan_sta.connect(ssid, password, bssid=bssid)
+      self.sta_ssid = ssid
+      self.set_state(STA_CONNECTING)
+
+  def keep_sta(self, ssid=None):
+      """Join ssid, or else each saved network in turn, in the background
+
+      The AP is left up. Failed attempts and dropped links are retried
+      after retry_min_ms, doubling up to retry_max_ms; a connection
+      resets the delay.
+      """
+      self.sta_wanted = ssid or self.sta_config.get('ssid') or ''
+      self.retry_delay = self.retry_min
+      self.retry_at = time.ticks_ms()
+
+  def sta_candidates(self):
+      if self.sta_wanted:
+          return [self.sta_wanted]
+      return [ssid for ssid, _ in self.read_profiles().items()]
+
+  def retry_sta(self):
+      """Start the next background attempt if one is due"""
+      now = time.ticks_ms()
+      if time.ticks_diff(now, self.retry_at) < 0:
+          return
+      candidates = self.sta_candidates()
+      if not candidates:
+          self.retry_at = time.ticks_add(now, self.retry_max)
+          return
+      ssid = candidates[self.sta_attempt % len(candidates)]
+      self.sta_attempt += 1
+      try:
+          self.connect_sta(ssid)
+      except OSError as e:
+          _log.warning('Station connect to %s failed: %s', ssid, e)
+          self.sta_lost()
+
+  def sta_lost(self):
+      """Schedule the next background attempt with a longer delay"""
+      if self.sta_wanted is None:
+          return
+      self.retry_at = time.ticks_add(time.ticks_ms(), self.retry_delay)
+      _log.info('Next station attempt in %d ms', self.retry_delay)
+      self.retry_delay = min(self.retry_delay * 2, self.retry_max)
+
+  def poll(self):
+      """Advance the state machine; cheap enough to call every loop pass"""
+      state = self.state
+      elapsed = time.ticks_diff(time.ticks_ms(), self.since)
+      if state == STARTING:
+          if self.wlan_ap.active():
+              self.ap_ip = self.wlan_ap.ifconfig()[0]
+              self.set_state(AP_UP)
+          elif elapsed > self.ap_timeout:
+              _log.error('Access point did not start within %d ms', self.ap_timeout)
+              self.set_state(FAILED)
+      elif state == STA_CONNECTING:
+          status = self.wlan_sta.status()
+          if status == network.STAT_GOT_IP:
+              self.retry_delay = self.retry_min
+              self.set_state(STA_UP)
+          elif status in STA_ERRORS or elapsed > self.sta_timeout:
+              _log.warning('Station connect failed, status %d', status)
+              self.wlan_sta.disconnect()
+              self.sta_lost()
+              self.set_state(AP_UP if self.wlan_ap.active() else FAILED)
+      elif state == STA_UP and not self.wlan_sta.isconnected():
+          _log.warning('Station link lost')
+          self.sta_lost()
+          self.set_state(AP_UP if self.wlan_ap.active() else FAILED)
+      elif self.sta_wanted is not None and (state == AP_UP or state == FAILED):
+          self.retry_sta()
+      if self.telemetry_hosts:
+          self.route_telemetry()
+      return self.state
+
+  def ready(self):
+      """True once clients can reach the robot over some interface"""
+      return self.state == AP_UP or self.state == STA_UP
+
+  def init_ap(self, timeout_ms=None):
+      """Bring the access point up and wait for it; returns its IP or None"""
+      self.start()
+      deadline = time.ticks_add(time.ticks_ms(), timeout_ms or self.ap_timeout)
+      while self.poll() == STARTING:
+          if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+              break
+          time.sleep_ms(10)
+      return self.ap_ip
+
+  def start_udp_telemetry(self, host, port=5005, sta_host=None):
+      """Stream binary balance-loop records to a host over UDP
+
+      With sta_host, the receiver is also reachable over the station link,
+      and records go there while that link is up, strong enough and not
+      failing sends; otherwise to host over the AP.
+      """
+      from udp_telemetry import UDPTelemetry
+      self.udp_telemetry = UDPTelemetry(host, port)
+      print(f'UDP telemetry to {host}:{port}')
+      if sta_host:
+          import socket
+          self.telemetry_hosts = {
+              'ap': self.udp_telemetry.addr,
+              'sta': socket.getaddrinfo(sta_host, port)[0][-1],
+          }
+          self.telemetry_link = 'ap'
+      return self.udp_telemetry
+
+  def best_link(self):
+      """'sta' while the station link is usable for telemetry, else 'ap'"""
+      if self.state != STA_UP:
+          return 'ap'
+      errors = self.udp_telemetry.errors - self.route_errors
+      if errors or self.wlan_sta.status('rssi') < self.min_rssi:
+          return 'ap'
+      return 'sta'
+
+  def route_telemetry(self):
+      """Point telemetry at the better link, at most once a second"""
+      now = time.ticks_ms()
+      if time.ticks_diff(now, self.route_at) < 0 and self.state == STA_UP:
+          return
+      self.route_at = time.ticks_add(now, 1000)
+      link = self.best_link()
+      self.route_errors = self.udp_telemetry.errors
+      if link != self.telemetry_link:
+          _log.info('Telemetry over %s', link)
+          self.telemetry_link = link
+          self.udp_telemetry.addr = self.telemetry_hosts[link]
 
   def start_server(self):
       """Start the web server"""
@@ -46,14 +250,22 @@ class WiFiManager:
 
   def stop(self):
       """Stop WiFi manager and web server"""
+      if self.udp_telemetry:
+          try:
+              self.udp_telemetry.close()
+          except:
+              pass
+          self.udp_telemetry = None
+
       try:
           self.web_server.stop()
           print("Web server stopped")
       except:
           pass
-      
+
       try:
           self.wlan_ap.active(False)
           print("WiFi AP disabled")
       except:
-          pass
\ No newline at end of file
+          pass
+      self.set_state(DOWN)